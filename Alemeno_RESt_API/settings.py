@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'loans.middleware.ThresholdGZipMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,6 +66,43 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Deployment profile. "full" (default) serves the admin and static files;
+# "api" is for workers that only serve /api/ and skips the session, CSRF,
+# auth, messages, clickjacking and static file layers none of the loans
+# endpoints use.
+DJANGO_PROFILE = os.getenv('DJANGO_PROFILE', 'full')
+if DJANGO_PROFILE == 'api':
+    INSTALLED_APPS = [
+        app for app in INSTALLED_APPS
+        if app not in ('django.contrib.admin', 'django.contrib.sessions',
+                       'django.contrib.messages', 'django.contrib.staticfiles')
+    ]
+    MIDDLEWARE = [
+        'corsheaders.middleware.CorsMiddleware',
+        'django.middleware.security.SecurityMiddleware',
+        'loans.middleware.ThresholdGZipMiddleware',
+        'django.middleware.common.CommonMiddleware',
+    ]
+
+# Responses smaller than this are sent uncompressed even to gzip clients
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
+
+# Concurrent identical eligibility checks share one computation: 'off',
+# 'local' (per process) or 'cache' (across processes through CACHES)
+REQUEST_COALESCING = os.getenv('REQUEST_COALESCING', 'local')
+# Seconds a 'cache' follower waits for the leader before computing itself
+REQUEST_COALESCING_TIMEOUT = float(os.getenv('REQUEST_COALESCING_TIMEOUT', '2.0'))
+
+# Shared cache for cross-process coalescing; the default local-memory cache
+# is per process
+if os.getenv('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+
 ROOT_URLCONF = 'Alemeno_RESt_API.urls'
 
 TEMPLATES = [
@@ -112,6 +151,24 @@ if not os.getenv('PGPASSWORD'):
         }
     }
 
+# Customer sharding: a customer and all of its loans live on
+# SHARD_DATABASES[customer_id % DB_SHARD_COUNT], with 'default' as shard 0.
+# Shard N is a copy of the default connection with its own database name
+# (PGDATABASE_SHARD_N, default "<name>_shard_N") and optionally its own host
+# (PGHOST_SHARD_N); with SQLite it is db_shard_N.sqlite3.
+DB_SHARD_COUNT = int(os.getenv('DB_SHARD_COUNT', '1'))
+for shard in range(1, DB_SHARD_COUNT):
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+        shard_settings = {'NAME': BASE_DIR / f'db_shard_{shard}.sqlite3'}
+    else:
+        shard_settings = {
+            'NAME': os.getenv(f'PGDATABASE_SHARD_{shard}', f"{DATABASES['default']['NAME']}_shard_{shard}"),
+            'HOST': os.getenv(f'PGHOST_SHARD_{shard}', DATABASES['default']['HOST']),
+        }
+    DATABASES[f'shard_{shard}'] = {**DATABASES['default'], **shard_settings}
+SHARD_DATABASES = ['default'] + [f'shard_{shard}' for shard in range(1, DB_SHARD_COUNT)]
+DATABASE_ROUTERS = ['loans.sharding.CustomerShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -170,6 +227,13 @@ REST_FRAMEWORK = {
     ],
 }
 
+if DJANGO_PROFILE == 'api':
+    # No sessions to authenticate against; skip building an AnonymousUser per request
+    REST_FRAMEWORK.update({
+        'DEFAULT_AUTHENTICATION_CLASSES': [],
+        'UNAUTHENTICATED_USER': None,
+    })
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -184,4 +248,70 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = 'UTC'
\ No newline at end of file
+CELERY_TIMEZONE = 'UTC'
+
+# Bulk work gets its own queues and workers so it never delays the short
+# interactive tasks (deferred loan decisions) on the default queue. Run one
+# worker per queue, see docker-compose.yml.
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    'loans.tasks.ingest_customer_data': {'queue': 'ingestion'},
+    'loans.tasks.ingest_loan_data': {'queue': 'ingestion'},
+    'loans.tasks.ingest_all_data': {'queue': 'ingestion'},
+    'loans.tasks.process_ingestion_job': {'queue': 'ingestion'},
+    # Nightly whole-book jobs
+    'loans.tasks.post_monthly_emis': {'queue': 'scoring'},
+    'loans.tasks.archive_loans': {'queue': 'scoring'},
+    'loans.tasks.rescore_portfolio_snapshot': {'queue': 'scoring'},
+    'loans.tasks.rescore_customer_range': {'queue': 'scoring'},
+    'loans.tasks.drain_outbox_events': {'queue': 'side_effects'},
+}
+# Reserve one message per worker process at a time, so a long task never
+# holds back messages another process could start; the interactive worker
+# raises this with --prefetch-multiplier
+CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', '1'))
+# Limits for tasks that set none; bulk tasks set their own
+CELERY_TASK_SOFT_TIME_LIMIT = 240
+CELERY_TASK_TIME_LIMIT = 300
+# Unacknowledged acks_late messages are redelivered after this many seconds,
+# so it must exceed the longest acks_late task's time limit (ingestion, 1h)
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 7200}
+
+# Uploaded ingestion files are streamed here before a worker picks them up
+INGESTION_UPLOAD_DIR = os.getenv('INGESTION_UPLOAD_DIR', str(BASE_DIR / 'uploads'))
+INGESTION_CHUNK_SIZE = int(os.getenv('INGESTION_CHUNK_SIZE', '5000'))
+# Parsed spreadsheets are cached here as Arrow files; set empty to disable
+INGESTION_CACHE_DIR = os.getenv('INGESTION_CACHE_DIR', str(BASE_DIR / '.ingest_cache'))
+# Least recently used cached frames are deleted beyond this size
+INGESTION_CACHE_MAX_BYTES = int(os.getenv('INGESTION_CACHE_MAX_BYTES', str(1024 ** 3)))
+
+# Periodic tasks (run with `celery -A Alemeno_RESt_API beat`)
+CELERY_BEAT_SCHEDULE = {
+    # Nightly; posting is idempotent per billing month, so only the first
+    # run of each month posts anything
+    'post-monthly-emis': {
+        'task': 'loans.tasks.post_monthly_emis',
+        'schedule': crontab(hour=1, minute=0),
+    },
+    # Safety net for async loan requests whose enqueue message was lost
+    'process-loan-requests': {
+        'task': 'loans.tasks.process_loan_requests',
+        'schedule': 30.0,
+    },
+    # Loans that ended before the current year move to loans_archive; only the
+    # first run of each year finds anything to move
+    'archive-matured-loans': {
+        'task': 'loans.tasks.archive_loans',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    # Dated credit score snapshot of the whole book, scored range by range
+    'rescore-portfolio': {
+        'task': 'loans.tasks.rescore_portfolio_snapshot',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    # Side effects of loan creation (rollups, notifications) run from the outbox
+    'drain-outbox': {
+        'task': 'loans.tasks.drain_outbox_events',
+        'schedule': 5.0,
+    },
+}
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.apps import apps
 from django.contrib import admin
 from django.urls import path, include
 
@@ -24,6 +25,9 @@ def redirect_to_api(request):
 
 urlpatterns = [
     path('', redirect_to_api),
-    path('admin/', admin.site.urls),
     path('api/', include('loans.urls')),
 ]
+
+# Absent from the "api" deployment profile
+if apps.is_installed('django.contrib.admin'):
+    urlpatterns.append(path('admin/', admin.site.urls))
@@ -1,14 +1,99 @@
 from django.contrib import admin
-from .models import Customer, Loan
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .bulk import estimated_row_count
+from .models import Customer, IngestionJob, Loan
+from .portfolio import RATE_BANDS
+from .sharding import allocate_ids
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that trusts the planner's row estimate for large unfiltered tables"""
+    ESTIMATE_THRESHOLD = 100000
+    
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > self.ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class InterestRateBandFilter(admin.SimpleListFilter):
+    """Rate bands as range filters on the indexed interest_rate, instead of a DISTINCT scan"""
+    title = 'interest rate'
+    parameter_name = 'rate_band'
+    
+    def lookups(self, request, model_admin):
+        return [(label, label.replace('_', ' ')) for _, label in RATE_BANDS]
+    
+    def queryset(self, request, queryset):
+        lower = None
+        for upper, label in RATE_BANDS:
+            if label == self.value():
+                condition = Q(interest_rate__gte=lower) if lower is not None else Q()
+                if upper is not None:
+                    condition &= Q(interest_rate__lt=upper)
+                return queryset.filter(condition)
+            lower = upper
+        return queryset
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """Admin for customers and their loans, which are stored on the shard of their customer
+
+    Changelists, search and change forms only query the default database, so
+    with DB_SHARD_COUNT > 1 they show shard 0 alone. New rows are still saved
+    on their own shard.
+    """
+    
+    def save_model(self, request, obj, form, change):
+        # A new row takes its id from the shared sequence, which also picks
+        # the shard the router saves it to
+        if not change:
+            obj.pk, = allocate_ids(type(obj))
+        super().save_model(request, obj, form, change)
+
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ShardedModelAdmin):
     list_display = ['customer_id', 'first_name', 'last_name', 'phone_number', 'monthly_salary', 'approved_limit']
-    search_fields = ['first_name', 'last_name', 'phone_number']
+    search_fields = ['first_name', 'last_name']
+    search_help_text = 'Name, phone number or customer ID'
     list_filter = ['approved_limit']
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Numbers match phone_number or customer_id exactly, so they hit an index"""
+        if search_term.strip().isdigit():
+            number = int(search_term.strip())
+            return queryset.filter(Q(phone_number=number) | Q(customer_id=number)), False
+        return super().get_search_results(request, queryset, search_term)
 
 @admin.register(Loan)
-class LoanAdmin(admin.ModelAdmin):
+class LoanAdmin(ShardedModelAdmin):
     list_display = ['loan_id', 'customer', 'loan_amount', 'tenure', 'interest_rate', 'start_date', 'end_date']
-    search_fields = ['customer__first_name', 'customer__last_name']
-    list_filter = ['start_date', 'end_date', 'interest_rate']
\ No newline at end of file
+    list_select_related = ['customer']
+    list_filter = ['start_date', 'end_date', InterestRateBandFilter]
+    autocomplete_fields = ['customer']
+    search_fields = ['loan_id', 'customer__customer_id']
+    search_help_text = 'Loan ID or customer ID'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Exact id matches only, so searches use the primary key and customer indexes"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if not search_term.isdigit():
+            return queryset.none(), False
+        return queryset.filter(Q(loan_id=int(search_term)) | Q(customer_id=int(search_term))), False
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['job_id', 'kind', 'status', 'rows_done', 'rows_total', 'rows_rejected', 'created_at']
+    list_filter = ['kind', 'status']
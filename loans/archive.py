@@ -0,0 +1,82 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+
+from .models import ArchivedLoan, Loan, LoanHistory
+
+
+ARCHIVE_BATCH_SIZE = 5000
+
+ARCHIVED_FIELDS = [
+    'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate', 'monthly_repayment',
+    'emis_paid_on_time', 'start_date', 'end_date', 'last_emi_posted_month',
+]
+
+
+def archive_cutoff(today=None):
+    """Latest end date cutoff for archiving: the first day of the current year"""
+    today = today or date.today()
+    return date(today.year, 1, 1)
+
+
+def archive_matured_loans(before=None, batch_size=ARCHIVE_BATCH_SIZE, using='default'):
+    """Move loans that ended before ``before`` into loans_archive, returns the number moved
+
+    Each batch is copied to the archive, added to the customers' LoanHistory
+    totals and deleted from the loans table in one transaction, so a loan is
+    counted exactly once by the credit score at any point. ``before``
+    defaults to, and may not be later than, the start of the current year:
+    a loan that ended before then also started before then, so archiving it
+    never changes a customer's current-year loan count.
+    """
+    cutoff = archive_cutoff()
+    before = before or cutoff
+    if before > cutoff:
+        raise ValueError(f'Loans can only be archived if they ended before {cutoff}')
+
+    matured = Loan.objects.using(using).filter(end_date__lt=before).order_by('loan_id')
+    archived_count = 0
+    last_loan_id = 0
+    while True:
+        with transaction.atomic(using=using):
+            loans = list(matured.filter(loan_id__gt=last_loan_id).select_for_update()[:batch_size])
+            if not loans:
+                break
+            ArchivedLoan.objects.using(using).bulk_create([
+                ArchivedLoan(**{field: getattr(loan, field) for field in ARCHIVED_FIELDS}) for loan in loans
+            ])
+            add_to_history(loans, using=using)
+            last_loan_id = loans[-1].loan_id
+            # Only the loans copied above; one committed into their id range since is left for the next batch
+            Loan.objects.using(using).filter(loan_id__in=[loan.loan_id for loan in loans]).delete()
+        archived_count += len(loans)
+        if len(loans) < batch_size:
+            break
+    return archived_count
+
+
+def add_to_history(loans, using='default'):
+    """Add archived loans to their customers' LoanHistory totals"""
+    totals = defaultdict(lambda: {'total_loans': 0, 'loans_sum': Decimal('0'), 'paid_on_time': 0})
+    for loan in loans:
+        total = totals[loan.customer_id]
+        total['total_loans'] += 1
+        total['loans_sum'] += loan.loan_amount
+        # Same rule as loan_stat_aggregates(): emis_paid_on_time >= tenure * 0.9
+        if loan.emis_paid_on_time * 10 >= loan.tenure * 9:
+            total['paid_on_time'] += 1
+
+    histories = LoanHistory.objects.using(using).select_for_update().in_bulk(list(totals))
+    created = []
+    for customer_id, total in totals.items():
+        history = histories.get(customer_id)
+        if history is None:
+            created.append(LoanHistory(customer_id=customer_id, **total))
+            continue
+        history.total_loans += total['total_loans']
+        history.loans_sum += total['loans_sum']
+        history.paid_on_time += total['paid_on_time']
+    LoanHistory.objects.using(using).bulk_create(created)
+    LoanHistory.objects.using(using).bulk_update(histories.values(), ['total_loans', 'loans_sum', 'paid_on_time'])
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+
+from .models import Loan
+from .portfolio import month_start
+
+
+EMI_POSTING_BATCH_SIZE = 10000
+
+
+def post_emis(billing_month=None, batch_size=EMI_POSTING_BATCH_SIZE, using='default'):
+    """Post one EMI for every loan due in the billing month, returns the number posted
+
+    Loans are updated with set-based UPDATEs over consecutive loan_id ranges,
+    each committed on its own so no lock is held for longer than one batch.
+    A loan records the month it was last posted for, which makes re-running
+    the job for the same month (or resuming after a failure) a no-op for
+    loans already posted.
+    """
+    billing_month = month_start(billing_month or date.today())
+    bounds = Loan.objects.using(using).aggregate(low=Min('loan_id'), high=Max('loan_id'))
+    if bounds['low'] is None:
+        return 0
+
+    due = Loan.objects.using(using).filter(
+        Q(last_emi_posted_month__isnull=True) | Q(last_emi_posted_month__lt=billing_month),
+        start_date__lt=billing_month,
+        end_date__gte=billing_month,
+        emis_paid_on_time__lt=F('tenure'),
+    )
+
+    posted = 0
+    for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+        with transaction.atomic(using=using):
+            posted += due.filter(loan_id__gte=low, loan_id__lt=low + batch_size).update(
+                emis_paid_on_time=F('emis_paid_on_time') + 1,
+                last_emi_posted_month=billing_month,
+            )
+    return posted
@@ -0,0 +1,105 @@
+import csv
+import io
+
+from django.core.management.color import no_style
+from django.db import connections
+from django.db.models import Max
+
+from .models import ArchivedLoan, Loan
+
+
+def copy_rows(cursor, table, columns, rows):
+    """Stream rows into a table with COPY FROM STDIN (PostgreSQL only)"""
+    connection = cursor.db
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+    cursor.copy_expert(
+        f"COPY {connection.ops.quote_name(table)} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+
+def insert_rows(cursor, table, columns, rows):
+    """Insert rows with a single executemany, bypassing model instances"""
+    connection = cursor.db
+    column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    cursor.executemany(
+        f"INSERT INTO {connection.ops.quote_name(table)} ({column_list}) VALUES ({placeholders})",
+        rows
+    )
+
+
+def write_rows(table, columns, rows, using='default'):
+    """Write rows in bulk using the fastest path the backend supports"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            copy_rows(cursor, table, columns, rows)
+        else:
+            insert_rows(cursor, table, columns, rows)
+
+
+# Tables whose rows keep ids handed out by another model's sequence
+ID_SHARING_MODELS = {
+    Loan: [ArchivedLoan],  # archived loans keep their loan_id
+}
+
+
+def reset_sequences(models, using='default'):
+    """Move primary key sequences past rows inserted with explicit ids, never lowering them
+
+    On PostgreSQL a sequence is moved past the highest id of its table and
+    of the tables in ID_SHARING_MODELS, so new loans never reuse the id of
+    an archived one. SQLite's AUTOINCREMENT already remembers the highest
+    id ever used.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+        return
+
+    with connection.cursor() as cursor:
+        for model in models:
+            highest = max(
+                table.objects.using(using).aggregate(highest=Max('pk'))['highest'] or 0
+                for table in [model, *ID_SHARING_MODELS.get(model, [])]
+            )
+            if not highest:
+                continue
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [model._meta.db_table, model._meta.pk.column])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(f'SELECT setval(%s, GREATEST(%s, last_value)) FROM {sequence}', [sequence, highest])
+
+
+def estimated_row_count(model, using='default'):
+    """Planner's row estimate for a model's table, or None where unavailable
+
+    PostgreSQL only; reads pg_class.reltuples, which autovacuum/ANALYZE keep
+    current, instead of scanning the table for an exact COUNT(*).
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 means the table has never been analyzed
+    return row[0] if row and row[0] >= 0 else None
+
+
+IN_QUERY_CHUNK_SIZE = 500  # stays under SQLite's bound-parameter limit
+
+
+def filter_in_chunks(queryset, field, values, chunk_size=None):
+    """Yield rows of ``queryset`` whose ``field`` is in ``values``, one IN query per chunk"""
+    chunk_size = chunk_size or IN_QUERY_CHUNK_SIZE
+    values = list(values)
+    for offset in range(0, len(values), chunk_size):
+        yield from queryset.filter(**{f'{field}__in': values[offset:offset + chunk_size]})
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs a function once per key among concurrent callers in this process
+
+    The first caller for a key runs the function; callers arriving while it
+    runs wait for it and get its result, or its exception. Nothing is kept
+    once the call finishes, so later callers run the function again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def cache_single_flight(key, function, timeout, poll_interval=0.01):
+    """SingleFlight across processes through a short lock in the shared cache
+
+    The process that takes the lock runs the function and leaves its result
+    in the cache for ``timeout`` seconds. The others poll for that result for
+    up to ``timeout`` seconds and run the function themselves if the leader
+    fails or is too slow, so a lost lock only costs the duplicate work
+    coalescing would have saved.
+    """
+    lock_key = f'single-flight:lock:{key}'
+    result_key = f'single-flight:result:{key}'
+    if cache.add(lock_key, True, timeout=timeout):
+        # Drop the result of an earlier flight, so waiters only get this one
+        cache.delete(result_key)
+        try:
+            result = function()
+            cache.set(result_key, (result,), timeout=timeout)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        shared = cache.get(result_key)
+        if shared is not None:
+            return shared[0]
+        if cache.get(lock_key) is None:
+            break  # the leader failed without sharing a result
+        time.sleep(poll_interval)
+    return function()
+
+
+_flights = SingleFlight()
+
+
+def coalesce(key, function):
+    """Share one run of ``function`` among concurrent identical requests, per settings.REQUEST_COALESCING
+
+    'off' always runs the function, 'local' coalesces within this process,
+    and 'cache' also coalesces across processes through the shared cache.
+    """
+    mode = settings.REQUEST_COALESCING
+    if mode == 'off':
+        return function()
+    if mode == 'cache':
+        timeout = settings.REQUEST_COALESCING_TIMEOUT
+        return _flights.do(key, lambda: cache_single_flight(key, function, timeout))
+    return _flights.do(key, function)
@@ -0,0 +1,70 @@
+import calendar
+from datetime import date
+
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Greatest, Least, Power
+
+
+def outstanding_principal(loan_amount, interest_rate, tenure, emis_paid):
+    """Principal still owed after emis_paid instalments, in closed form
+
+    B_k = P * ((1 + r)^n - (1 + r)^k) / ((1 + r)^n - 1)
+    """
+    principal = float(loan_amount)
+    rate = float(interest_rate) / 100 / 12  # monthly rate
+    n = tenure
+    k = min(max(emis_paid, 0), n)
+
+    if n <= 0:
+        return 0.0
+    if rate == 0:
+        return principal * (n - k) / n
+
+    growth_n = (1 + rate) ** n
+    return principal * (growth_n - (1 + rate) ** k) / (growth_n - 1)
+
+
+def total_interest_remaining(loan_amount, interest_rate, tenure, emis_paid, monthly_repayment):
+    """Interest left to pay: remaining instalments less the outstanding principal"""
+    remaining = max(tenure - max(emis_paid, 0), 0)
+    balance = outstanding_principal(loan_amount, interest_rate, tenure, emis_paid)
+    return max(float(monthly_repayment) * remaining - balance, 0.0)
+
+
+def add_months(day, months):
+    """Shift a date by whole months, clamping to the last day of the target month"""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_due_date(start_date, tenure, emis_paid):
+    """Due date of the next unpaid instalment, or None once the loan is repaid"""
+    if emis_paid >= tenure:
+        return None
+    return add_months(start_date, max(emis_paid, 0) + 1)
+
+
+def outstanding_principal_expression():
+    """Database expression equivalent of outstanding_principal() for Loan querysets"""
+    principal = Cast('loan_amount', FloatField())
+    rate = Cast('interest_rate', FloatField()) / Value(1200.0)
+    n = Cast('tenure', FloatField())
+    k = Cast(Greatest(Least(F('emis_paid_on_time'), F('tenure')), Value(0)), FloatField())
+    growth_n = Power(Value(1.0) + rate, n)
+    growth_k = Power(Value(1.0) + rate, k)
+
+    return Case(
+        When(tenure__lte=0, then=Value(0.0)),
+        When(interest_rate=0, then=principal * (n - k) / n),
+        default=principal * (growth_n - growth_k) / (growth_n - Value(1.0)),
+        output_field=FloatField(),
+    )
+
+
+def total_interest_remaining_expression():
+    """Database expression equivalent of total_interest_remaining()"""
+    remaining = Cast(Greatest(F('tenure') - Greatest(F('emis_paid_on_time'), Value(0)), Value(0)), FloatField())
+    payments = Cast('monthly_repayment', FloatField()) * remaining
+    return Greatest(payments - outstanding_principal_expression(), Value(0.0), output_field=FloatField())
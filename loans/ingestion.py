@@ -0,0 +1,369 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bulk import copy_rows, filter_in_chunks, reset_sequences
+from .models import ArchivedLoan, Customer, IngestionJob, Loan
+from .portfolio import rebuild_portfolio_rollups
+from .sharding import advance_id_sequence, fan_out, split_frame_by_shard
+
+
+CUSTOMER_FILE = 'customer_data.xlsx'
+LOAN_FILE = 'loan_data.xlsx'
+
+# Bump whenever the column maps or the normalisation below change, so
+# frames cached under the old mapping are no longer picked up
+COLUMN_MAPPING_VERSION = 1
+
+# Spreadsheet headers mapped to model fields. Both the shipped workbook
+# headers and the older snake_case export headers are accepted.
+CUSTOMER_COLUMNS = {
+    'Customer ID': 'customer_id',
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Age': 'age',
+    'Phone Number': 'phone_number',
+    'Monthly Salary': 'monthly_salary',
+    'Approved Limit': 'approved_limit',
+    'Current Debt': 'current_debt',
+}
+LOAN_COLUMNS = {
+    'Customer ID': 'customer_id',
+    'Loan ID': 'loan_id',
+    'Loan Amount': 'loan_amount',
+    'Tenure': 'tenure',
+    'Interest Rate': 'interest_rate',
+    'Monthly payment': 'monthly_repayment',
+    'monthly_repayment (emi)': 'monthly_repayment',
+    'EMIs paid on Time': 'emis_paid_on_time',
+    'EMIs_paid_on_time': 'emis_paid_on_time',
+    'Date of Approval': 'start_date',
+    'End Date': 'end_date',
+}
+
+CUSTOMER_FIELDS = [
+    'customer_id', 'first_name', 'last_name', 'age', 'phone_number',
+    'monthly_salary', 'approved_limit', 'current_debt',
+]
+LOAN_FIELDS = [
+    'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate',
+    'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date',
+]
+
+
+def read_table(file_path):
+    """Read a CSV or Excel file into a frame"""
+    import pandas as pd
+
+    if str(file_path).lower().endswith('.csv'):
+        return pd.read_csv(file_path)
+    return pd.read_excel(file_path)
+
+
+def file_digest(file_path):
+    """SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_frame(kind, file_path, normalize):
+    """Normalized frame for a source file, parsed once and then served from an Arrow cache
+
+    The cache key is the file's content hash plus COLUMN_MAPPING_VERSION.
+    Cached frames are uncompressed Arrow IPC files, which are memory-mapped
+    on read. Set INGESTION_CACHE_DIR to an empty value to disable caching.
+    """
+    cache_dir = settings.INGESTION_CACHE_DIR
+    if not cache_dir:
+        return normalize(read_table(file_path))
+
+    import pyarrow
+    from pyarrow import feather
+
+    cache_path = os.path.join(cache_dir, f'{kind}-{file_digest(file_path)}-v{COLUMN_MAPPING_VERSION}.arrow')
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path)  # mark recently used for prune_cache()
+            return feather.read_table(cache_path, memory_map=True).to_pandas()
+        except (pyarrow.ArrowException, OSError):
+            pass  # evicted by another process while being read
+
+    df = normalize(read_table(file_path))
+    # Write under a temporary name so concurrent readers never see a partial file
+    partial_path = f'{cache_path}.{os.getpid()}.partial'
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        feather.write_feather(df.reset_index(drop=True), partial_path, compression='uncompressed')
+        os.replace(partial_path, cache_path)
+    except (pyarrow.ArrowException, OSError):
+        # Columns Arrow cannot type (e.g. mixed values) just go uncached
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    else:
+        prune_cache(cache_dir, settings.INGESTION_CACHE_MAX_BYTES, keep=cache_path)
+    return df
+
+
+def prune_cache(cache_dir, max_bytes, keep=None):
+    """Delete the least recently used cached frames until the cache fits in ``max_bytes``
+
+    ``keep`` is never deleted, so the frame just written survives even if it
+    alone is over the limit. Returns the number of files deleted.
+    """
+    entries = []
+    with os.scandir(cache_dir) as scan:
+        for entry in scan:
+            if entry.name.endswith('.arrow'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # removed by a concurrent prune
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        else:
+            deleted += 1
+        total -= size
+    return deleted
+
+
+def normalize_customer_frame(df):
+    """Rename customer spreadsheet headers to model fields and fill optional columns"""
+    df = df.rename(columns=CUSTOMER_COLUMNS)
+    if 'current_debt' not in df:
+        df['current_debt'] = 0
+    if 'age' not in df:
+        df['age'] = 25  # Default age when the export does not carry it
+    return df[CUSTOMER_FIELDS]
+
+
+def normalize_loan_frame(df):
+    """Rename loan spreadsheet headers to model fields and parse the dates"""
+    import pandas as pd
+
+    df = df.rename(columns=LOAN_COLUMNS)
+    df['start_date'] = pd.to_datetime(df['start_date']).dt.date
+    df['end_date'] = pd.to_datetime(df['end_date']).dt.date
+    return df[LOAN_FIELDS]
+
+
+def read_customer_frame(file_path=None):
+    """Read the customer spreadsheet into a frame with model field names"""
+    return cached_frame(
+        'customers', file_path or os.path.join(settings.BASE_DIR, CUSTOMER_FILE), normalize_customer_frame
+    )
+
+
+def read_loan_frame(file_path=None):
+    """Read the loan spreadsheet into a frame with model field names"""
+    return cached_frame('loans', file_path or os.path.join(settings.BASE_DIR, LOAN_FILE), normalize_loan_frame)
+
+
+def upsert_customers(df, using=None):
+    """Insert or update customers from a normalized frame, returns (created, updated)
+
+    Each row goes to its customer's shard unless ``using`` names a database.
+    """
+    if using is None:
+        counts = [upsert_customers(part, using=alias) for alias, part in split_frame_by_shard(df)]
+        advance_id_sequence(Customer)
+        return tuple(map(sum, zip(*counts))) if counts else (0, 0)
+
+    if connections[using].vendor == 'postgresql':
+        created, updated, _ = copy_merge(Customer, CUSTOMER_FIELDS, df, using=using)
+        return created, updated
+
+    created_count = 0
+    updated_count = 0
+    with transaction.atomic(using=using):
+        for row in df.to_dict('records'):
+            customer_id = row.pop('customer_id')
+            _, created = Customer.objects.using(using).update_or_create(customer_id=customer_id, defaults=row)
+            if created:
+                created_count += 1
+            else:
+                updated_count += 1
+    return created_count, updated_count
+
+
+def upsert_loans(df, using=None, rebuild_rollups=True):
+    """Insert or update loans from a normalized frame, returns (created, updated, skipped)
+
+    Loans whose customer does not exist are skipped, as are loans already
+    moved to loans_archive. Each row goes to its customer's shard unless
+    ``using`` names a database. The portfolio rollups are rebuilt afterwards
+    unless ``rebuild_rollups`` is False.
+    """
+    if using is None:
+        counts = [
+            upsert_loans(part, using=alias, rebuild_rollups=rebuild_rollups)
+            for alias, part in split_frame_by_shard(df)
+        ]
+        advance_id_sequence(Loan)
+        return tuple(map(sum, zip(*counts))) if counts else (0, 0, 0)
+
+    archived = set(filter_in_chunks(
+        ArchivedLoan.objects.using(using).values_list('loan_id', flat=True), 'loan_id', df['loan_id'].tolist()
+    ))
+    already_archived = df['loan_id'].isin(archived)
+    df = df[~already_archived]
+    archived_count = int(already_archived.sum())
+
+    if connections[using].vendor == 'postgresql':
+        created_count, updated_count, skipped_count = copy_merge(Loan, LOAN_FIELDS, df, using=using, parent=Customer)
+        if rebuild_rollups:
+            rebuild_portfolio_rollups(using=using)
+        return created_count, updated_count, skipped_count + archived_count
+
+    known_customers = set(
+        Customer.objects.using(using)
+        .filter(customer_id__in=df['customer_id'].unique().tolist())
+        .values_list('customer_id', flat=True)
+    )
+    created_count = 0
+    updated_count = 0
+    skipped_count = archived_count
+    with transaction.atomic(using=using):
+        for row in df.to_dict('records'):
+            if row['customer_id'] not in known_customers:
+                skipped_count += 1
+                continue
+            loan_id = row.pop('loan_id')
+            _, created = Loan.objects.using(using).update_or_create(loan_id=loan_id, defaults=row)
+            if created:
+                created_count += 1
+            else:
+                updated_count += 1
+    if rebuild_rollups:
+        rebuild_portfolio_rollups(using=using)
+    return created_count, updated_count, skipped_count
+
+
+def run_ingestion_job(job_id, chunk_size=None, using='default', resume=False):
+    """Ingest a job's uploaded file chunk by chunk, recording progress on the job
+
+    Rows with missing values are rejected, as are loans for unknown
+    customers. Cancellation is checked between chunks; rows already merged
+    stay merged. The uploaded file is removed once the job finishes.
+    ``using`` is the database holding the job; rows go to their shards.
+    With ``resume``, a job left running by a worker that died picks up
+    after its last recorded chunk; merges are upserts, so a chunk merged
+    but not yet recorded is merged again harmlessly.
+    """
+    chunk_size = chunk_size or settings.INGESTION_CHUNK_SIZE
+    jobs = IngestionJob.objects.using(using).filter(job_id=job_id)
+    if jobs.filter(status=IngestionJob.PENDING).update(status=IngestionJob.RUNNING, started_at=timezone.now()):
+        start = 0
+    elif resume and jobs.filter(status=IngestionJob.RUNNING).exists():
+        start = jobs.get().rows_done
+    else:
+        return jobs.get().status
+    job = jobs.get()
+
+    final_status = IngestionJob.COMPLETED
+    error = ''
+    try:
+        if job.kind == IngestionJob.CUSTOMERS:
+            df = read_customer_frame(job.file_path)
+        else:
+            df = read_loan_frame(job.file_path)
+        jobs.update(rows_total=len(df))
+
+        for offset in range(start, len(df), chunk_size):
+            if jobs.filter(cancel_requested=True).exists():
+                final_status = IngestionJob.CANCELLED
+                break
+            chunk = df.iloc[offset:offset + chunk_size]
+            valid = chunk.dropna()
+            if job.kind == IngestionJob.CUSTOMERS:
+                created, updated = upsert_customers(valid)
+                skipped = 0
+            else:
+                created, updated, skipped = upsert_loans(valid, rebuild_rollups=False)
+            jobs.update(
+                rows_done=offset + len(chunk),
+                rows_created=F('rows_created') + created,
+                rows_updated=F('rows_updated') + updated,
+                rows_rejected=F('rows_rejected') + len(chunk) - len(valid) + skipped,
+            )
+    except Exception as e:
+        final_status = IngestionJob.FAILED
+        error = str(e)
+    finally:
+        if job.kind == IngestionJob.LOANS:
+            fan_out(rebuild_portfolio_rollups)
+        jobs.update(status=final_status, error=error, finished_at=timezone.now())
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+    return final_status
+
+
+def copy_merge(model, fields, df, using='default', parent=None):
+    """Load a frame into a staging table with COPY and merge it in one statement
+
+    Rows are merged with INSERT ... ON CONFLICT on the primary key; when the
+    file repeats a key the last row wins. With ``parent`` set, rows whose
+    foreign key has no matching parent row are skipped. Returns
+    (created, updated, skipped).
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    pk = model._meta.pk.column
+    staging = f'{table}_staging'
+    columns = [model._meta.get_field(name).column for name in fields]
+    column_list = ', '.join(qn(column) for column in columns)
+    updates = ', '.join(f'{qn(column)} = EXCLUDED.{qn(column)}' for column in columns if column != pk)
+
+    source = f'{qn(staging)} s'
+    skipped_sql = 'SELECT 0'
+    if parent is not None:
+        fk = model._meta.get_field(parent._meta.model_name).column
+        parent_pk = parent._meta.pk.column
+        source += f' JOIN {qn(parent._meta.db_table)} p ON p.{qn(parent_pk)} = s.{qn(fk)}'
+        skipped_sql = (
+            f'SELECT count(*) FROM {qn(staging)} s WHERE NOT EXISTS '
+            f'(SELECT 1 FROM {qn(parent._meta.db_table)} p WHERE p.{qn(parent_pk)} = s.{qn(fk)})'
+        )
+
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=True, name=None)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
+        cursor.execute(f'ALTER TABLE {qn(staging)} ADD COLUMN source_row bigint')
+        copy_rows(cursor, staging, ['source_row'] + columns, rows)
+
+        cursor.execute(skipped_sql)
+        skipped = cursor.fetchone()[0]
+        cursor.execute(
+            f'WITH merged AS ('
+            f'INSERT INTO {qn(table)} ({column_list}) '
+            f'SELECT DISTINCT ON (s.{qn(pk)}) {", ".join(f"s.{qn(column)}" for column in columns)} '
+            f'FROM {source} ORDER BY s.{qn(pk)}, s.source_row DESC '
+            f'ON CONFLICT ({qn(pk)}) DO UPDATE SET {updates} '
+            f'RETURNING (xmax = 0) AS inserted'
+            f') SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged'
+        )
+        created, updated = cursor.fetchone()
+        # ON COMMIT DROP does not fire when nested in an outer transaction
+        cursor.execute(f'DROP TABLE {qn(staging)}')
+        reset_sequences([model], using=using)
+    return created, updated, skipped
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from datetime import date
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .bulk import filter_in_chunks
+from .finance import add_months
+from .models import Customer, Loan, LoanRequest, OutboxEvent
+from .scoring import credit_score_from_stats, customer_stat_annotations, loan_decision, score_stats
+from .sharding import allocate_ids
+
+
+LOAN_REQUEST_BATCH_SIZE = 1000
+
+
+def process_queued_loan_requests(batch_size=LOAN_REQUEST_BATCH_SIZE, using='default'):
+    """Decide queued loan requests in batches and insert the approved loans in bulk
+
+    Each batch locks its customers and reads their loan aggregates in one
+    query. Requests are then decided serially per customer in arrival order,
+    so the score and EMI check for a request include the loans approved just
+    before it, in this batch or by another worker. Returns the number of
+    requests processed.
+    """
+    processed_count = 0
+    while True:
+        with transaction.atomic(using=using):
+            requests = LoanRequest.objects.using(using).filter(status=LoanRequest.QUEUED).order_by('created_at')
+            if connections[using].features.has_select_for_update_skip_locked:
+                requests = requests.select_for_update(skip_locked=True)
+            requests = list(requests[:batch_size])
+            if not requests:
+                break
+            decide_loan_requests(requests, using=using)
+        processed_count += len(requests)
+        if len(requests) < batch_size:
+            break
+    return processed_count
+
+
+def decide_loan_requests(requests, using='default'):
+    """Decide a batch of queued requests and write the results
+
+    Must run inside the batch's transaction. The batch's customers are
+    locked before their loans are read, so a worker holding a newer request
+    of the same customer waits for this batch to commit and then sees the
+    loans it approved.
+    """
+    today = date.today()
+    by_customer = defaultdict(list)
+    for loan_request in requests:
+        by_customer[loan_request.customer_id].append(loan_request)
+    # Locked in id order, so two batches sharing customers cannot deadlock
+    list(filter_in_chunks(
+        Customer.objects.using(using).select_for_update().order_by('customer_id').values_list('customer_id'),
+        'customer_id', sorted(by_customer)
+    ))
+    customers = filter_in_chunks(
+        Customer.objects.using(using).annotate(**customer_stat_annotations(today)), 'customer_id', by_customer
+    )
+
+    approved = []
+    for customer in customers:
+        stats = score_stats(customer)
+        current_emis = customer.current_emis or 0
+        for loan_request in by_customer[customer.customer_id]:
+            credit_score = credit_score_from_stats(customer.approved_limit, **stats)
+            loan_approved, message, final_interest_rate, monthly_installment = loan_decision(
+                credit_score, current_emis, customer.monthly_salary,
+                loan_request.loan_amount, loan_request.interest_rate, loan_request.tenure
+            )
+            loan_request.status = LoanRequest.APPROVED if loan_approved else LoanRequest.REJECTED
+            loan_request.message = message
+            loan_request.monthly_installment = monthly_installment
+            if not loan_approved:
+                continue
+
+            approved.append((loan_request, Loan(
+                customer=customer,
+                loan_amount=loan_request.loan_amount,
+                tenure=loan_request.tenure,
+                interest_rate=final_interest_rate,
+                monthly_repayment=monthly_installment,
+                start_date=today,
+                end_date=add_months(today, loan_request.tenure),
+            )))
+            # The next request from this customer sees this loan; a new loan
+            # has no EMIs paid, so paid_on_time is unchanged
+            stats['total_loans'] += 1
+            stats['loans_sum'] += loan_request.loan_amount
+            stats['current_year_loans'] += 1
+            current_emis += monthly_installment
+
+    loans = [loan for _, loan in approved]
+    for loan, loan_id in zip(loans, allocate_ids(Loan, len(loans))):
+        loan.loan_id = loan_id
+    if connections[using].features.can_return_rows_from_bulk_insert:
+        Loan.objects.using(using).bulk_create(loans)
+    else:
+        for loan in loans:
+            loan.save(using=using)
+    OutboxEvent.objects.using(using).bulk_create([
+        OutboxEvent(event_type=OutboxEvent.LOAN_CREATED, aggregate_id=loan.loan_id,
+                    payload={'customer_id': loan.customer_id})
+        for loan in loans
+    ])
+
+    now = timezone.now()
+    for loan_request, loan in approved:
+        loan_request.loan = loan
+    for loan_request in requests:
+        loan_request.processed_at = now
+    LoanRequest.objects.using(using).bulk_update(
+        requests, ['status', 'loan', 'message', 'monthly_installment', 'processed_at']
+    )
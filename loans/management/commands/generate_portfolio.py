@@ -0,0 +1,159 @@
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from loans.bulk import reset_sequences, write_rows
+from loans.models import Customer, Loan
+from loans.portfolio import rebuild_portfolio_rollups
+from loans.sharding import is_sharded
+
+
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Divya', 'Farhan', 'Isha', 'Karan', 'Kavya',
+    'Meera', 'Neha', 'Nikhil', 'Pooja', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Sana', 'Vikram',
+]
+LAST_NAMES = [
+    'Agarwal', 'Bose', 'Chatterjee', 'Das', 'Gupta', 'Iyer', 'Joshi', 'Khan', 'Kumar', 'Mehta',
+    'Nair', 'Patel', 'Rao', 'Reddy', 'Sen', 'Shah', 'Sharma', 'Singh', 'Verma', 'Yadav',
+]
+
+# Tenures in months and how often they occur
+TENURES = np.array([6, 12, 18, 24, 36, 48, 60, 84, 120])
+TENURE_WEIGHTS = np.array([0.06, 0.16, 0.10, 0.18, 0.18, 0.10, 0.12, 0.06, 0.04])
+
+CUSTOMER_FIELDS = [
+    'customer_id', 'first_name', 'last_name', 'age', 'phone_number',
+    'monthly_salary', 'approved_limit', 'current_debt',
+]
+LOAN_FIELDS = [
+    'loan_id', 'customer_id', 'loan_amount', 'tenure', 'interest_rate',
+    'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date',
+]
+
+
+def add_months(days, months):
+    """Add whole months to datetime64[D] values, clamping to the month's last day"""
+    month_start = days.astype('datetime64[M]')
+    day_offset = (days - month_start.astype('datetime64[D]')).astype(int)
+    target = month_start + months
+    last_day = ((target + 1).astype('datetime64[D]') - target.astype('datetime64[D]')).astype(int) - 1
+    return target.astype('datetime64[D]') + np.minimum(day_offset, last_day)
+
+
+def monthly_installments(principal, annual_rate, tenure):
+    """Vectorised version of the EMI formula used by the API"""
+    rate = annual_rate / 100 / 12
+    growth = (1 + rate) ** tenure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = np.where(rate == 0, principal / tenure, principal * rate * growth / (growth - 1))
+    return np.round(emi, 2)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic customer and loan portfolio for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Number of customers to generate')
+        parser.add_argument('--loans', type=int, default=5000, help='Number of loans to generate')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible output')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows written per batch')
+        parser.add_argument('--database', default='default', help='Database alias to write to')
+
+    def handle(self, *args, **options):
+        customers = options['customers']
+        loans = options['loans']
+        batch_size = options['batch_size']
+        using = options['database']
+
+        if loans and not customers:
+            raise CommandError('Loans are attached to generated customers, so --customers must be > 0')
+        if batch_size <= 0:
+            raise CommandError('--batch-size must be positive')
+        if is_sharded():
+            # Rows are written with the table's own ids to one database, so
+            # most customers would not be on the shard their id points to
+            raise CommandError('Synthetic portfolios can only be generated with DB_SHARD_COUNT=1')
+
+        rng = np.random.default_rng(options['seed'])
+        first_customer_id = (Customer.objects.using(using).aggregate(m=Max('customer_id'))['m'] or 0) + 1
+        first_loan_id = (Loan.objects.using(using).aggregate(m=Max('loan_id'))['m'] or 0) + 1
+
+        started = time.perf_counter()
+        salaries = self.generate_customers(rng, customers, first_customer_id, batch_size, using)
+        self.generate_loans(rng, loans, first_loan_id, first_customer_id, salaries, batch_size, using)
+        reset_sequences([Customer, Loan], using=using)
+        rebuild_portfolio_rollups(using=using)
+        elapsed = time.perf_counter() - started
+
+        total = customers + loans
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {customers} customers and {loans} loans in {elapsed:.1f}s ({rate:,.0f} rows/s)'
+        ))
+
+    def generate_customers(self, rng, count, first_id, batch_size, using):
+        """Write customers in batches and return their salaries for loan sizing"""
+        salaries = np.empty(count)
+        columns = [Customer._meta.get_field(name).column for name in CUSTOMER_FIELDS]
+
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            ids = np.arange(first_id + offset, first_id + offset + size)
+            salary = np.clip(np.round(rng.lognormal(np.log(45000), 0.6, size), -3), 10000, 1000000)
+            approved_limit = np.round(salary * 36 / 100000) * 100000
+            salaries[offset:offset + size] = salary
+
+            rows = zip(
+                ids.tolist(),
+                rng.choice(FIRST_NAMES, size).tolist(),
+                rng.choice(LAST_NAMES, size).tolist(),
+                rng.integers(21, 66, size).tolist(),
+                rng.integers(6000000000, 10000000000, size).tolist(),
+                salary.tolist(),
+                approved_limit.tolist(),
+                [0] * size,
+            )
+            with transaction.atomic(using=using):
+                write_rows(Customer._meta.db_table, columns, rows, using=using)
+            self.stdout.write(f'Customers: {offset + size}/{count}')
+
+        return salaries
+
+    def generate_loans(self, rng, count, first_id, first_customer_id, salaries, batch_size, using):
+        """Write loans in batches against the generated customers"""
+        columns = [Loan._meta.get_field(name).column for name in LOAN_FIELDS]
+        today = np.datetime64(date.today(), 'D')
+
+        for offset in range(0, count, batch_size):
+            size = min(batch_size, count - offset)
+            ids = np.arange(first_id + offset, first_id + offset + size)
+            owner = rng.integers(0, len(salaries), size)
+            tenure = rng.choice(TENURES, size, p=TENURE_WEIGHTS)
+            rate = np.round(np.clip(rng.normal(12, 3, size), 5, 24), 2)
+            amount = np.clip(np.round(salaries[owner] * rng.uniform(1, 12, size), -3), 10000, 10000000)
+            emi = monthly_installments(amount, rate, tenure)
+
+            start = today - rng.integers(0, 3650, size)
+            end = add_months(start, tenure)
+            elapsed_months = (today.astype('datetime64[M]') - start.astype('datetime64[M]')).astype(int)
+            on_time_ratio = rng.beta(8, 1.5, size)
+            emis_paid = np.floor(np.minimum(elapsed_months, tenure) * on_time_ratio).astype(int)
+
+            rows = zip(
+                ids.tolist(),
+                (owner + first_customer_id).tolist(),
+                amount.tolist(),
+                tenure.tolist(),
+                rate.tolist(),
+                emi.tolist(),
+                emis_paid.tolist(),
+                start.astype(str).tolist(),
+                end.astype(str).tolist(),
+            )
+            with transaction.atomic(using=using):
+                write_rows(Loan._meta.db_table, columns, rows, using=using)
+            self.stdout.write(f'Loans: {offset + size}/{count}')
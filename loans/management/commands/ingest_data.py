@@ -1,18 +1,25 @@
 from django.core.management.base import BaseCommand
-from loans.tasks import ingest_all_data
-import pandas as pd
-from loans.models import Customer, Loan
-from datetime import datetime
-import os
-from django.conf import settings
+from loans.ingestion import read_customer_frame, read_loan_frame, upsert_customers, upsert_loans
+from loans.models import Customer
+from loans.sharding import shard_databases
 
 
 class Command(BaseCommand):
     help = 'Ingest customer and loan data from Excel files'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Parse and validate the files without writing to the database'
+        )
+
     def handle(self, *args, **options):
-        # Check if data already exists to avoid duplicate ingestion
-        if Customer.objects.exists():
+        if options['dry_run']:
+            self.validate_files()
+            return
+
+        # Check if data already exists on any shard to avoid duplicate ingestion
+        if any(Customer.objects.using(alias).exists() for alias in shard_databases()):
             self.stdout.write(
                 self.style.WARNING('Data already exists. Skipping ingestion.')
             )
@@ -37,31 +44,7 @@ class Command(BaseCommand):
     def ingest_customer_data(self):
         """Ingest customer data from Excel file"""
         try:
-            customer_file = os.path.join(settings.BASE_DIR, 'customer_data.xlsx')
-            df = pd.read_excel(customer_file)
-            
-            created_count = 0
-            updated_count = 0
-            
-            for _, row in df.iterrows():
-                customer, created = Customer.objects.get_or_create(
-                    customer_id=row['Customer ID'],
-                    defaults={
-                        'first_name': row['First Name'],
-                        'last_name': row['Last Name'],
-                        'phone_number': row['Phone Number'],
-                        'monthly_salary': row['Monthly Salary'],
-                        'approved_limit': row['Approved Limit'],
-                        'current_debt': 0,  # Not in the data
-                        'age': row['Age']
-                    }
-                )
-                
-                if created:
-                    created_count += 1
-                else:
-                    updated_count += 1
-            
+            created_count, updated_count = upsert_customers(read_customer_frame())
             return f"Customer data: Created {created_count}, Updated {updated_count}"
         
         except Exception as e:
@@ -70,44 +53,20 @@ class Command(BaseCommand):
     def ingest_loan_data(self):
         """Ingest loan data from Excel file"""
         try:
-            loan_file = os.path.join(settings.BASE_DIR, 'loan_data.xlsx')
-            df = pd.read_excel(loan_file)
-            
-            created_count = 0
-            updated_count = 0
-            
-            for _, row in df.iterrows():
-                try:
-                    customer = Customer.objects.get(customer_id=row['Customer ID'])
-                    
-                    # Parse dates
-                    start_date = pd.to_datetime(row['Date of Approval']).date()
-                    end_date = pd.to_datetime(row['End Date']).date()
-                    
-                    loan, created = Loan.objects.get_or_create(
-                        loan_id=row['Loan ID'],
-                        defaults={
-                            'customer': customer,
-                            'loan_amount': row['Loan Amount'],
-                            'tenure': row['Tenure'],
-                            'interest_rate': row['Interest Rate'],
-                            'monthly_repayment': row['Monthly payment'],
-                            'emis_paid_on_time': row['EMIs paid on Time'],
-                            'start_date': start_date,
-                            'end_date': end_date
-                        }
-                    )
-                    
-                    if created:
-                        created_count += 1
-                    else:
-                        updated_count += 1
-                        
-                except Customer.DoesNotExist:
-                    self.stdout.write(f"Customer {row['Customer ID']} not found for loan {row['Loan ID']}")
-                    continue
-            
+            created_count, updated_count, skipped_count = upsert_loans(read_loan_frame())
+            if skipped_count:
+                self.stdout.write(f"Skipped {skipped_count} loans with unknown customers")
             return f"Loan data: Created {created_count}, Updated {updated_count}"
         
         except Exception as e:
-            return f"Error ingesting loan data: {str(e)}"
\ No newline at end of file
+            return f"Error ingesting loan data: {str(e)}"
+
+    def validate_files(self):
+        """Report row counts and incomplete rows without ingesting"""
+        for label, read_frame in (('Customer', read_customer_frame), ('Loan', read_loan_frame)):
+            try:
+                df = read_frame()
+                incomplete_count = int(df.isna().any(axis=1).sum())
+                self.stdout.write(f"{label} data: {len(df)} rows, {incomplete_count} with missing values")
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"Error reading {label.lower()} data: {str(e)}"))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+
+
+class ThresholdGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves responses under RESPONSE_COMPRESSION_MIN_BYTES uncompressed
+
+    Small bodies such as eligibility checks are not worth the CPU.
+    Streaming responses have no known length and are always compressed for
+    clients that accept gzip.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+        return super().process_response(request, response)
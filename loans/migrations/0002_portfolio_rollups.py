@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate_band', models.CharField(max_length=20)),
+                ('tenure_band', models.CharField(max_length=20)),
+                ('end_month', models.DateField()),
+                ('loan_count', models.IntegerField(default=0)),
+                ('principal', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('outstanding_principal', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('monthly_emi', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+            ],
+            options={
+                'db_table': 'portfolio_rollups',
+                'constraints': [models.UniqueConstraint(fields=('rate_band', 'tenure_band', 'end_month'), name='unique_portfolio_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_portfolio_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='last_emi_posted_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:55
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_loan_last_emi_posted_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('customers', 'Customers'), ('loans', 'Loans')], max_length=20)),
+                ('file_path', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('rows_total', models.IntegerField(blank=True, null=True)),
+                ('rows_done', models.IntegerField(default=0)),
+                ('rows_created', models.IntegerField(default=0)),
+                ('rows_updated', models.IntegerField(default=0)),
+                ('rows_rejected', models.IntegerField(default=0)),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'ingestion_jobs',
+            },
+        ),
+    ]
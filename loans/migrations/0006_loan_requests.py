@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:04
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_outbox_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanRequest',
+            fields=[
+                ('ticket_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('loan_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('tenure', models.IntegerField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('approved', 'Approved'), ('rejected', 'Rejected')], default='queued', max_length=20)),
+                ('message', models.CharField(blank=True, max_length=200)),
+                ('monthly_installment', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loan_requests', to='loans.customer')),
+                ('loan', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='request', to='loans.loan')),
+            ],
+            options={
+                'db_table': 'loan_requests',
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='loan_request_queued_idx')],
+            },
+        ),
+    ]
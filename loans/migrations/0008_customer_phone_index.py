@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0007_loan_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customer',
+            name='phone_number',
+            field=models.BigIntegerField(db_index=True),
+        ),
+    ]
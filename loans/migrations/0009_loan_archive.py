@@ -0,0 +1,45 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_customer_phone_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanHistory',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='loan_history', serialize=False, to='loans.customer')),
+                ('total_loans', models.IntegerField(default=0)),
+                ('loans_sum', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('paid_on_time', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'loan_history',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('loan_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('loan_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('tenure', models.IntegerField()),
+                ('interest_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('monthly_repayment', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('emis_paid_on_time', models.IntegerField(default=0)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('last_emi_posted_month', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='loans.customer')),
+            ],
+            options={
+                'db_table': 'loans_archive',
+            },
+        ),
+    ]
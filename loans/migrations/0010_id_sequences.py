@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0009_loan_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'id_sequences',
+            },
+        ),
+    ]
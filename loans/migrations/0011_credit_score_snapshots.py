@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0010_id_sequences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditScoreSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('credit_score', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_score_snapshots', to='loans.customer')),
+            ],
+            options={
+                'db_table': 'credit_score_snapshots',
+                'constraints': [models.UniqueConstraint(fields=('snapshot_date', 'customer'), name='unique_customer_snapshot')],
+            },
+        ),
+    ]
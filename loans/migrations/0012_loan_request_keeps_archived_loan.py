@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0011_credit_score_snapshots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loanrequest',
+            name='loan',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='request', to='loans.loan'),
+        ),
+    ]
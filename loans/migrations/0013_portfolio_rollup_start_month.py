@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0012_loan_request_keeps_archived_loan'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='portfoliorollup',
+            name='unique_portfolio_bucket',
+        ),
+        migrations.AddField(
+            model_name='portfoliorollup',
+            name='start_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='portfoliorollup',
+            constraint=models.UniqueConstraint(fields=('rate_band', 'tenure_band', 'end_month', 'start_month'), name='unique_portfolio_bucket'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import math
+import uuid
 
 
 class Customer(models.Model):
@@ -9,17 +11,21 @@ class Customer(models.Model):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     age = models.IntegerField(validators=[MinValueValidator(18), MaxValueValidator(100)])
-    phone_number = models.BigIntegerField()
+    phone_number = models.BigIntegerField(db_index=True)
     monthly_salary = models.DecimalField(max_digits=12, decimal_places=2)
     approved_limit = models.DecimalField(max_digits=12, decimal_places=2)
     current_debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     
+    @staticmethod
+    def calculate_approved_limit(monthly_salary):
+        """approved_limit = 36 * monthly_salary (rounded to nearest lakh)"""
+        limit = monthly_salary * 36
+        # Round to nearest lakh (100,000)
+        return round(limit / 100000) * 100000
+    
     def save(self, *args, **kwargs):
         if not self.approved_limit:
-            # approved_limit = 36 * monthly_salary (rounded to nearest lakh)
-            limit = self.monthly_salary * 36
-            # Round to nearest lakh (100,000)
-            self.approved_limit = round(limit / 100000) * 100000
+            self.approved_limit = self.calculate_approved_limit(self.monthly_salary)
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -39,6 +45,7 @@ class Loan(models.Model):
     emis_paid_on_time = models.IntegerField(default=0)
     start_date = models.DateField()
     end_date = models.DateField()
+    last_emi_posted_month = models.DateField(null=True, blank=True)  # billing month of the last posted EMI
     
     def calculate_monthly_installment(self):
         """Calculate monthly installment using compound interest formula"""
@@ -63,4 +70,202 @@ class Loan(models.Model):
         return f"Loan {self.loan_id} - {self.customer}"
     
     class Meta:
-        db_table = 'loans'
\ No newline at end of file
+        db_table = 'loans'
+        # Back the admin's date and rate filters on large tables
+        indexes = [
+            models.Index(fields=['start_date'], name='loan_start_date_idx'),
+            models.Index(fields=['end_date'], name='loan_end_date_idx'),
+            models.Index(fields=['interest_rate'], name='loan_interest_rate_idx'),
+        ]
+
+
+class ArchivedLoan(models.Model):
+    """A matured loan moved out of the loans table by loans.archive.archive_matured_loans"""
+    loan_id = models.IntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='archived_loans')
+    loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    tenure = models.IntegerField()  # in months
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    monthly_repayment = models.DecimalField(max_digits=12, decimal_places=2)
+    emis_paid_on_time = models.IntegerField(default=0)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    last_emi_posted_month = models.DateField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived loan {self.loan_id} - {self.customer}"
+    
+    class Meta:
+        db_table = 'loans_archive'
+
+
+class LoanHistory(models.Model):
+    """Per-customer totals of archived loans, the figures the credit score still needs from them"""
+    customer = models.OneToOneField(Customer, primary_key=True, on_delete=models.CASCADE, related_name='loan_history')
+    total_loans = models.IntegerField(default=0)
+    loans_sum = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    paid_on_time = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Loan history of {self.customer}"
+    
+    class Meta:
+        db_table = 'loan_history'
+
+
+class CreditScoreSnapshot(models.Model):
+    """A customer's credit score as of a date, written by the portfolio rescoring job"""
+    snapshot_date = models.DateField()
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='credit_score_snapshots')
+    credit_score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.customer} scored {self.credit_score} on {self.snapshot_date}"
+    
+    class Meta:
+        db_table = 'credit_score_snapshots'
+        constraints = [
+            models.UniqueConstraint(fields=['snapshot_date', 'customer'], name='unique_customer_snapshot'),
+        ]
+
+
+class PortfolioRollup(models.Model):
+    """Pre-aggregated loan exposure per rate band, tenure band, end month and start month"""
+    rate_band = models.CharField(max_length=20)
+    tenure_band = models.CharField(max_length=20)
+    end_month = models.DateField()
+    # Only set for loans starting in or after the month of the last rebuild,
+    # whose first EMI may not be due yet; null for older loans
+    start_month = models.DateField(null=True, blank=True)
+    loan_count = models.IntegerField(default=0)
+    principal = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    outstanding_principal = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    monthly_emi = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    
+    class Meta:
+        db_table = 'portfolio_rollups'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['rate_band', 'tenure_band', 'end_month', 'start_month'], name='unique_portfolio_bucket'
+            ),
+        ]
+
+
+class IngestionJob(models.Model):
+    """An uploaded spreadsheet queued for ingestion, with its progress"""
+    CUSTOMERS = 'customers'
+    LOANS = 'loans'
+    KIND_CHOICES = [(CUSTOMERS, 'Customers'), (LOANS, 'Loans')]
+    
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'), (RUNNING, 'Running'), (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'), (CANCELLED, 'Cancelled'),
+    ]
+    FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+    
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    file_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    rows_total = models.IntegerField(null=True, blank=True)
+    rows_done = models.IntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_rejected = models.IntegerField(default=0)
+    cancel_requested = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    @property
+    def rows_per_second(self):
+        if not self.started_at:
+            return 0.0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_done / elapsed, 1) if elapsed > 0 else 0.0
+    
+    def __str__(self):
+        return f"Ingestion {self.job_id} ({self.kind}, {self.status})"
+    
+    class Meta:
+        db_table = 'ingestion_jobs'
+
+
+class LoanRequest(models.Model):
+    """A create_loan request accepted in async mode, decided later by a worker"""
+    QUEUED = 'queued'
+    APPROVED = 'approved'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (APPROVED, 'Approved'), (REJECTED, 'Rejected')]
+    
+    ticket_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loan_requests')
+    loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    tenure = models.IntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    # No constraint, so the ticket keeps its loan_id once the loan moves to loans_archive
+    loan = models.OneToOneField(
+        Loan, null=True, blank=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='request'
+    )
+    message = models.CharField(max_length=200, blank=True)
+    monthly_installment = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Loan request {self.ticket_id} ({self.status})"
+    
+    class Meta:
+        db_table = 'loan_requests'
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(status='queued'), name='loan_request_queued_idx'),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """A side effect recorded in the same transaction as the change that caused it
+
+    Drained in batches by loans.outbox.drain_outbox; handlers run at least once.
+    """
+    LOAN_CREATED = 'loan.created'
+    
+    event_type = models.CharField(max_length=50)
+    aggregate_id = models.BigIntegerField()  # id of the row the event is about, e.g. loan_id
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    def __str__(self):
+        return f"{self.event_type} {self.aggregate_id}"
+    
+    class Meta:
+        db_table = 'outbox_events'
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+
+class IdSequence(models.Model):
+    """Next free primary key of a sharded table, so keys stay unique across shards
+
+    Lives on the default database; see loans.sharding.allocate_ids.
+    """
+    name = models.CharField(max_length=100, primary_key=True)  # table name
+    next_value = models.BigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+    
+    class Meta:
+        db_table = 'id_sequences'
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+
+OUTBOX_BATCH_SIZE = 500
+OUTBOX_MAX_ATTEMPTS = 10  # events failing this often are left for manual replay
+OUTBOX_RETENTION = timedelta(days=7)
+
+# event_type -> handlers, registered with @handles
+HANDLERS = defaultdict(list)
+
+
+def handles(event_type):
+    """Register a function to run for every event of ``event_type``
+
+    Handlers are called as ``handler(event, using)`` inside a transaction
+    that also marks the event processed, so database-side effects are applied
+    once; anything external must tolerate redelivery.
+    """
+    def register(handler):
+        HANDLERS[event_type].append(handler)
+        return handler
+    return register
+
+
+def publish(event_type, aggregate_id, payload=None, using='default'):
+    """Record an event; call inside the transaction making the change"""
+    return OutboxEvent.objects.using(using).create(
+        event_type=event_type, aggregate_id=aggregate_id, payload=payload or {}
+    )
+
+
+def pending_events(event_type=None, using='default'):
+    """Events still waiting for their handlers"""
+    events = OutboxEvent.objects.using(using).filter(processed_at__isnull=True, attempts__lt=OUTBOX_MAX_ATTEMPTS)
+    if event_type is not None:
+        events = events.filter(event_type=event_type)
+    return events
+
+
+def drain_outbox(batch_size=OUTBOX_BATCH_SIZE, using='default'):
+    """Run handlers for pending events in id order, one transaction per batch
+
+    Each event gets a savepoint, so a failing handler only rolls back its own
+    event, which stays pending with its attempt count raised. On PostgreSQL
+    concurrent drainers skip each other's locked rows. Returns the number of
+    events processed.
+    """
+    connection = connections[using]
+    processed_count = 0
+    last_id = 0
+    while True:
+        with transaction.atomic(using=using):
+            events = pending_events(using=using).filter(id__gt=last_id).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                events = events.select_for_update(skip_locked=True)
+            events = list(events[:batch_size])
+            if not events:
+                break
+
+            done = []
+            for event in events:
+                try:
+                    with transaction.atomic(using=using):
+                        for handler in HANDLERS[event.event_type]:
+                            handler(event, using=using)
+                except Exception as e:
+                    OutboxEvent.objects.using(using).filter(pk=event.pk).update(
+                        attempts=F('attempts') + 1, last_error=str(e)
+                    )
+                else:
+                    done.append(event.pk)
+            OutboxEvent.objects.using(using).filter(pk__in=done).update(
+                processed_at=timezone.now(), attempts=F('attempts') + 1, last_error=''
+            )
+        processed_count += len(done)
+        last_id = events[-1].pk
+        if len(events) < batch_size:
+            break
+    return processed_count
+
+
+def purge_processed_events(using='default'):
+    """Delete processed events older than OUTBOX_RETENTION"""
+    cutoff = timezone.now() - OUTBOX_RETENTION
+    deleted, _ = OutboxEvent.objects.using(using).filter(processed_at__lt=cutoff).delete()
+    return deleted
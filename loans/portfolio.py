@@ -0,0 +1,181 @@
+from datetime import date
+from decimal import Decimal
+from itertools import chain
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, DateField, F, Sum, Value, When
+from django.db.models.functions import TruncMonth
+
+from .finance import outstanding_principal, outstanding_principal_expression
+from .models import Loan, OutboxEvent, PortfolioRollup
+from .outbox import handles, pending_events
+from .sharding import fan_out
+
+
+# (exclusive upper bound, label); None closes the last band
+RATE_BANDS = [
+    (Decimal('8'), 'below_8'),
+    (Decimal('12'), '8_to_12'),
+    (Decimal('16'), '12_to_16'),
+    (None, '16_and_above'),
+]
+# (inclusive upper bound in months, label)
+TENURE_BANDS = [
+    (12, 'up_to_12'),
+    (24, '13_to_24'),
+    (60, '25_to_60'),
+    (None, 'over_60'),
+]
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def rate_band(interest_rate):
+    for upper, label in RATE_BANDS:
+        if upper is None or Decimal(str(interest_rate)) < upper:
+            return label
+
+
+def tenure_band(tenure):
+    for upper, label in TENURE_BANDS:
+        if upper is None or tenure <= upper:
+            return label
+
+
+def _band_case(field, bands, lookup):
+    whens = [When(**{f'{field}__{lookup}': upper}, then=Value(label)) for upper, label in bands if upper is not None]
+    return Case(*whens, default=Value(bands[-1][1]))
+
+
+def lock_rollups(using='default', exclusive=False):
+    """Lock the rollup table for the rest of the transaction (PostgreSQL only)
+
+    Incremental updates take the shared mode and do not block each other;
+    a rebuild takes the exclusive mode, so it never overlaps an increment.
+    SQLite already allows only one writer at a time.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    mode = 'SHARE ROW EXCLUSIVE' if exclusive else 'ROW EXCLUSIVE'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {connection.ops.quote_name(PortfolioRollup._meta.db_table)} IN {mode} MODE')
+
+
+def record_loan(loan, using='default'):
+    """Add a newly created loan to its rollup bucket; call inside a transaction"""
+    lock_rollups(using=using)
+    bucket, _ = PortfolioRollup.objects.using(using).get_or_create(
+        rate_band=rate_band(loan.interest_rate),
+        tenure_band=tenure_band(loan.tenure),
+        end_month=month_start(loan.end_date),
+        start_month=month_start(loan.start_date),
+    )
+    PortfolioRollup.objects.using(using).filter(pk=bucket.pk).update(
+        loan_count=F('loan_count') + 1,
+        principal=F('principal') + loan.loan_amount,
+        outstanding_principal=F('outstanding_principal') + Decimal(str(round(outstanding_principal(
+            loan.loan_amount, loan.interest_rate, loan.tenure, loan.emis_paid_on_time
+        ), 2))),
+        monthly_emi=F('monthly_emi') + loan.monthly_repayment,
+    )
+
+
+@handles(OutboxEvent.LOAN_CREATED)
+def record_created_loan(event, using='default'):
+    """Outbox handler adding a loan created through the API to the rollups"""
+    record_loan(Loan.objects.using(using).get(loan_id=event.aggregate_id), using=using)
+
+
+def rebuild_portfolio_rollups(using='default', today=None):
+    """Recompute every rollup bucket with one grouped query over active loans
+
+    Used after bulk loads and EMI posting, where updating buckets row by row
+    would cost more than regrouping the table. Loans whose creation event is
+    still in the outbox are left out; draining it adds them.
+    """
+    current_month = month_start(today or date.today())
+    with transaction.atomic(using=using):
+        # Read and rewrite under one lock, so an outbox handler cannot add a
+        # loan this rebuild has already left out as pending
+        lock_rollups(using=using, exclusive=True)
+        buckets = (
+            Loan.objects.using(using)
+            .filter(end_date__gte=current_month)
+            .exclude(loan_id__in=pending_events(OutboxEvent.LOAN_CREATED, using=using).values('aggregate_id'))
+            .annotate(
+                rate_band=_band_case('interest_rate', RATE_BANDS, 'lt'),
+                tenure_band=_band_case('tenure', TENURE_BANDS, 'lte'),
+                end_month=TruncMonth('end_date'),
+                # Older loans share one bucket per end month; their EMIs are due
+                start_month=Case(
+                    When(start_date__gte=current_month, then=TruncMonth('start_date')),
+                    default=Value(None), output_field=DateField(),
+                ),
+            )
+            .values('rate_band', 'tenure_band', 'end_month', 'start_month')
+            .annotate(
+                loan_count=Count('loan_id'),
+                principal=Sum('loan_amount'),
+                outstanding=Sum(outstanding_principal_expression()),
+                monthly_emi=Sum('monthly_repayment'),
+            )
+            .order_by()
+        )
+        rollups = [
+            PortfolioRollup(
+                rate_band=bucket['rate_band'],
+                tenure_band=bucket['tenure_band'],
+                end_month=bucket['end_month'],
+                start_month=bucket['start_month'],
+                loan_count=bucket['loan_count'],
+                principal=bucket['principal'],
+                outstanding_principal=Decimal(str(round(bucket['outstanding'] or 0, 2))),
+                monthly_emi=bucket['monthly_emi'],
+            )
+            for bucket in buckets
+        ]
+        PortfolioRollup.objects.using(using).all().delete()
+        PortfolioRollup.objects.using(using).bulk_create(rollups)
+    return len(rollups)
+
+
+def rollup_rows(current_month, using='default'):
+    """Rollup buckets still active in ``current_month``"""
+    return list(PortfolioRollup.objects.using(using).filter(end_month__gte=current_month).values(
+        'rate_band', 'tenure_band', 'start_month', 'loan_count', 'outstanding_principal', 'monthly_emi'
+    ))
+
+
+def portfolio_summary(today=None):
+    """Exposure of loans active in the current month, read from the rollups of every shard
+
+    A loan's first EMI is due the month after it starts, so loans starting
+    this month or later are left out of ``emi_due_this_month``.
+    """
+    current_month = month_start(today or date.today())
+    rows = list(chain.from_iterable(fan_out(rollup_rows, current_month)))
+
+    def empty_band(label):
+        return {'band': label, 'loan_count': 0, 'outstanding_principal': Decimal('0'), 'monthly_emi': Decimal('0')}
+
+    by_rate = {label: empty_band(label) for _, label in RATE_BANDS}
+    by_tenure = {label: empty_band(label) for _, label in TENURE_BANDS}
+    for row in rows:
+        for band in (by_rate[row['rate_band']], by_tenure[row['tenure_band']]):
+            band['loan_count'] += row['loan_count']
+            band['outstanding_principal'] += row['outstanding_principal']
+            band['monthly_emi'] += row['monthly_emi']
+
+    return {
+        'as_of_month': current_month,
+        'active_loan_count': sum(band['loan_count'] for band in by_rate.values()),
+        'total_outstanding_principal': sum(band['outstanding_principal'] for band in by_rate.values()),
+        'emi_due_this_month': sum(
+            row['monthly_emi'] for row in rows if row['start_month'] is None or row['start_month'] < current_month
+        ),
+        'by_interest_rate_band': list(by_rate.values()),
+        'by_tenure_band': list(by_tenure.values()),
+    }
@@ -0,0 +1,98 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from .models import CreditScoreSnapshot, Customer
+from .scoring import credit_scores_from_arrays, customer_stat_annotations
+from .sharding import shard_databases
+
+
+RESCORE_RANGE_SIZE = 10000  # customer ids per work unit
+
+STAT_COLUMNS = [
+    'customer_id', 'approved_limit', 'total_loans', 'loans_sum', 'paid_on_time', 'current_year_loans',
+    'history_loans', 'history_loans_sum', 'history_paid_on_time',
+]
+
+
+def customer_id_ranges(range_size=RESCORE_RANGE_SIZE, using='default'):
+    """Consecutive (low, high) customer id ranges, both inclusive, covering one database"""
+    bounds = Customer.objects.using(using).aggregate(low=Min('customer_id'), high=Max('customer_id'))
+    if bounds['low'] is None:
+        return []
+    return [
+        (low, min(low + range_size - 1, bounds['high']))
+        for low in range(bounds['low'], bounds['high'] + 1, range_size)
+    ]
+
+
+def paisa(values):
+    return [int((value or 0) * 100) for value in values]
+
+
+def score_customer_range(low, high, snapshot_date, using='default'):
+    """Score every customer with an id in [low, high] and store the snapshot, returns the number scored
+
+    The range's loan aggregates come from one grouped query and are scored
+    as arrays. Re-running a range for the same date replaces its rows.
+    """
+    import numpy as np
+
+    rows = list(
+        Customer.objects.using(using)
+        .filter(customer_id__gte=low, customer_id__lte=high)
+        .annotate(**customer_stat_annotations(snapshot_date))
+        .values_list(*STAT_COLUMNS)
+    )
+    if rows:
+        (customer_ids, approved_limit, total_loans, loans_sum, paid_on_time, current_year_loans,
+         history_loans, history_loans_sum, history_paid_on_time) = zip(*rows)
+        scores = credit_scores_from_arrays(
+            paisa(approved_limit),
+            np.array(total_loans) + np.array([value or 0 for value in history_loans]),
+            np.array(paisa(loans_sum)) + np.array(paisa(history_loans_sum)),
+            np.array(paid_on_time) + np.array([value or 0 for value in history_paid_on_time]),
+            current_year_loans,
+        )
+        snapshots = [
+            CreditScoreSnapshot(snapshot_date=snapshot_date, customer_id=customer_id, credit_score=float(score))
+            for customer_id, score in zip(customer_ids, scores)
+        ]
+    else:
+        snapshots = []
+
+    with transaction.atomic(using=using):
+        CreditScoreSnapshot.objects.using(using).filter(
+            snapshot_date=snapshot_date, customer_id__gte=low, customer_id__lte=high
+        ).delete()
+        CreditScoreSnapshot.objects.using(using).bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def _score_work_unit(unit):
+    alias, low, high, snapshot_date = unit
+    return score_customer_range(low, high, snapshot_date, using=alias)
+
+
+def rescore_portfolio(snapshot_date=None, workers=1, range_size=RESCORE_RANGE_SIZE):
+    """Score every customer on every shard into the snapshot for ``snapshot_date``, returns the number scored
+
+    Customer id ranges are spread over ``workers`` forked processes; with
+    one worker they run in this process.
+    """
+    snapshot_date = snapshot_date or date.today()
+    units = [
+        (alias, low, high, snapshot_date)
+        for alias in shard_databases()
+        for low, high in customer_id_ranges(range_size, using=alias)
+    ]
+    if workers <= 1 or len(units) <= 1:
+        return sum(_score_work_unit(unit) for unit in units)
+
+    # Forked workers open their own connections instead of sharing the parent's sockets
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        return sum(pool.map(_score_work_unit, units))
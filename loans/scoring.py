@@ -0,0 +1,290 @@
+from datetime import date
+from decimal import ROUND_DOWN, Decimal
+
+from django.db.models import Count, F, Q, Sum
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .models import Customer
+
+
+def loan_stat_aggregates(prefix='', today=None):
+    """Aggregates over a customer's loans that feed the credit score and EMI check
+
+    ``prefix`` is the path to the loan fields, e.g. ``'loans__'`` when
+    annotating customers.
+    """
+    today = today or date.today()
+    loan_id = f'{prefix}loan_id'
+    return {
+        'total_loans': Count(loan_id),
+        'loans_sum': Sum(f'{prefix}loan_amount'),
+        # emis_paid_on_time >= tenure * 0.9, kept in integers to match exactly
+        'paid_on_time': Count(
+            loan_id, filter=GreaterThanOrEqual(F(f'{prefix}emis_paid_on_time') * 10, F(f'{prefix}tenure') * 9)
+        ),
+        'current_year_loans': Count(loan_id, filter=Q(**{f'{prefix}start_date__year': today.year})),
+        'current_emis': Sum(f'{prefix}monthly_repayment', filter=Q(**{f'{prefix}end_date__gte': today})),
+    }
+
+
+def customer_stat_annotations(today=None):
+    """loan_stat_aggregates() over a customer's loans plus the totals of its archived loans
+
+    Archived loans matured before the current year, so they only add to the
+    loan count, the loan sum and the on-time count.
+    """
+    return {
+        **loan_stat_aggregates('loans__', today),
+        'history_loans': F('loan_history__total_loans'),
+        'history_loans_sum': F('loan_history__loans_sum'),
+        'history_paid_on_time': F('loan_history__paid_on_time'),
+    }
+
+
+def customer_with_loan_stats(customer_id, using='default'):
+    """Fetch a customer and its loan aggregates in one query"""
+    return Customer.objects.using(using).annotate(**customer_stat_annotations()).get(customer_id=customer_id)
+
+
+def score_stats(customer):
+    """Credit score inputs of a customer annotated with customer_stat_annotations()"""
+    return {
+        'total_loans': customer.total_loans + (customer.history_loans or 0),
+        'loans_sum': (customer.loans_sum or 0) + (customer.history_loans_sum or 0),
+        'paid_on_time': customer.paid_on_time + (customer.history_paid_on_time or 0),
+        'current_year_loans': customer.current_year_loans,
+    }
+
+
+def credit_score_from_stats(approved_limit, total_loans, loans_sum, paid_on_time, current_year_loans):
+    """Credit score from pre-aggregated loan figures"""
+    if not total_loans:
+        return 50  # Default score for new customers
+
+    # Check if current loans exceed approved limit
+    current_loans_sum = loans_sum or 0
+
+    if current_loans_sum > approved_limit:
+        return 0
+
+    # Calculate score (simplified algorithm)
+    score = 0
+
+    # Past loans paid on time (40% weight)
+    on_time_ratio = paid_on_time / total_loans
+    score += on_time_ratio * 40
+
+    # Number of loans (20% weight) - fewer loans is better
+    if total_loans <= 3:
+        score += 20
+    elif total_loans <= 6:
+        score += 15
+    else:
+        score += 10
+
+    # Current year activity (20% weight) - moderate activity is good
+    if current_year_loans <= 2:
+        score += 20
+    elif current_year_loans <= 4:
+        score += 15
+    else:
+        score += 10
+
+    # Loan approved volume (20% weight)
+    if current_loans_sum <= approved_limit * Decimal('0.5'):
+        score += 20
+    elif current_loans_sum <= approved_limit * Decimal('0.8'):
+        score += 15
+    else:
+        score += 10
+
+    return min(100, max(0, score))
+
+
+def credit_scores_from_arrays(approved_limit_paisa, total_loans, loans_sum_paisa, paid_on_time, current_year_loans):
+    """credit_score_from_stats() over numpy arrays, one element per customer
+
+    Amounts are integer paisa so the limit comparisons are exact. The float
+    arithmetic follows the scalar version step by step, so both give
+    identical scores.
+    """
+    import numpy as np
+
+    total_loans = np.asarray(total_loans, dtype=np.int64)
+    paid_on_time = np.asarray(paid_on_time, dtype=np.int64)
+    current_year_loans = np.asarray(current_year_loans, dtype=np.int64)
+    approved_limit_paisa = np.asarray(approved_limit_paisa, dtype=np.int64)
+    loans_sum_paisa = np.asarray(loans_sum_paisa, dtype=np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = paid_on_time / total_loans * 40
+    score = score + np.select([total_loans <= 3, total_loans <= 6], [20, 15], 10)
+    score = score + np.select([current_year_loans <= 2, current_year_loans <= 4], [20, 15], 10)
+    score = score + np.select(
+        [loans_sum_paisa * 2 <= approved_limit_paisa, loans_sum_paisa * 10 <= approved_limit_paisa * 8], [20, 15], 10
+    )
+    score = np.minimum(100, np.maximum(0, score))
+    score = np.where(loans_sum_paisa > approved_limit_paisa, 0, score)
+    return np.where(total_loans == 0, 50, score)
+
+
+def calculate_credit_score(customer):
+    """Calculate credit score based on historical loan data"""
+    if not hasattr(customer, 'total_loans'):
+        # Not yet annotated by customer_with_loan_stats()
+        customer = customer_with_loan_stats(customer.pk, using=customer._state.db)
+    return credit_score_from_stats(customer.approved_limit, **score_stats(customer))
+
+
+def get_required_interest_rate(credit_score):
+    """Get minimum required interest rate based on credit score"""
+    if credit_score > 50:
+        return 0  # Any rate is acceptable
+    elif credit_score > 30:
+        return 12
+    elif credit_score > 10:
+        return 16
+    else:
+        return None  # No loan approval
+
+
+def calculate_monthly_installment(loan_amount, interest_rate, tenure):
+    """Calculate monthly installment using compound interest"""
+    principal = float(loan_amount)
+    rate = float(interest_rate) / 100 / 12  # monthly rate
+    n = tenure
+
+    if rate == 0:
+        return Decimal(str(principal / n))
+
+    # EMI = P * r * (1 + r)^n / ((1 + r)^n - 1)
+    emi = principal * rate * (1 + rate) ** n / ((1 + rate) ** n - 1)
+    return Decimal(str(round(emi, 2)))
+
+
+def loan_decision(credit_score, current_emis, monthly_salary, loan_amount, interest_rate, tenure):
+    """Approval decision for a new loan, as made by create_loan
+
+    Returns (loan_approved, message, final_interest_rate, monthly_installment).
+    """
+    monthly_installment = calculate_monthly_installment(loan_amount, interest_rate, tenure)
+    total_emi = (current_emis or Decimal('0')) + monthly_installment
+    max_allowed_emi = monthly_salary * Decimal('0.5')
+    required_rate = get_required_interest_rate(credit_score)
+
+    if credit_score <= 10:
+        return False, "Loan not approved due to low credit score", interest_rate, monthly_installment
+    if total_emi > max_allowed_emi:
+        return False, "Loan not approved due to high EMI burden", interest_rate, monthly_installment
+    if required_rate is None:
+        return False, "Loan not approved due to credit score", interest_rate, monthly_installment
+    if required_rate > 0 and interest_rate < required_rate:
+        return (
+            False, f"Loan not approved. Minimum interest rate required: {required_rate}%",
+            interest_rate, monthly_installment
+        )
+
+    # Use corrected interest rate if needed
+    final_interest_rate = max(interest_rate, required_rate) if required_rate > 0 else interest_rate
+    monthly_installment = calculate_monthly_installment(loan_amount, final_interest_rate, tenure)
+    return True, "Loan approved successfully", final_interest_rate, monthly_installment
+
+
+def quote_grid(customer, loan_amount, tenures, interest_rates):
+    """Eligibility of one loan amount over a tenure x interest rate grid
+
+    ``customer`` must come from customer_with_loan_stats(). Applies
+    the same rules as check_eligibility to every cell, with the EMIs for the
+    whole grid computed in one vectorised pass.
+    """
+    import numpy as np
+
+    credit_score = calculate_credit_score(customer)
+    required_rate = get_required_interest_rate(credit_score)
+    current_emis = customer.current_emis or Decimal('0')
+    max_allowed_emi = customer.monthly_salary * Decimal('0.5')
+
+    n = np.array(tenures, dtype=float)[:, None]
+    rate = np.array([float(r) for r in interest_rates])[None, :] / 100 / 12
+    principal = float(loan_amount)
+    growth = (1 + rate) ** n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = np.where(rate == 0, principal / n, principal * rate * growth / (growth - 1))
+
+    quotes = []
+    for i, tenure in enumerate(tenures):
+        for j, interest_rate in enumerate(interest_rates):
+            if rate[0, j] == 0:
+                monthly_installment = Decimal(str(float(emi[i, j])))
+            else:
+                monthly_installment = Decimal(str(round(float(emi[i, j]), 2)))
+            approval = False
+            corrected_interest_rate = interest_rate
+
+            if credit_score <= 10 or required_rate is None:
+                approval = False
+            elif current_emis + monthly_installment > max_allowed_emi:
+                approval = False
+            elif required_rate == 0 or interest_rate >= required_rate:
+                approval = True
+            else:
+                approval = True
+                corrected_interest_rate = required_rate
+                monthly_installment = calculate_monthly_installment(loan_amount, required_rate, tenure)
+
+            quotes.append({
+                'tenure': tenure,
+                'interest_rate': interest_rate,
+                'approval': approval,
+                'corrected_interest_rate': corrected_interest_rate,
+                'monthly_installment': monthly_installment,
+            })
+    return quotes
+
+
+MAX_LOAN_AMOUNT = Decimal('9999999999.99')  # largest value LoanEligibilitySerializer accepts
+PAISA = Decimal('0.01')
+
+
+def max_loan_amount(customer, interest_rate, tenure):
+    """Largest loan amount check_eligibility would approve, solved in closed form
+
+    ``customer`` must come from customer_with_loan_stats(). The EMI
+    headroom left under 50% of the salary is turned into a principal by
+    inverting the EMI formula, then nudged by a paisa either way to absorb
+    the rounding of the instalment. Returns (amount, corrected_interest_rate,
+    limiting_factor).
+    """
+    credit_score = calculate_credit_score(customer)
+    required_rate = get_required_interest_rate(credit_score)
+    corrected_interest_rate = interest_rate
+    if required_rate is not None and required_rate > 0 and interest_rate < required_rate:
+        corrected_interest_rate = required_rate
+
+    if credit_score <= 10 or required_rate is None:
+        return Decimal('0'), corrected_interest_rate, 'credit_score'
+
+    current_emis = customer.current_emis or Decimal('0')
+    max_allowed_emi = customer.monthly_salary * Decimal('0.5')
+    headroom = max_allowed_emi - current_emis
+
+    def fits(amount):
+        return current_emis + calculate_monthly_installment(amount, interest_rate, tenure) <= max_allowed_emi
+
+    rate = float(interest_rate) / 100 / 12
+    if rate == 0:
+        estimate = float(headroom) * tenure
+    else:
+        growth = (1 + rate) ** tenure
+        estimate = float(headroom) * (growth - 1) / (rate * growth)
+
+    amount = min(Decimal(str(max(estimate, 0))).quantize(PAISA, rounding=ROUND_DOWN), MAX_LOAN_AMOUNT)
+    while amount > 0 and not fits(amount):
+        amount -= PAISA
+    while amount < MAX_LOAN_AMOUNT and fits(amount + PAISA):
+        amount += PAISA
+
+    if amount <= 0:
+        return Decimal('0'), corrected_interest_rate, 'emi_limit'
+    limiting_factor = 'amount_cap' if amount == MAX_LOAN_AMOUNT else 'emi_limit'
+    return amount, corrected_interest_rate, limiting_factor
@@ -1,5 +1,43 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
-from .models import Customer, Loan
+from .finance import next_due_date, outstanding_principal, total_interest_remaining
+from .models import Customer, IngestionJob, Loan, LoanRequest
+from .sharding import allocate_ids, customers_by_phone, lock_phone_numbers, shard_for_customer
+
+
+class BulkCustomerRegistrationSerializer(serializers.ListSerializer):
+    batch_size = 500
+    
+    def create(self, validated_data):
+        with transaction.atomic():
+            return self.register(validated_data)
+    
+    def register(self, validated_data):
+        # Phone numbers already registered, or repeated in the batch, map to a single customer
+        phone_numbers = list(dict.fromkeys(item['phone_number'] for item in validated_data))
+        lock_phone_numbers(phone_numbers)
+        by_phone = {}
+        for customer in customers_by_phone(phone_numbers):
+            by_phone.setdefault(customer.phone_number, customer)  # lowest customer_id wins
+        
+        # bulk_create skips Customer.save(), so apply its approved_limit rule here
+        new_customers = {}
+        for item in validated_data:
+            if item['phone_number'] not in by_phone and item['phone_number'] not in new_customers:
+                customer = Customer(**item)
+                customer.approved_limit = Customer.calculate_approved_limit(customer.monthly_salary)
+                new_customers[item['phone_number']] = customer
+        
+        by_shard = defaultdict(list)
+        for customer, customer_id in zip(new_customers.values(), allocate_ids(Customer, len(new_customers))):
+            customer.customer_id = customer_id
+            by_shard[shard_for_customer(customer_id)].append(customer)
+        for alias, customers in by_shard.items():
+            Customer.objects.using(alias).bulk_create(customers, batch_size=self.batch_size)
+        by_phone.update(new_customers)
+        return [by_phone[item['phone_number']] for item in validated_data]
 
 
 class CustomerRegistrationSerializer(serializers.ModelSerializer):
@@ -8,9 +46,13 @@ class CustomerRegistrationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ['first_name', 'last_name', 'age', 'monthly_income', 'phone_number']
+        list_serializer_class = BulkCustomerRegistrationSerializer
     
     def create(self, validated_data):
-        return Customer.objects.create(**validated_data)
+        customer_id, = allocate_ids(Customer)
+        customer = Customer(customer_id=customer_id, **validated_data)
+        customer.save()  # routed to the customer's shard
+        return customer
 
 
 class CustomerRegistrationResponseSerializer(serializers.ModelSerializer):
@@ -25,6 +67,10 @@ class CustomerRegistrationResponseSerializer(serializers.ModelSerializer):
         return f"{obj.first_name} {obj.last_name}"
 
 
+class CustomerPhoneLookupSerializer(serializers.Serializer):
+    phone = serializers.IntegerField(min_value=1)
+
+
 class LoanEligibilitySerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
     loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
@@ -41,6 +87,47 @@ class LoanEligibilityResponseSerializer(serializers.Serializer):
     monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2)
 
 
+class LoanQuoteSerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    tenures = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=24
+    )
+    interest_rates = serializers.ListField(
+        child=serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('0')),
+        required=False, allow_empty=False, max_length=24
+    )
+
+
+class LoanQuoteCellSerializer(serializers.Serializer):
+    tenure = serializers.IntegerField()
+    interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    approval = serializers.BooleanField()
+    corrected_interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class LoanQuoteResponseSerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    quotes = LoanQuoteCellSerializer(many=True)
+
+
+class MaxLoanQuerySerializer(serializers.Serializer):
+    tenure = serializers.IntegerField(min_value=1)
+    interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('0'))
+
+
+class MaxLoanResponseSerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    tenure = serializers.IntegerField()
+    interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    corrected_interest_rate = serializers.DecimalField(max_digits=5, decimal_places=2)
+    max_loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2)
+    limiting_factor = serializers.CharField()
+
+
 class LoanCreateSerializer(serializers.Serializer):
     customer_id = serializers.IntegerField()
     loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2)
@@ -64,21 +151,148 @@ class CustomerDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'phone_number', 'age']
 
 
-class LoanDetailSerializer(serializers.ModelSerializer):
+_money = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class LoanBalanceSerializer(serializers.ModelSerializer):
+    """Adds closed-form balance fields to a loan representation
+
+    Values annotated on the queryset as ``db_outstanding_principal`` and
+    ``db_total_interest_remaining`` are used when present, otherwise they are
+    computed per loan without extra queries.
+    """
+    outstanding_principal = serializers.SerializerMethodField()
+    total_interest_remaining = serializers.SerializerMethodField()
+    next_due_date = serializers.SerializerMethodField()
+    
+    def get_outstanding_principal(self, obj):
+        value = getattr(obj, 'db_outstanding_principal', None)
+        if value is None:
+            value = outstanding_principal(obj.loan_amount, obj.interest_rate, obj.tenure, obj.emis_paid_on_time)
+        return _money.to_representation(round(value, 2))
+    
+    def get_total_interest_remaining(self, obj):
+        value = getattr(obj, 'db_total_interest_remaining', None)
+        if value is None:
+            value = total_interest_remaining(
+                obj.loan_amount, obj.interest_rate, obj.tenure, obj.emis_paid_on_time, obj.monthly_repayment
+            )
+        return _money.to_representation(round(value, 2))
+    
+    def get_next_due_date(self, obj):
+        due = next_due_date(obj.start_date, obj.tenure, obj.emis_paid_on_time)
+        return due.isoformat() if due else None
+
+
+class LoanDetailSerializer(LoanBalanceSerializer):
     customer = CustomerDetailSerializer(read_only=True)
     
     class Meta:
         model = Loan
-        fields = ['loan_id', 'customer', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure']
+        fields = [
+            'loan_id', 'customer', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure',
+            'outstanding_principal', 'total_interest_remaining', 'next_due_date'
+        ]
 
 
-class CustomerLoanSerializer(serializers.ModelSerializer):
+class CustomerLoanSerializer(LoanBalanceSerializer):
     repayments_left = serializers.SerializerMethodField()
     monthly_installment = serializers.DecimalField(max_digits=12, decimal_places=2, source='monthly_repayment')
     
     class Meta:
         model = Loan
-        fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_installment', 'repayments_left']
+        fields = [
+            'loan_id', 'loan_amount', 'interest_rate', 'monthly_installment', 'repayments_left',
+            'outstanding_principal', 'total_interest_remaining', 'next_due_date'
+        ]
     
     def get_repayments_left(self, obj):
-        return obj.tenure - obj.emis_paid_on_time
\ No newline at end of file
+        return obj.tenure - obj.emis_paid_on_time
+
+
+class CommaSeparatedIdsField(serializers.ListField):
+    """Positive integer ids given as ``1,2,3``; duplicates are dropped, order kept"""
+    child = serializers.IntegerField(min_value=1)
+    
+    def to_internal_value(self, data):
+        # Query strings arrive as ['1,2,3'], or as ['1', '2'] for repeated parameters
+        if isinstance(data, str):
+            data = [data]
+        if isinstance(data, list):
+            data = [part.strip() for item in data for part in str(item).split(',') if part.strip()]
+        return list(dict.fromkeys(super().to_internal_value(data)))
+
+
+MAX_LOOKUP_IDS = 1000
+
+
+class CustomerLoansLookupSerializer(serializers.Serializer):
+    customer_ids = CommaSeparatedIdsField(allow_empty=False, max_length=MAX_LOOKUP_IDS)
+
+
+class LoanLookupSerializer(serializers.Serializer):
+    loan_ids = CommaSeparatedIdsField(allow_empty=False, max_length=MAX_LOOKUP_IDS)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=['csv', 'ndjson', 'xlsx'], default='csv')
+    since = serializers.IntegerField(min_value=0, required=False)
+
+
+class PortfolioBandSerializer(serializers.Serializer):
+    band = serializers.CharField()
+    loan_count = serializers.IntegerField()
+    outstanding_principal = serializers.DecimalField(max_digits=18, decimal_places=2)
+    monthly_emi = serializers.DecimalField(max_digits=18, decimal_places=2)
+
+
+class PortfolioSummarySerializer(serializers.Serializer):
+    as_of_month = serializers.DateField()
+    active_loan_count = serializers.IntegerField()
+    total_outstanding_principal = serializers.DecimalField(max_digits=18, decimal_places=2)
+    emi_due_this_month = serializers.DecimalField(max_digits=18, decimal_places=2)
+    by_interest_rate_band = PortfolioBandSerializer(many=True)
+    by_tenure_band = PortfolioBandSerializer(many=True)
+
+
+INGESTION_FILE_EXTENSIONS = ('.xlsx', '.csv')
+
+
+class IngestionUploadSerializer(serializers.Serializer):
+    kind = serializers.ChoiceField(choices=IngestionJob.KIND_CHOICES)
+    file = serializers.FileField()
+    
+    def validate_file(self, value):
+        if not value.name.lower().endswith(INGESTION_FILE_EXTENSIONS):
+            raise serializers.ValidationError(f"Supported file types: {', '.join(INGESTION_FILE_EXTENSIONS)}")
+        return value
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    rows_per_second = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'job_id', 'kind', 'status', 'rows_total', 'rows_done', 'rows_created', 'rows_updated',
+            'rows_rejected', 'rows_per_second', 'cancel_requested', 'error',
+            'created_at', 'started_at', 'finished_at'
+        ]
+
+
+class LoanRequestSerializer(serializers.ModelSerializer):
+    customer_id = serializers.IntegerField(read_only=True)
+    loan_id = serializers.IntegerField(read_only=True, allow_null=True)
+    loan_approved = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = LoanRequest
+        fields = [
+            'ticket_id', 'customer_id', 'status', 'loan_approved', 'loan_id', 'message',
+            'loan_amount', 'interest_rate', 'tenure', 'monthly_installment', 'created_at', 'processed_at'
+        ]
+    
+    def get_loan_approved(self, obj):
+        if obj.status == LoanRequest.QUEUED:
+            return None
+        return obj.status == LoanRequest.APPROVED
@@ -0,0 +1,174 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from .bulk import filter_in_chunks
+from .models import ArchivedLoan, Customer, IdSequence, Loan
+
+
+# Models stored on the shard of their customer; everything else (ingestion
+# jobs, the id sequences) lives on the default database
+SHARDED_MODELS = {'customer', 'loan', 'archivedloan', 'loanhistory', 'loanrequest', 'creditscoresnapshot'}
+
+
+def shard_databases():
+    """Aliases of the customer shards, shard 0 ('default') first"""
+    return settings.SHARD_DATABASES
+
+
+def is_sharded():
+    return len(settings.SHARD_DATABASES) > 1
+
+
+def shard_for_customer(customer_id):
+    """Alias of the database holding a customer and all of its loans
+
+    A customer without an id yet (one the database will number) belongs on
+    the default database.
+    """
+    if customer_id is None:
+        return DEFAULT_DB_ALIAS
+    databases = settings.SHARD_DATABASES
+    return databases[customer_id % len(databases)]
+
+
+def group_by_shard(customer_ids):
+    """Split customer ids into {alias: [ids]}, keeping their order"""
+    grouped = defaultdict(list)
+    for customer_id in customer_ids:
+        grouped[shard_for_customer(customer_id)].append(customer_id)
+    return grouped
+
+
+def split_frame_by_shard(df, column='customer_id'):
+    """Yield (alias, rows) for every shard with rows in a frame keyed by customer id"""
+    databases = shard_databases()
+    shards = df[column] % len(databases)
+    for index, alias in enumerate(databases):
+        part = df[shards == index]
+        if len(part):
+            yield alias, part
+
+
+def fan_out(function, *args, **kwargs):
+    """Call ``function(*args, using=alias, **kwargs)`` on every shard, returns the results in shard order
+
+    For reporting and maintenance work that has to see every customer.
+    """
+    return [function(*args, using=alias, **kwargs) for alias in shard_databases()]
+
+
+def find_on_shards(model, **lookup):
+    """First ``model`` row matching ``lookup`` on any shard, or None
+
+    For lookups by a key that does not say which shard holds the row.
+    """
+    for alias in shard_databases():
+        row = model.objects.using(alias).filter(**lookup).first()
+        if row is not None:
+            return row
+    return None
+
+
+def customers_by_phone(phone_numbers):
+    """Customers registered with any of ``phone_numbers`` on every shard, lowest customer_id first"""
+    customers = [
+        customer
+        for alias in shard_databases()
+        for customer in filter_in_chunks(Customer.objects.using(alias), 'phone_number', phone_numbers)
+    ]
+    return sorted(customers, key=lambda customer: customer.customer_id)
+
+
+PHONE_LOCK_NAMESPACE = 4401  # first key of the PostgreSQL advisory locks taken by lock_phone_numbers
+
+
+def lock_phone_numbers(phone_numbers):
+    """Hold registration of ``phone_numbers`` to this caller until the default database's transaction ends
+
+    Call inside ``transaction.atomic()`` on the default database, before
+    looking the numbers up, so two registrations of one number cannot both
+    miss and both insert. Customers live on different shards, so a unique
+    index cannot catch duplicates. On PostgreSQL this takes one advisory lock
+    per number, in key order. SQLite has no row locks, so a no-op write takes
+    its single writer lock.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for key in sorted({phone_number % 2 ** 31 for phone_number in phone_numbers}):
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [PHONE_LOCK_NAMESPACE, key])
+        else:
+            table = connection.ops.quote_name(IdSequence._meta.db_table)
+            cursor.execute(f'UPDATE {table} SET next_value = next_value WHERE 1 = 0')
+
+
+def highest_id(model):
+    """Largest primary key of ``model`` on any shard; archived loans keep their ids, so they count too"""
+    models = [Loan, ArchivedLoan] if model is Loan else [model]
+    return max(
+        model.objects.using(alias).aggregate(highest=Max('pk'))['highest'] or 0
+        for model in models for alias in shard_databases()
+    )
+
+
+def allocate_ids(model, count=1):
+    """Reserve ``count`` primary keys for ``model`` that are unique across shards
+
+    A customer's id picks its shard, so it has to be known before the row is
+    inserted. With a single database this returns ``[None] * count`` and the
+    table's own sequence assigns the keys.
+    """
+    if not is_sharded() or not count:
+        return [None] * count
+    name = model._meta.db_table
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        # get_or_create retries the read if a concurrent first allocation inserted the row
+        sequence, _ = sequences.select_for_update().get_or_create(
+            name=name, defaults={'next_value': lambda: highest_id(model) + 1}
+        )
+        start = sequence.next_value
+        sequences.filter(name=name).update(next_value=start + count)
+    return list(range(start, start + count))
+
+
+def advance_id_sequence(model):
+    """Move the shared sequence past keys inserted with explicit values, e.g. by ingestion"""
+    if not is_sharded():
+        return
+    name = model._meta.db_table
+    next_value = highest_id(model) + 1
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        sequence, created = sequences.select_for_update().get_or_create(name=name, defaults={'next_value': next_value})
+        if not created and sequence.next_value < next_value:
+            sequences.filter(name=name).update(next_value=next_value)
+
+
+class CustomerShardRouter:
+    """Routes customers and the rows hanging off them to the shard of their customer_id
+
+    Only rows reached through a model instance can be routed here (saves,
+    related managers, foreign keys). Queries by id must pick their database
+    with ``.using(shard_for_customer(customer_id))``.
+    """
+    
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if model._meta.model_name not in SHARDED_MODELS or instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        customer_id = instance.pk if isinstance(instance, Customer) else getattr(instance, 'customer_id', None)
+        return shard_for_customer(customer_id)
+    
+    db_for_write = db_for_read
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards only need the loans tables
+        if db != DEFAULT_DB_ALIAS and db in settings.SHARD_DATABASES:
+            return app_label == 'loans'
+        return None
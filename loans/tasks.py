@@ -1,117 +1,115 @@
-from celery import shared_task
-import pandas as pd
-from datetime import datetime
-from .models import Customer, Loan
-import os
-from django.conf import settings
+from celery import group, shared_task
+from datetime import date
 
+from .archive import archive_matured_loans
+from .billing import post_emis
+from .ingestion import read_customer_frame, read_loan_frame, run_ingestion_job, upsert_customers, upsert_loans
+from .loan_requests import process_queued_loan_requests
+from .outbox import drain_outbox, purge_processed_events
+from .portfolio import rebuild_portfolio_rollups
+from .rescoring import customer_id_ranges, score_customer_range
+from .sharding import fan_out, shard_databases
 
-@shared_task
-def ingest_customer_data():
+
+@shared_task(soft_time_limit=3540, time_limit=3600)
+def ingest_customer_data(file_path=None):
     """Background task to ingest customer data from Excel file"""
     try:
-        # Read customer data
-        customer_file = os.path.join(settings.BASE_DIR, 'customer_data.xlsx')
-        df = pd.read_excel(customer_file)
-        
-        created_count = 0
-        updated_count = 0
-        
-        for _, row in df.iterrows():
-            customer, created = Customer.objects.get_or_create(
-                customer_id=row['customer_id'],
-                defaults={
-                    'first_name': row['first_name'],
-                    'last_name': row['last_name'],
-                    'phone_number': row['phone_number'],
-                    'monthly_salary': row['monthly_salary'],
-                    'approved_limit': row['approved_limit'],
-                    'current_debt': row.get('current_debt', 0),
-                    'age': 25  # Default age since not in customer data
-                }
-            )
-            
-            if created:
-                created_count += 1
-            else:
-                # Update existing customer
-                customer.first_name = row['first_name']
-                customer.last_name = row['last_name']
-                customer.phone_number = row['phone_number']
-                customer.monthly_salary = row['monthly_salary']
-                customer.approved_limit = row['approved_limit']
-                customer.current_debt = row.get('current_debt', 0)
-                customer.save()
-                updated_count += 1
-        
+        df = read_customer_frame(file_path)
+        created_count, updated_count = upsert_customers(df)
         return f"Customer data ingestion completed. Created: {created_count}, Updated: {updated_count}"
     
     except Exception as e:
         return f"Error ingesting customer data: {str(e)}"
 
 
-@shared_task
-def ingest_loan_data():
+@shared_task(soft_time_limit=3540, time_limit=3600)
+def ingest_loan_data(file_path=None):
     """Background task to ingest loan data from Excel file"""
     try:
-        # Read loan data
-        loan_file = os.path.join(settings.BASE_DIR, 'loan_data.xlsx')
-        df = pd.read_excel(loan_file)
-        
-        created_count = 0
-        updated_count = 0
-        
-        for _, row in df.iterrows():
-            try:
-                customer = Customer.objects.get(customer_id=row['customer_id'])
-                
-                # Parse dates
-                start_date = pd.to_datetime(row['start_date']).date()
-                end_date = pd.to_datetime(row['end_date']).date()
-                
-                loan, created = Loan.objects.get_or_create(
-                    loan_id=row['loan_id'],
-                    defaults={
-                        'customer': customer,
-                        'loan_amount': row['loan_amount'],
-                        'tenure': row['tenure'],
-                        'interest_rate': row['interest_rate'],
-                        'monthly_repayment': row['monthly_repayment (emi)'],
-                        'emis_paid_on_time': row['EMIs_paid_on_time'],
-                        'start_date': start_date,
-                        'end_date': end_date
-                    }
-                )
-                
-                if created:
-                    created_count += 1
-                else:
-                    # Update existing loan
-                    loan.customer = customer
-                    loan.loan_amount = row['loan_amount']
-                    loan.tenure = row['tenure']
-                    loan.interest_rate = row['interest_rate']
-                    loan.monthly_repayment = row['monthly_repayment (emi)']
-                    loan.emis_paid_on_time = row['EMIs_paid_on_time']
-                    loan.start_date = start_date
-                    loan.end_date = end_date
-                    loan.save()
-                    updated_count += 1
-                    
-            except Customer.DoesNotExist:
-                print(f"Customer with ID {row['customer_id']} not found for loan {row['loan_id']}")
-                continue
-        
-        return f"Loan data ingestion completed. Created: {created_count}, Updated: {updated_count}"
+        df = read_loan_frame(file_path)
+        created_count, updated_count, skipped_count = upsert_loans(df)
+        return (
+            f"Loan data ingestion completed. Created: {created_count}, Updated: {updated_count}, "
+            f"Skipped (unknown customer): {skipped_count}"
+        )
     
     except Exception as e:
         return f"Error ingesting loan data: {str(e)}"
 
 
-@shared_task
+@shared_task(soft_time_limit=7140, time_limit=7200)
 def ingest_all_data():
     """Background task to ingest both customer and loan data"""
     customer_result = ingest_customer_data()
     loan_result = ingest_loan_data()
     
-    return f"Data ingestion completed. {customer_result}. {loan_result}"
\ No newline at end of file
+    return f"Data ingestion completed. {customer_result}. {loan_result}"
+
+
+# Acknowledged only once it finishes, so a job whose worker died is delivered
+# again and resumes after its last recorded chunk
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, soft_time_limit=3540, time_limit=3600)
+def process_ingestion_job(self, job_id):
+    """Background task to ingest a file uploaded through the ingestion API"""
+    redelivered = bool((self.request.delivery_info or {}).get('redelivered'))
+    final_status = run_ingestion_job(job_id, resume=redelivered)
+    return f"Ingestion job {job_id} finished with status: {final_status}"
+
+
+@shared_task(soft_time_limit=3540, time_limit=3600)
+def post_monthly_emis(billing_month=None):
+    """Scheduled task to post the month's EMIs for every active loan"""
+    month = date.fromisoformat(billing_month) if billing_month else date.today()
+    posted_count = sum(fan_out(post_emis, month))
+    fan_out(rebuild_portfolio_rollups)
+    
+    return f"EMI posting for {month:%Y-%m} completed. Posted: {posted_count}"
+
+
+@shared_task
+def process_loan_requests():
+    """Background task deciding create_loan requests queued in async mode"""
+    processed_count = sum(fan_out(process_queued_loan_requests))
+    
+    return f"Loan requests processed: {processed_count}"
+
+
+@shared_task
+def drain_outbox_events():
+    """Periodic task running the handlers for pending outbox events"""
+    processed_count = sum(fan_out(drain_outbox))
+    purged_count = sum(fan_out(purge_processed_events))
+    
+    return f"Outbox drained. Processed: {processed_count}, Purged: {purged_count}"
+
+
+@shared_task(soft_time_limit=3540, time_limit=3600)
+def archive_loans():
+    """Nightly task moving matured loans out of the loans table"""
+    archived_count = sum(fan_out(archive_matured_loans))
+    
+    return f"Loan archival completed. Archived: {archived_count}"
+
+
+@shared_task
+def rescore_portfolio_snapshot(snapshot_date=None):
+    """Nightly task scoring every customer into a snapshot, one subtask per customer id range"""
+    snapshot_date = snapshot_date or date.today().isoformat()
+    units = [
+        rescore_customer_range.s(low, high, snapshot_date, using=alias)
+        for alias in shard_databases()
+        for low, high in customer_id_ranges(using=alias)
+    ]
+    group(units).apply_async()
+    
+    return f"Rescoring for {snapshot_date} queued as {len(units)} ranges"
+
+
+# Each range replaces its own snapshot rows, so running it twice is harmless
+@shared_task(acks_late=True, reject_on_worker_lost=True, soft_time_limit=540, time_limit=600)
+def rescore_customer_range(low, high, snapshot_date, using='default'):
+    """Score one customer id range into the snapshot; safe to re-run"""
+    scored_count = score_customer_range(low, high, date.fromisoformat(snapshot_date), using=using)
+    
+    return f"Scored customers {low}-{high} on {using}: {scored_count}"
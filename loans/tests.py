@@ -1,13 +1,61 @@
-from django.test import TestCase
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase as DRFTestCase
 from rest_framework import status
+from Alemeno_RESt_API.celery import app as celery_app
 from decimal import Decimal
-from .models import Customer, Loan
+from .archive import ARCHIVED_FIELDS, add_to_history, archive_matured_loans
+from . import coalescing
+from .billing import post_emis
+from .coalescing import SingleFlight, cache_single_flight
+from .finance import add_months, outstanding_principal
+from .ingestion import (
+    LOAN_FIELDS, prune_cache, read_customer_frame, read_loan_frame, run_ingestion_job, upsert_loans
+)
+from .middleware import ThresholdGZipMiddleware
+from .loan_requests import process_queued_loan_requests
+from .models import (
+    ArchivedLoan, CreditScoreSnapshot, Customer, IngestionJob, Loan, LoanHistory, LoanRequest, OutboxEvent,
+    PortfolioRollup,
+)
+from .outbox import HANDLERS, drain_outbox
+from .portfolio import portfolio_summary, rebuild_portfolio_rollups
+from .tasks import (
+    ingest_customer_data, ingest_loan_data, process_ingestion_job, process_loan_requests, rescore_customer_range
+)
+from .rescoring import rescore_portfolio
+from .sharding import lock_phone_numbers
+from .scoring import calculate_credit_score, credit_score_from_stats, credit_scores_from_arrays
+from .views import calculate_monthly_installment
 from datetime import date, timedelta
+from io import StringIO
+import gzip
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+import pandas as pd
 
 
 class CustomerModelTest(TestCase):
+    # Customers and loans live on every shard when DB_SHARD_COUNT > 1
+    databases = '__all__'
+
     def test_customer_creation(self):
         """Test customer creation with automatic approved limit calculation"""
         customer = Customer.objects.create(
@@ -25,6 +73,8 @@ class CustomerModelTest(TestCase):
 
 
 class LoanModelTest(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         self.customer = Customer.objects.create(
             first_name="Jane",
@@ -50,7 +100,9 @@ class LoanModelTest(TestCase):
         self.assertEqual(str(loan), f"Loan {loan.loan_id} - Jane Smith")
 
 
-class APITestCase(APITestCase):
+class APITestCase(DRFTestCase):
+    databases = '__all__'
+
     def setUp(self):
         self.customer = Customer.objects.create(
             first_name="Test",
@@ -77,6 +129,73 @@ class APITestCase(APITestCase):
         self.assertIn('customer_id', response.data)
         self.assertEqual(response.data['name'], 'New Customer')
 
+    def test_register_customers_bulk(self):
+        """Test bulk registration assigns ids and the same approved limits as single registration"""
+        url = reverse('register_customers_bulk')
+        data = [
+            {'first_name': 'Bulk', 'last_name': f'Customer{i}', 'age': 30 + i,
+             'monthly_income': salary, 'phone_number': 9800000000 + i}
+            for i, salary in enumerate([25000, 55000, 138900])
+        ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 3)
+        for item, payload in zip(response.data, data):
+            customer = Customer.objects.get(customer_id=item['customer_id'])
+            expected = Customer.calculate_approved_limit(Decimal(payload['monthly_income']))
+            self.assertEqual(customer.approved_limit, expected)
+            self.assertEqual(Decimal(item['approved_limit']), expected)
+
+    def test_register_customers_bulk_rejects_invalid_batch(self):
+        """Test one invalid registration rejects the whole batch"""
+        url = reverse('register_customers_bulk')
+        data = [
+            {'first_name': 'Good', 'last_name': 'Row', 'age': 30, 'monthly_income': 50000, 'phone_number': 9800000010},
+            {'first_name': 'Bad', 'last_name': 'Row', 'age': 12, 'monthly_income': 50000, 'phone_number': 9800000011},
+        ]
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Customer.objects.filter(first_name='Good').exists())
+
+    def test_register_duplicate_phone_returns_existing_customer(self):
+        """Test registering a known phone number returns the existing customer"""
+        response = self.client.post(reverse('register_customer'), {
+            'first_name': 'Again', 'last_name': 'Customer', 'age': 36,
+            'monthly_income': 80000, 'phone_number': self.customer.phone_number
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['customer_id'], self.customer.customer_id)
+        self.assertEqual(response.data['name'], 'Test Customer')
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_register_customers_bulk_skips_known_phones(self):
+        """Test bulk registration reuses existing customers and collapses repeats in the batch"""
+        data = [
+            {'first_name': 'Known', 'last_name': 'Phone', 'age': 30, 'monthly_income': 50000,
+             'phone_number': self.customer.phone_number},
+            {'first_name': 'New', 'last_name': 'Phone', 'age': 30, 'monthly_income': 50000, 'phone_number': 9800000020},
+            {'first_name': 'Repeat', 'last_name': 'Phone', 'age': 30, 'monthly_income': 50000, 'phone_number': 9800000020},
+        ]
+        response = self.client.post(reverse('register_customers_bulk'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        ids = [item['customer_id'] for item in response.data]
+        self.assertEqual(ids[0], self.customer.customer_id)
+        self.assertEqual(ids[1], ids[2])
+        self.assertEqual(response.data[2]['name'], 'New Phone')
+        self.assertEqual(Customer.objects.count(), 2)
+
+    def test_customer_lookup_by_phone(self):
+        """Test looking customers up by phone number"""
+        url = reverse('customer_lookup')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'phone': self.customer.phone_number})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['customer_id'] for item in response.data], [self.customer.customer_id])
+        self.assertEqual(self.client.get(url, {'phone': 9000000000}).data, [])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_check_eligibility(self):
         """Test loan eligibility check API"""
         url = reverse('check_eligibility')
@@ -137,4 +256,1640 @@ class APITestCase(APITestCase):
         }
         
         response = self.client.post(url, data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class GeneratePortfolioCommandTest(TestCase):
+    databases = '__all__'
+
+    def generate(self):
+        call_command('generate_portfolio', customers=30, loans=120, seed=7, batch_size=50, stdout=StringIO())
+        return (
+            list(Customer.objects.order_by('customer_id').values_list('monthly_salary', 'approved_limit', 'age')),
+            list(Loan.objects.order_by('loan_id').values_list(
+                'customer_id', 'loan_amount', 'tenure', 'interest_rate', 'emis_paid_on_time', 'start_date', 'end_date'
+            )),
+        )
+
+    def test_generates_requested_rows(self):
+        """Test generated rows follow the model rules"""
+        customers, loans = self.generate()
+        self.assertEqual(len(customers), 30)
+        self.assertEqual(len(loans), 120)
+
+        for salary, approved_limit, age in customers:
+            self.assertEqual(approved_limit, round(salary * 36 / 100000) * 100000)
+            self.assertTrue(21 <= age <= 65)
+
+        for loan in Loan.objects.all():
+            self.assertLessEqual(loan.emis_paid_on_time, loan.tenure)
+            self.assertGreater(loan.end_date, loan.start_date)
+            self.assertAlmostEqual(loan.monthly_repayment, loan.calculate_monthly_installment(), delta=Decimal('0.01'))
+
+        # Sequences continue after the explicit ids
+        customer = Customer.objects.create(
+            first_name="After", last_name="Generate", age=30, phone_number=9876500000, monthly_salary=40000
+        )
+        self.assertGreater(customer.customer_id, 30)
+
+    def test_seed_is_reproducible(self):
+        """Test the same seed produces the same portfolio"""
+        first = self.generate()
+        Loan.objects.all().delete()
+        Customer.objects.all().delete()
+        self.assertEqual(self.generate(), first)
+
+
+class IngestionTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        override = override_settings(INGESTION_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.customer_file = os.path.join(self.tmpdir.name, 'customers.xlsx')
+        self.loan_file = os.path.join(self.tmpdir.name, 'loans.xlsx')
+        pd.DataFrame({
+            'Customer ID': [1, 2],
+            'First Name': ['Asha', 'Ravi'],
+            'Last Name': ['Rao', 'Das'],
+            'Age': [30, 41],
+            'Phone Number': [9000000001, 9000000002],
+            'Monthly Salary': [50000, 80000],
+            'Approved Limit': [1800000, 2900000],
+        }).to_excel(self.customer_file, index=False)
+        pd.DataFrame({
+            'Customer ID': [1, 2, 2, 99],
+            'Loan ID': [10, 11, 11, 12],
+            'Loan Amount': [100000, 200000, 250000, 300000],
+            'Tenure': [12, 24, 24, 36],
+            'Interest Rate': [10.5, 12.0, 12.0, 14.0],
+            'Monthly payment': [8815, 9415, 11768, 10253],
+            'EMIs paid on Time': [12, 20, 21, 30],
+            'Date of Approval': ['2020-01-15', '2021-03-01', '2021-03-01', '2019-06-10'],
+            'End Date': ['2021-01-15', '2023-03-01', '2023-03-01', '2022-06-10'],
+        }).to_excel(self.loan_file, index=False)
+
+    def test_ingest_customers_and_loans(self):
+        """Test ingestion merges rows, keeps the last duplicate and skips unknown customers"""
+        result = ingest_customer_data(self.customer_file)
+        self.assertIn('Created: 2', result)
+        result = ingest_loan_data(self.loan_file)
+        self.assertIn('Skipped (unknown customer): 1', result)
+
+        self.assertEqual(Customer.objects.count(), 2)
+        self.assertEqual(Loan.objects.count(), 2)
+        loan = Loan.objects.get(loan_id=11)
+        self.assertEqual(loan.loan_amount, Decimal('250000'))
+        self.assertEqual(loan.emis_paid_on_time, 21)
+        self.assertEqual(loan.start_date, date(2021, 3, 1))
+
+        # Re-running updates in place and new rows continue the sequences
+        result = ingest_customer_data(self.customer_file)
+        self.assertIn('Updated: 2', result)
+        self.assertEqual(Customer.objects.count(), 2)
+        customer = Customer.objects.create(
+            first_name="Next", last_name="Customer", age=30, phone_number=9000000003, monthly_salary=40000
+        )
+        self.assertGreater(customer.customer_id, 2)
+
+    def test_parsed_frames_are_cached(self):
+        """Test a file is parsed once per content and column-mapping version"""
+        parsed = read_loan_frame(self.loan_file)
+        with mock.patch('loans.ingestion.read_table') as read_table:
+            cached = read_loan_frame(self.loan_file)
+        read_table.assert_not_called()
+        self.assertTrue(cached.equals(parsed))
+        self.assertEqual(cached['start_date'][0], date(2020, 1, 15))
+
+        # A copy of the same file hits the cache; new contents or a new mapping do not
+        copy = os.path.join(self.tmpdir.name, 'copy.xlsx')
+        with open(self.loan_file, 'rb') as src, open(copy, 'wb') as dst:
+            dst.write(src.read())
+        with mock.patch('loans.ingestion.read_table') as read_table:
+            read_loan_frame(copy)
+        read_table.assert_not_called()
+        with mock.patch('loans.ingestion.COLUMN_MAPPING_VERSION', 2):
+            read_loan_frame(self.loan_file)
+        pd.DataFrame({'Customer ID': [3], 'First Name': ['Neha'], 'Last Name': ['Sen'], 'Phone Number': [9000000003],
+                      'Monthly Salary': [60000], 'Approved Limit': [2200000]}).to_excel(self.customer_file, index=False)
+        self.assertEqual(read_customer_frame(self.customer_file)['customer_id'].tolist(), [3])
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+    def test_cache_evicts_least_recently_used_frames(self):
+        """Test the cache stays under INGESTION_CACHE_MAX_BYTES by deleting the frames used longest ago"""
+        read_loan_frame(self.loan_file)
+        read_customer_frame(self.customer_file)
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)]
+        loan_entry, customer_entry = sorted(entries, key=lambda path: 'customer' in path)
+        os.utime(customer_entry, (1, 1))
+        os.utime(loan_entry, (2, 2))
+        read_loan_frame(self.loan_file)  # a hit marks the loan frame as just used
+
+        pd.DataFrame({'Customer ID': [3], 'First Name': ['Neha'], 'Last Name': ['Sen'], 'Phone Number': [9000000003],
+                      'Monthly Salary': [60000], 'Approved Limit': [2200000]}).to_excel(self.customer_file, index=False)
+        budget = os.path.getsize(loan_entry) + os.path.getsize(customer_entry)
+        with override_settings(INGESTION_CACHE_MAX_BYTES=budget):
+            read_customer_frame(self.customer_file)
+        self.assertFalse(os.path.exists(customer_entry))
+        self.assertTrue(os.path.exists(loan_entry))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        # The newest frame is kept even when it alone is over the limit
+        self.assertEqual(prune_cache(self.cache_dir, 0, keep=loan_entry), 1)
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(loan_entry)])
+
+
+class PortfolioSummaryTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Rollup",
+            last_name="Customer",
+            age=40,
+            phone_number=9876543220,
+            monthly_salary=200000
+        )
+        # Matured loan, excluded from active exposure
+        Loan.objects.create(
+            customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10,
+            emis_paid_on_time=12, start_date=date(2015, 1, 1), end_date=date(2016, 1, 1)
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=400000, tenure=36, interest_rate=14,
+            emis_paid_on_time=10, start_date=date.today() - timedelta(days=300),
+            end_date=date.today() + timedelta(days=800)
+        )
+        rebuild_portfolio_rollups()
+
+    def test_summary_tracks_rebuild_and_create_loan(self):
+        """Test the summary reflects ingested loans and loans created through the API"""
+        response = self.client.get(reverse('portfolio_summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['active_loan_count'], 1)
+        expected = Decimal(str(round(outstanding_principal(400000, 14, 36, 10), 2)))
+        self.assertEqual(Decimal(response.data['total_outstanding_principal']), expected)
+        emi_due = Loan.objects.get(loan_amount=400000).monthly_repayment
+        self.assertEqual(Decimal(response.data['emi_due_this_month']), emi_due)
+
+        response = self.client.post(reverse('create_loan'), {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 200000,
+            'interest_rate': 9,
+            'tenure': 12
+        }, format='json')
+        self.assertTrue(response.data['loan_approved'])
+        self.assertEqual(drain_outbox(), 1)
+
+        summary = self.client.get(reverse('portfolio_summary')).data
+        self.assertEqual(summary['active_loan_count'], 2)
+        bands = {band['band']: band for band in summary['by_interest_rate_band']}
+        self.assertEqual(bands['8_to_12']['loan_count'], 1)
+        self.assertEqual(bands['12_to_16']['loan_count'], 1)
+        tenures = {band['band']: band['loan_count'] for band in summary['by_tenure_band']}
+        self.assertEqual(tenures, {'up_to_12': 1, '13_to_24': 0, '25_to_60': 1, 'over_60': 0})
+        # The new loan's first EMI is due next month
+        self.assertEqual(Decimal(summary['emi_due_this_month']), emi_due)
+        new_emi = Loan.objects.get(loan_id=response.data['loan_id']).monthly_repayment
+        next_month = portfolio_summary(today=add_months(date.today().replace(day=1), 1))
+        self.assertEqual(next_month['emi_due_this_month'], emi_due + new_emi)
+
+        # Incremental updates agree with a full rebuild
+        rebuild_portfolio_rollups()
+        self.assertEqual(self.client.get(reverse('portfolio_summary')).data, summary)
+
+
+class PostMonthlyEmisTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Billing",
+            last_name="Customer",
+            age=35,
+            phone_number=9876543230,
+            monthly_salary=100000
+        )
+        self.billing_month = date(2026, 5, 1)
+
+        def loan(**kwargs):
+            defaults = {'customer': self.customer, 'loan_amount': 100000, 'tenure': 24, 'interest_rate': 10}
+            defaults.update(kwargs)
+            return Loan.objects.create(**defaults)
+
+        self.active = [
+            loan(emis_paid_on_time=i, start_date=date(2025, 1, 10), end_date=date(2027, 1, 10))
+            for i in range(5)
+        ]
+        self.paid_off = loan(emis_paid_on_time=24, start_date=date(2025, 1, 10), end_date=date(2027, 1, 10))
+        self.matured = loan(emis_paid_on_time=3, start_date=date(2020, 1, 1), end_date=date(2022, 1, 1))
+        self.not_started = loan(emis_paid_on_time=0, start_date=date(2026, 5, 3), end_date=date(2028, 5, 3))
+
+    def test_posts_due_loans_once_per_month(self):
+        """Test EMIs are posted in batches for due loans only and re-runs are no-ops"""
+        self.assertEqual(post_emis(self.billing_month, batch_size=2), 5)
+        for i, loan in enumerate(self.active):
+            loan.refresh_from_db()
+            self.assertEqual(loan.emis_paid_on_time, i + 1)
+            self.assertEqual(loan.last_emi_posted_month, self.billing_month)
+        for loan, paid in [(self.paid_off, 24), (self.matured, 3), (self.not_started, 0)]:
+            loan.refresh_from_db()
+            self.assertEqual(loan.emis_paid_on_time, paid)
+
+        self.assertEqual(post_emis(self.billing_month, batch_size=2), 0)
+        self.assertEqual(post_emis(date(2026, 6, 15), batch_size=100), 6)
+
+
+class LoanBalanceTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Balance",
+            last_name="Customer",
+            age=45,
+            phone_number=9876543240,
+            monthly_salary=150000
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_amount=600000, tenure=36, interest_rate=12,
+            emis_paid_on_time=10, start_date=date(2025, 3, 31), end_date=date.today() + timedelta(days=365)
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=50000, tenure=6, interest_rate=0,
+            emis_paid_on_time=2, start_date=date(2026, 3, 15), end_date=date.today() + timedelta(days=60)
+        )
+
+    def test_closed_form_matches_amortization_schedule(self):
+        """Test the closed-form balance equals iterating the repayment schedule"""
+        balance = 600000.0
+        rate = 12 / 100 / 12
+        emi = float(calculate_monthly_installment(600000, 12, 36))
+        for _ in range(10):
+            balance = balance * (1 + rate) - emi
+        self.assertAlmostEqual(outstanding_principal(600000, 12, 36, 10), balance, delta=0.5)
+        self.assertEqual(outstanding_principal(600000, 12, 36, 36), 0)
+        self.assertEqual(outstanding_principal(60000, 0, 6, 2), 40000)
+
+    def test_view_loan_balance_fields(self):
+        """Test view_loan returns outstanding principal, interest remaining and next due date"""
+        response = self.client.get(reverse('view_loan', kwargs={'loan_id': self.loan.loan_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = round(outstanding_principal(600000, 12, 36, 10), 2)
+        self.assertEqual(Decimal(response.data['outstanding_principal']), Decimal(str(expected)))
+        self.assertEqual(response.data['next_due_date'], '2026-02-28')
+        remaining_payments = self.loan.monthly_repayment * 26
+        self.assertEqual(
+            Decimal(response.data['total_interest_remaining']),
+            (remaining_payments - Decimal(str(expected))).quantize(Decimal('0.01'))
+        )
+
+    def test_view_loans_database_computation_matches(self):
+        """Test balances computed in the database match the Python computation"""
+        url = reverse('view_loans', kwargs={'customer_id': self.customer.customer_id})
+        in_python = self.client.get(url).data
+        in_database = self.client.get(url, {'compute': 'db'}).data
+        self.assertEqual(len(in_python), 2)
+        self.assertEqual(in_python, in_database)
+
+
+class LoanQuoteTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Quote",
+            last_name="Customer",
+            age=38,
+            phone_number=9876543250,
+            monthly_salary=60000
+        )
+        # Late payments and high utilisation put the score at 50, so rates below 12% get corrected
+        Loan.objects.create(
+            customer=self.customer, loan_amount=1400000, tenure=24, interest_rate=11,
+            emis_paid_on_time=8, start_date=date(2019, 1, 1), end_date=date(2021, 1, 1)
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=500000, tenure=120, interest_rate=13, monthly_repayment=5000,
+            emis_paid_on_time=10, start_date=date.today() - timedelta(days=400),
+            end_date=date.today() + timedelta(days=330)
+        )
+
+    def test_quote_grid_matches_check_eligibility(self):
+        """Test every grid cell matches a separate check_eligibility call"""
+        tenures = [6, 12, 36]
+        rates = [0, 9.5, 12, 17]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('loan_quote'), {
+                'customer_id': self.customer.customer_id,
+                'loan_amount': 400000,
+                'tenures': tenures,
+                'interest_rates': rates
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['quotes']), len(tenures) * len(rates))
+
+        approvals = set()
+        for cell in response.data['quotes']:
+            expected = self.client.post(reverse('check_eligibility'), {
+                'customer_id': self.customer.customer_id,
+                'loan_amount': 400000,
+                'interest_rate': cell['interest_rate'],
+                'tenure': cell['tenure']
+            }, format='json').data
+            for key in ('approval', 'corrected_interest_rate', 'monthly_installment'):
+                self.assertEqual(cell[key], expected[key], (cell, expected))
+            approvals.add((cell['approval'], cell['corrected_interest_rate'] != cell['interest_rate']))
+        # The grid covers rejections, plain approvals and corrected rates
+        self.assertEqual(approvals, {(False, False), (True, False), (True, True)})
+
+    def test_quote_defaults_and_unknown_customer(self):
+        """Test the default grid and the unknown customer response"""
+        response = self.client.post(reverse('loan_quote'), {
+            'customer_id': self.customer.customer_id, 'loan_amount': 100000
+        }, format='json')
+        self.assertEqual(len(response.data['quotes']), 42)
+
+        response = self.client.post(reverse('loan_quote'), {'customer_id': 99999, 'loan_amount': 100000}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class MaxLoanTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Max",
+            last_name="Loan",
+            age=41,
+            phone_number=9876543260,
+            monthly_salary=80000
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=300000, tenure=36, interest_rate=12, monthly_repayment=9964.29,
+            emis_paid_on_time=12, start_date=date.today() - timedelta(days=365),
+            end_date=date.today() + timedelta(days=730)
+        )
+
+    def eligibility(self, loan_amount, interest_rate, tenure):
+        return self.client.post(reverse('check_eligibility'), {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': loan_amount,
+            'interest_rate': interest_rate,
+            'tenure': tenure
+        }, format='json').data
+
+    def test_max_loan_is_the_approval_boundary(self):
+        """Test the solved amount is approved and one paisa more is not"""
+        for tenure, rate in [(12, '10.50'), (60, '14.00'), (24, '0.00')]:
+            with self.assertNumQueries(1):
+                response = self.client.get(
+                    reverse('max_loan', args=[self.customer.customer_id]),
+                    {'tenure': tenure, 'interest_rate': rate}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['limiting_factor'], 'emi_limit')
+
+            amount = Decimal(response.data['max_loan_amount'])
+            approved = self.eligibility(str(amount), rate, tenure)
+            self.assertTrue(approved['approval'])
+            self.assertEqual(approved['monthly_installment'], response.data['monthly_installment'])
+            self.assertFalse(self.eligibility(str(amount + Decimal('0.01')), rate, tenure)['approval'])
+
+    def test_max_loan_without_headroom_and_validation(self):
+        """Test a customer with no EMI headroom, bad parameters and an unknown customer"""
+        self.customer.monthly_salary = 15000
+        self.customer.save()
+        response = self.client.get(
+            reverse('max_loan', args=[self.customer.customer_id]), {'tenure': 12, 'interest_rate': 12}
+        )
+        self.assertEqual(response.data['max_loan_amount'], '0.00')
+        self.assertEqual(response.data['limiting_factor'], 'emi_limit')
+
+        response = self.client.get(reverse('max_loan', args=[self.customer.customer_id]), {'tenure': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(reverse('max_loan', args=[99999]), {'tenure': 12, 'interest_rate': 12})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class IngestionJobTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        override = override_settings(
+            INGESTION_UPLOAD_DIR=os.path.join(self.tmpdir.name, 'uploads'),
+            INGESTION_CACHE_DIR=os.path.join(self.tmpdir.name, 'cache')
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        Customer.objects.create(
+            customer_id=1, first_name="Asha", last_name="Rao", age=30,
+            phone_number=9000000001, monthly_salary=50000
+        )
+
+    def upload(self, kind, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        with open(path, 'rb') as f, mock.patch('loans.views.process_ingestion_job.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('ingest_upload'), {'kind': kind, 'file': f}, format='multipart')
+        return response, delay
+
+    def test_upload_is_queued_and_ingested_in_chunks(self):
+        """Test an uploaded file is queued, ingested chunk by chunk and reported"""
+        content = (
+            "Customer ID,Loan ID,Loan Amount,Tenure,Interest Rate,Monthly payment,"
+            "EMIs paid on Time,Date of Approval,End Date\n"
+            "1,10,100000,12,10.5,8815,12,2020-01-15,2021-01-15\n"
+            "1,11,200000,24,12,9415,20,2021-03-01,2023-03-01\n"
+            "99,12,300000,36,14,10253,30,2019-06-10,2022-06-10\n"
+            "1,13,,36,14,10253,30,2019-06-10,2022-06-10\n"
+            "1,14,50000,6,9,8550,6,2022-01-01,2022-07-01\n"
+        )
+        response, delay = self.upload('loans', 'loans.csv', content)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], IngestionJob.PENDING)
+        delay.assert_called_once_with(str(response.data['job_id']))
+        job = IngestionJob.objects.get(job_id=response.data['job_id'])
+        self.assertTrue(os.path.exists(job.file_path))
+
+        self.assertEqual(run_ingestion_job(job.job_id, chunk_size=2), IngestionJob.COMPLETED)
+        response = self.client.get(reverse('ingestion_job', args=[job.job_id]))
+        self.assertEqual(response.data['status'], IngestionJob.COMPLETED)
+        self.assertEqual(response.data['rows_total'], 5)
+        self.assertEqual(response.data['rows_done'], 5)
+        self.assertEqual(response.data['rows_created'], 3)
+        self.assertEqual(response.data['rows_rejected'], 2)
+        self.assertEqual(Loan.objects.count(), 3)
+        self.assertFalse(os.path.exists(job.file_path))
+
+        # Finished jobs cannot be cancelled
+        response = self.client.delete(reverse('ingestion_job', args=[job.job_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_cancel_and_validation(self):
+        """Test cancelling a queued job and rejecting bad uploads"""
+        response, _ = self.upload('customers', 'customers.csv', "Customer ID,First Name\n2,Ravi\n")
+        job_id = response.data['job_id']
+        response = self.client.delete(reverse('ingestion_job', args=[job_id]))
+        self.assertEqual(response.data['status'], IngestionJob.CANCELLED)
+        self.assertEqual(run_ingestion_job(job_id), IngestionJob.CANCELLED)
+        self.assertEqual(Customer.objects.count(), 1)
+
+        # Legacy .xls needs xlrd, which is not installed
+        for name in ('customers.txt', 'customers.xls'):
+            response, delay = self.upload('customers', name, "not a spreadsheet")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('file', response.data)
+            delay.assert_not_called()
+
+        response = self.client.get(reverse('ingestion_job', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @skipUnless(apps.is_installed('django.contrib.sessions'), 'sessions are not part of the api profile')
+    def test_upload_from_session_authenticated_client(self):
+        """Test a logged-in browser session can upload, and still needs a CSRF token"""
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.client.force_login(User.objects.create_user('analyst', password='password'))
+        path = os.path.join(self.tmpdir.name, 'customers.csv')
+        with open(path, 'w') as f:
+            f.write("Customer ID,First Name\n2,Ravi\n")
+
+        with open(path, 'rb') as f:
+            response = self.client.post(reverse('ingest_upload'), {'kind': 'customers', 'file': f}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.cookies['csrftoken'] = 'a' * 32
+        with open(path, 'rb') as f, mock.patch('loans.views.process_ingestion_job.delay'):
+            response = self.client.post(
+                reverse('ingest_upload'), {'kind': 'customers', 'file': f}, format='multipart',
+                HTTP_X_CSRFTOKEN='a' * 32
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(os.path.exists(IngestionJob.objects.get(job_id=response.data['job_id']).file_path))
+
+    def test_redelivered_job_resumes_after_last_chunk(self):
+        """Test a job left running by a dead worker resumes from rows_done only when redelivered"""
+        content = (
+            "Customer ID,Loan ID,Loan Amount,Tenure,Interest Rate,Monthly payment,"
+            "EMIs paid on Time,Date of Approval,End Date\n"
+            "1,10,100000,12,10.5,8815,12,2020-01-15,2021-01-15\n"
+            "1,11,200000,24,12,9415,20,2021-03-01,2023-03-01\n"
+            "1,12,50000,6,9,8550,6,2022-01-01,2022-07-01\n"
+        )
+        response, _ = self.upload('loans', 'loans.csv', content)
+        job_id = response.data['job_id']
+        # The first chunk was recorded before the worker died
+        IngestionJob.objects.filter(job_id=job_id).update(status=IngestionJob.RUNNING, rows_done=2, rows_created=2)
+
+        self.assertEqual(run_ingestion_job(job_id, chunk_size=2), IngestionJob.RUNNING)
+        self.assertEqual(Loan.objects.count(), 0)
+
+        self.assertEqual(run_ingestion_job(job_id, chunk_size=2, resume=True), IngestionJob.COMPLETED)
+        self.assertEqual(list(Loan.objects.values_list('loan_id', flat=True)), [12])
+        job = IngestionJob.objects.get(job_id=job_id)
+        self.assertEqual((job.rows_done, job.rows_created), (3, 3))
+
+
+class CeleryQueueTest(SimpleTestCase):
+    def queue(self, name):
+        return celery_app.amqp.router.route({}, name)['queue'].name
+
+    def test_bulk_tasks_leave_the_interactive_queue(self):
+        """Test ingestion, scoring and side effect tasks are routed off the default interactive queue"""
+        self.assertEqual(self.queue('loans.tasks.process_loan_requests'), 'interactive')
+        self.assertEqual(self.queue('loans.tasks.ingest_all_data'), 'ingestion')
+        self.assertEqual(self.queue('loans.tasks.process_ingestion_job'), 'ingestion')
+        self.assertEqual(self.queue('loans.tasks.rescore_customer_range'), 'scoring')
+        self.assertEqual(self.queue('loans.tasks.post_monthly_emis'), 'scoring')
+        self.assertEqual(self.queue('loans.tasks.drain_outbox_events'), 'side_effects')
+
+    def test_chunk_tasks_ack_late_within_visibility_timeout(self):
+        """Test re-runnable chunk tasks are acknowledged late and finish before the broker redelivers them"""
+        visibility_timeout = settings.CELERY_BROKER_TRANSPORT_OPTIONS['visibility_timeout']
+        for task in (process_ingestion_job, rescore_customer_range):
+            self.assertTrue(task.acks_late)
+            self.assertTrue(task.reject_on_worker_lost)
+            self.assertLess(task.time_limit, visibility_timeout)
+        self.assertFalse(process_loan_requests.acks_late)
+
+    def test_redelivered_ingestion_message_resumes(self):
+        """Test process_ingestion_job resumes the job only for a redelivered message"""
+        with mock.patch('loans.tasks.run_ingestion_job', return_value=IngestionJob.COMPLETED) as run:
+            for delivery_info in ({}, {'redelivered': True}):
+                process_ingestion_job.push_request(delivery_info=delivery_info)
+                try:
+                    process_ingestion_job.run('job')
+                finally:
+                    process_ingestion_job.pop_request()
+        self.assertEqual(run.call_args_list, [mock.call('job', resume=False), mock.call('job', resume=True)])
+
+
+class StartupImportTest(SimpleTestCase):
+    # Generous against the ~0.3s measured locally; override on slow CI runners
+    IMPORT_TIME_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '1500'))
+    HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'openpyxl')
+
+    def test_startup_skips_heavy_imports_and_meets_budget(self):
+        """Test django.setup() plus URL loading stays off pandas/NumPy and within the import budget"""
+        code = (
+            'import django, sys; django.setup(); '
+            'from django.urls import get_resolver; get_resolver().url_patterns; '
+            f'print(",".join(m for m in {self.HEAVY_MODULES!r} if m in sys.modules))'
+        )
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertEqual(result.stdout.strip(), '')
+
+        # -X importtime lines: "import time: self | cumulative | name", top-level names unindented
+        total_us = 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            if not name.startswith('  '):
+                total_us += int(cumulative)
+        self.assertLess(total_us / 1000, self.IMPORT_TIME_BUDGET_MS)
+
+
+class ApiProfileTest(SimpleTestCase):
+    def test_api_profile_drops_admin_stack(self):
+        """Test the api deployment profile serves /api/ without the admin, session or CSRF layers"""
+        code = (
+            'import django, json; django.setup(); '
+            'from django.conf import settings; from django.test import Client; '
+            'client = Client(HTTP_HOST="localhost"); '
+            'print(json.dumps({"middleware": settings.MIDDLEWARE, "apps": settings.INSTALLED_APPS, '
+            '"api": client.get("/api/").status_code, "admin": client.get("/admin/").status_code}))'
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE, 'DJANGO_PROFILE': 'api'},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        profile = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertEqual(profile['api'], 200)
+        self.assertEqual(profile['admin'], 404)
+        self.assertNotIn('django.contrib.sessions.middleware.SessionMiddleware', profile['middleware'])
+        self.assertNotIn('django.middleware.csrf.CsrfViewMiddleware', profile['middleware'])
+        self.assertNotIn('django.contrib.admin', profile['apps'])
+        self.assertIn('loans', profile['apps'])
+
+
+class ResponseCompressionTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Gzip", last_name="Customer", age=33, phone_number=9876543270, monthly_salary=90000
+        )
+        Loan.objects.bulk_create([
+            Loan(customer=self.customer, loan_amount=100000 + i, tenure=12, interest_rate=10, monthly_repayment=8792,
+                 emis_paid_on_time=3, start_date=date.today(), end_date=date.today() + timedelta(days=365))
+            for i in range(30)
+        ])
+
+    def test_large_responses_are_compressed_for_gzip_clients(self):
+        """Test large list payloads are gzipped only when the client accepts gzip"""
+        url = reverse('view_loans', args=[self.customer.customer_id])
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+
+    def test_small_responses_skip_compression(self):
+        """Test responses under the threshold are left alone"""
+        response = self.client.post(reverse('check_eligibility'), {
+            'customer_id': self.customer.customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12
+        }, format='json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        url = reverse('view_loans', args=[self.customer.customer_id])
+        with override_settings(RESPONSE_COMPRESSION_MIN_BYTES=10 ** 6):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_responses_are_compressed(self):
+        """Test streaming responses, whose size is unknown, are compressed chunk by chunk"""
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        middleware = ThresholdGZipMiddleware(lambda request: StreamingHttpResponse(iter([b'a' * 10, b'b' * 10])))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'a' * 10 + b'b' * 10)
+
+        middleware = ThresholdGZipMiddleware(lambda request: HttpResponse(b'a' * 5000))
+        self.assertFalse(middleware(RequestFactory().get('/')).has_header('Content-Encoding'))
+
+
+class MultiLoanLookupTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                first_name=f"Lookup{i}", last_name="Customer", age=30 + i,
+                phone_number=9876543280 + i, monthly_salary=50000
+            )
+            for i in range(3)
+        ]
+        self.loans = [
+            Loan.objects.create(
+                customer=customer, loan_amount=100000 * (i + 1), tenure=12, interest_rate=10,
+                emis_paid_on_time=2, start_date=date.today(), end_date=date.today() + timedelta(days=365)
+            )
+            for i, customer in enumerate(self.customers[:2] * 2)
+        ]
+
+    def test_view_loans_for_many_customers(self):
+        """Test loans for several customers come back grouped and match view_loans"""
+        ids = [customer.customer_id for customer in self.customers] + [99999]
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('view_loans_many'), {'customer_ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['loans']), [str(i) for i in ids])
+        for customer in self.customers:
+            expected = self.client.get(reverse('view_loans', args=[customer.customer_id])).data
+            self.assertEqual(response.data['loans'][str(customer.customer_id)], expected)
+        self.assertEqual(response.data['loans']['99999'], [])
+
+    def test_view_many_loans_in_chunks(self):
+        """Test loan lookups are chunked, deduplicated and report unknown ids"""
+        ids = [loan.loan_id for loan in self.loans]
+        loan_ids = ','.join(map(str, [ids[0]] + ids + [99999]))
+        with mock.patch('loans.bulk.IN_QUERY_CHUNK_SIZE', 2), self.assertNumQueries(4):
+            response = self.client.get(reverse('view_loan_many'), {'loan_ids': loan_ids})
+        self.assertEqual(list(response.data['loans']), [str(i) for i in ids])
+        self.assertEqual(response.data['not_found'], [99999])
+        expected = self.client.get(reverse('view_loan', args=[ids[0]])).data
+        self.assertEqual(response.data['loans'][str(ids[0])], expected)
+
+        self.assertEqual(self.client.get(reverse('view_loan_many')).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(reverse('view_loan_many'), {'loan_ids': '1,x'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+
+
+class ExportTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customers = [
+            Customer.objects.create(
+                first_name=f"Export{i}", last_name="Customer", age=30 + i,
+                phone_number=9876543290 + i, monthly_salary=50000
+            )
+            for i in range(3)
+        ]
+        self.loans = [
+            Loan.objects.create(
+                customer=customer, loan_amount=100000, tenure=12, interest_rate=10,
+                emis_paid_on_time=2, start_date=date(2024, 1, 1), end_date=date(2025, 1, 1)
+            )
+            for customer in self.customers
+        ]
+
+    def read_stream(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_export_loans_csv(self):
+        """Test the loan export streams CSV and can be ingested again"""
+        response = self.client.get(reverse('export_loans'))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('loans.csv', response['Content-Disposition'])
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        export_file = os.path.join(tmpdir.name, 'loans.csv')
+        with open(export_file, 'wb') as handle:
+            handle.write(self.read_stream(response))
+        with override_settings(INGESTION_CACHE_DIR=os.path.join(tmpdir.name, 'cache')):
+            df = read_loan_frame(export_file)
+        self.assertEqual(list(df['loan_id']), [loan.loan_id for loan in self.loans])
+        self.assertEqual(list(df['customer_id']), [customer.customer_id for customer in self.customers])
+        self.assertEqual(df['start_date'].iloc[0], date(2024, 1, 1))
+
+    def test_export_customers_ndjson_since(self):
+        """Test an incremental NDJSON export only returns rows after the watermark"""
+        since = self.customers[0].customer_id
+        response = self.client.get(reverse('export_customers'), {'format': 'ndjson', 'since': since})
+        rows = [json.loads(line) for line in self.read_stream(response).decode().splitlines()]
+        self.assertEqual([row['customer_id'] for row in rows], [c.customer_id for c in self.customers[1:]])
+        self.assertEqual(rows[0]['first_name'], 'Export1')
+        self.assertEqual(rows[0]['monthly_salary'], '50000.00')
+
+    def test_export_loans_xlsx(self):
+        """Test the xlsx export is a workbook with a header row and every loan"""
+        response = self.client.get(reverse('export_loans'), {'format': 'xlsx'})
+        df = pd.read_excel(io.BytesIO(self.read_stream(response)))
+        self.assertEqual(list(df['loan_id']), [loan.loan_id for loan in self.loans])
+
+    def test_export_loans_includes_archive(self):
+        """Test archived loans stay in the loan export, merged in loan_id order"""
+        Loan.objects.filter(pk__in=[loan.pk for loan in self.loans[1:]]).update(
+            end_date=date.today() + timedelta(days=365)
+        )
+        self.assertEqual(archive_matured_loans(), 1)
+        response = self.client.get(reverse('export_loans'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in self.read_stream(response).decode().splitlines()]
+        self.assertEqual([row['loan_id'] for row in rows], [loan.loan_id for loan in self.loans])
+        self.assertEqual(rows[0]['end_date'], '2025-01-01')
+
+        response = self.client.get(reverse('export_loans'), {'format': 'ndjson', 'since': self.loans[0].loan_id})
+        rows = [json.loads(line) for line in self.read_stream(response).decode().splitlines()]
+        self.assertEqual([row['loan_id'] for row in rows], [loan.loan_id for loan in self.loans[1:]])
+
+    def test_export_rejects_invalid_query(self):
+        """Test unknown formats and negative watermarks are rejected"""
+        self.assertEqual(
+            self.client.get(reverse('export_loans'), {'format': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.get(reverse('export_loans'), {'since': -1}).status_code, status.HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(
+            self.client.post(reverse('export_loans')).status_code, status.HTTP_405_METHOD_NOT_ALLOWED
+        )
+
+
+class LoanArchiveTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Archive", last_name="Customer", age=40, phone_number=9876543300, monthly_salary=50000
+        )
+        year_start = date(date.today().year, 1, 1)
+        self.matured = [
+            Loan.objects.create(
+                customer=self.customer, loan_amount=amount, tenure=12, interest_rate=10, emis_paid_on_time=paid,
+                start_date=date(year_start.year - 3, 1, 1), end_date=date(year_start.year - 2, 1, 1)
+            )
+            for amount, paid in ((200000, 12), (300000, 3))
+        ]
+        self.active = [
+            Loan.objects.create(
+                customer=self.customer, loan_amount=100000, tenure=24, interest_rate=10, emis_paid_on_time=2,
+                start_date=date.today(), end_date=date.today() + timedelta(days=730)
+            ),
+            Loan.objects.create(
+                customer=self.customer, loan_amount=150000, tenure=12, interest_rate=10,
+                start_date=year_start, end_date=year_start.replace(month=12, day=31)
+            ),
+        ]
+
+    def check_eligibility(self):
+        return self.client.post(reverse('check_eligibility'), {
+            'customer_id': self.customer.customer_id, 'loan_amount': 100000, 'interest_rate': 10, 'tenure': 12
+        }, format='json').data
+
+    def test_archive_keeps_scores_unchanged(self):
+        """Test archived loans leave the hot table but still count towards the credit score"""
+        score = calculate_credit_score(self.customer)
+        self.assertEqual(score, 65)  # 60 if the archived loans were dropped
+        eligibility = self.check_eligibility()
+
+        self.assertEqual(archive_matured_loans(batch_size=1), 2)
+        self.assertEqual(archive_matured_loans(), 0)
+        self.assertEqual(
+            set(Loan.objects.values_list('loan_id', flat=True)), {loan.loan_id for loan in self.active}
+        )
+        self.assertEqual(
+            set(ArchivedLoan.objects.values_list('loan_id', flat=True)), {loan.loan_id for loan in self.matured}
+        )
+        history = LoanHistory.objects.get(customer=self.customer)
+        self.assertEqual((history.total_loans, history.loans_sum, history.paid_on_time), (2, Decimal('500000'), 1))
+
+        self.assertEqual(calculate_credit_score(Customer.objects.get(pk=self.customer.pk)), score)
+        self.assertEqual(self.check_eligibility(), eligibility)
+
+    def test_archived_loans_stay_visible_and_are_not_ingested_again(self):
+        """Test an archived loan can still be viewed and is skipped when its file is ingested again"""
+        archive_matured_loans()
+        loan = self.matured[0]
+        response = self.client.get(reverse('view_loan', args=[loan.loan_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['customer']['id'], self.customer.customer_id)
+        self.assertEqual(response.data['next_due_date'], None)
+
+        df = pd.DataFrame([{field: getattr(loan, field) for field in LOAN_FIELDS}])
+        self.assertEqual(upsert_loans(df), (0, 0, 1))
+        self.assertFalse(Loan.objects.filter(loan_id=loan.loan_id).exists())
+
+    def test_archived_loans_are_found_by_bulk_lookup(self):
+        """Test the bulk loan lookup falls back to the archive for ids not in the loans table"""
+        archive_matured_loans()
+        ids = [self.matured[0].loan_id, self.active[0].loan_id, 99999]
+        response = self.client.get(reverse('view_loan_many'), {'loan_ids': ','.join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['loans']), [str(i) for i in ids[:2]])
+        self.assertEqual(response.data['not_found'], [99999])
+        expected = self.client.get(reverse('view_loan', args=[ids[0]])).data
+        self.assertEqual(response.data['loans'][str(ids[0])], expected)
+
+    def test_new_loans_never_reuse_archived_ids(self):
+        """Test re-ingesting the remaining loans keeps the id sequence above the archived ones"""
+        # e.g. a loan ingested with an explicit id
+        Loan.objects.create(loan_id=500, **{
+            field: getattr(self.matured[1], field) for field in ARCHIVED_FIELDS if field != 'loan_id'
+        })
+        archive_matured_loans()
+        self.assertTrue(ArchivedLoan.objects.filter(loan_id=500).exists())
+
+        df = pd.DataFrame([{field: getattr(loan, field) for field in LOAN_FIELDS} for loan in self.active])
+        self.assertEqual(upsert_loans(df), (0, 2, 0))
+        loan = Loan.objects.create(
+            customer=self.customer, loan_amount=50000, tenure=6, interest_rate=10,
+            start_date=date.today(), end_date=date.today() + timedelta(days=180)
+        )
+        self.assertGreater(loan.loan_id, 500)
+
+    def test_loan_written_into_a_batchs_id_range_is_not_lost(self):
+        """Test a matured loan committed between a batch's read and delete stays for the next run"""
+        # Leave a gap in the ids of the batch
+        low = self.matured[0].loan_id
+        Loan.objects.filter(pk=self.matured[1].pk).update(loan_id=low + 10)
+        late = {field: getattr(self.matured[0], field) for field in ARCHIVED_FIELDS if field != 'loan_id'}
+
+        def ingest_during_batch(loans, using='default'):
+            # e.g. ingestion inserting a loan with an explicit id
+            Loan.objects.create(loan_id=low + 1, **late)
+            return add_to_history(loans, using=using)
+
+        with mock.patch('loans.archive.add_to_history', side_effect=ingest_during_batch):
+            self.assertEqual(archive_matured_loans(), 2)
+        self.assertTrue(Loan.objects.filter(loan_id=low + 1).exists())
+
+        self.assertEqual(archive_matured_loans(), 1)
+        self.assertEqual(LoanHistory.objects.get(customer=self.customer).total_loans, 3)
+
+    def test_cutoff_cannot_include_current_year(self):
+        """Test loans that ended this year cannot be archived yet"""
+        with self.assertRaises(ValueError):
+            archive_matured_loans(before=date.today() + timedelta(days=366))
+
+
+# Run in a subprocess with DB_SHARD_COUNT=3: the shard aliases only exist
+# when settings are loaded with it, and every alias gets its own in-memory
+# SQLite test database
+SHARDING_SCENARIO = """
+import django, json
+from unittest import mock
+django.setup()
+from django.conf import settings
+from django.test import Client
+from django.test.utils import setup_databases, setup_test_environment
+setup_test_environment()
+setup_databases(verbosity=0, interactive=False)
+
+import pandas as pd
+from loans.ingestion import upsert_customers
+from loans.loan_requests import process_queued_loan_requests
+from loans.models import Customer, Loan
+from loans.outbox import drain_outbox
+from loans.sharding import fan_out, shard_for_customer
+
+client = Client(HTTP_HOST="localhost")
+result = {"shards": settings.SHARD_DATABASES}
+customers = client.post("/api/register/bulk/", [
+    {"first_name": f"Shard{i}", "last_name": "Customer", "age": 30, "monthly_income": 90000,
+     "phone_number": 9700000000 + i}
+    for i in range(5)
+], content_type="application/json").json()
+ids = [customer["customer_id"] for customer in customers]
+result["customer_ids"] = ids
+result["customers_on_shard"] = {alias: list(Customer.objects.using(alias).values_list("pk", flat=True))
+                                for alias in settings.SHARD_DATABASES}
+again = client.post("/api/register/", {"first_name": "Again", "last_name": "Customer", "age": 30,
+                    "monthly_income": 90000, "phone_number": 9700000002}, content_type="application/json")
+result["duplicate"] = [again.status_code, again.json()["customer_id"]]
+
+loan_ids = []
+for customer_id in ids:
+    response = client.post("/api/create-loan/", {"customer_id": customer_id, "loan_amount": 100000,
+                           "interest_rate": 14, "tenure": 12}, content_type="application/json").json()
+    loan_ids.append(response["loan_id"])
+result["loan_ids"] = loan_ids
+result["loan_shards_match"] = all(
+    Loan.objects.using(shard_for_customer(customer_id)).filter(loan_id=loan_id, customer_id=customer_id).exists()
+    for customer_id, loan_id in zip(ids, loan_ids)
+)
+result["eligibility"] = client.post("/api/check-eligibility/", {"customer_id": ids[2], "loan_amount": 100000,
+                                    "interest_rate": 14, "tenure": 12}, content_type="application/json").status_code
+result["view_loan"] = client.get(f"/api/view-loan/{loan_ids[1]}/").json()["customer"]["id"]
+result["view_loans"] = [len(client.get(f"/api/view-loans/{customer_id}/").json()) for customer_id in ids]
+many = client.get("/api/view-loans/", {"customer_ids": ",".join(map(str, ids))}).json()["loans"]
+result["view_loans_many"] = [len(many[str(customer_id)]) for customer_id in ids]
+found = client.get("/api/view-loan/", {"loan_ids": ",".join(map(str, loan_ids))}).json()
+result["view_loan_many"] = [len(found["loans"]), found["not_found"]]
+export = client.get("/api/export/customers/", {"format": "ndjson"})
+result["export_ids"] = [json.loads(line)["customer_id"] for line in b"".join(export.streaming_content).splitlines()]
+
+fan_out(drain_outbox)
+result["portfolio_loans"] = client.get("/api/portfolio/summary/").json()["active_loan_count"]
+
+with mock.patch("loans.views.process_loan_requests.delay"):  # no broker here; processed below
+    ticket = client.post("/api/create-loan/?mode=async", {"customer_id": ids[1], "loan_amount": 50000,
+                         "interest_rate": 14, "tenure": 6}, content_type="application/json").json()["ticket_id"]
+result["requests_processed"] = sum(fan_out(process_queued_loan_requests))
+result["request_status"] = client.get(f"/api/loan-requests/{ticket}/").json()["status"]
+
+upsert_customers(pd.DataFrame([{
+    "customer_id": 100, "first_name": "Ingested", "last_name": "Customer", "age": 40,
+    "phone_number": 9700000100, "monthly_salary": 50000, "approved_limit": 1800000, "current_debt": 0,
+}]))
+result["ingested_on"] = [alias for alias in settings.SHARD_DATABASES
+                         if Customer.objects.using(alias).filter(pk=100).exists()]
+result["next_id"] = client.post("/api/register/", {"first_name": "Next", "last_name": "Customer", "age": 30,
+                                "monthly_income": 90000, "phone_number": 9700000200},
+                                content_type="application/json").json()["customer_id"]
+
+# Another caller creates a table's sequence row just after this caller found none
+from django.db.models import QuerySet
+from loans.models import IdSequence
+from loans.sharding import allocate_ids, highest_id
+IdSequence.objects.filter(name=Customer._meta.db_table).delete()
+get = QuerySet.get
+def racing_get(queryset, *args, **kwargs):
+    if queryset.model is IdSequence and not IdSequence.objects.filter(name=Customer._meta.db_table).exists():
+        IdSequence.objects.create(name=Customer._meta.db_table, next_value=highest_id(Customer) + 1)
+        result["raced"] = True
+        raise IdSequence.DoesNotExist
+    return get(queryset, *args, **kwargs)
+with mock.patch.object(QuerySet, "get", racing_get):
+    result["racing_ids"] = allocate_ids(Customer, 2)
+
+# The admin allocates ids for new customers and saves them on their shard
+from django.core.management import CommandError, call_command
+if "django.contrib.admin" in settings.INSTALLED_APPS:
+    from django.contrib.auth.models import User
+    client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+    client.post("/admin/loans/customer/add/", {"first_name": "Admin", "last_name": "Customer", "age": 30,
+                "phone_number": 9700000300, "monthly_salary": 50000, "approved_limit": 0, "current_debt": 0})
+result["admin_customer_on"] = [alias for alias in settings.SHARD_DATABASES
+                               if Customer.objects.using(alias).filter(phone_number=9700000300).exists()]
+result["admin_customer_id"] = [Customer.objects.using(alias).get(phone_number=9700000300).pk
+                               for alias in result["admin_customer_on"]]
+try:
+    call_command("generate_portfolio", "--customers", "10", "--loans", "0")
+except CommandError as e:
+    result["generate_portfolio"] = str(e)
+
+# Customers on the other shards count as existing data even when shard 0 is empty
+import io
+Customer.objects.using("default").all().delete()
+output = io.StringIO()
+call_command("ingest_data", stdout=output)
+result["ingest_data"] = output.getvalue().strip()
+print(json.dumps(result))
+"""
+
+
+class ShardingTest(SimpleTestCase):
+    def test_customers_and_loans_stay_on_their_shard(self):
+        """Test three stand-in shards route registration, loans, lookups, reports and ingestion by customer_id"""
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'Alemeno_RESt_API.settings', 'DB_SHARD_COUNT': '3'}
+        env.pop('PGPASSWORD', None)  # SQLite shards
+        result = subprocess.run(
+            [sys.executable, '-c', SHARDING_SCENARIO], capture_output=True, text=True, cwd=settings.BASE_DIR, env=env
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        outcome = json.loads(result.stdout.strip().splitlines()[-1])
+
+        shards = outcome['shards']
+        self.assertEqual(shards, ['default', 'shard_1', 'shard_2'])
+        ids = outcome['customer_ids']
+        self.assertEqual(len(set(ids)), 5)
+        for alias, customer_ids in outcome['customers_on_shard'].items():
+            self.assertEqual(sorted(customer_ids), sorted(i for i in ids if shards[i % 3] == alias))
+            self.assertTrue(customer_ids)
+        self.assertEqual(outcome['duplicate'], [200, ids[2]])
+
+        self.assertEqual(len(set(outcome['loan_ids'])), 5)
+        self.assertTrue(outcome['loan_shards_match'])
+        self.assertEqual(outcome['eligibility'], 200)
+        self.assertEqual(outcome['view_loan'], ids[1])
+        self.assertEqual(outcome['view_loans'], [1] * 5)
+        self.assertEqual(outcome['view_loans_many'], [1] * 5)
+        self.assertEqual(outcome['view_loan_many'], [5, []])
+        self.assertEqual(outcome['export_ids'], sorted(ids))
+        self.assertEqual(outcome['portfolio_loans'], 5)
+        self.assertEqual(outcome['requests_processed'], 1)
+        self.assertEqual(outcome['request_status'], 'approved')
+
+        self.assertEqual(outcome['ingested_on'], [shards[100 % 3]])
+        self.assertEqual(outcome['next_id'], 101)
+        self.assertTrue(outcome['raced'])
+        self.assertEqual(outcome['racing_ids'], [102, 103])
+        if apps.is_installed('django.contrib.admin'):
+            self.assertEqual(outcome['admin_customer_id'], [104])
+            self.assertEqual(outcome['admin_customer_on'], [shards[104 % 3]])
+        self.assertIn('DB_SHARD_COUNT=1', outcome['generate_portfolio'])
+        self.assertEqual(outcome['ingest_data'], 'Data already exists. Skipping ingestion.')
+
+
+class PortfolioRescoreTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        today = date.today()
+        self.customers = []
+        # (monthly_salary, [(loan_amount, tenure, emis_paid_on_time, start_date), ...])
+        profiles = [
+            (50000, []),
+            (50000, [(300000, 12, 12, date(2020, 1, 1)), (200000, 24, 5, today)]),
+            (50000, [(1440000, 12, 12, date(2021, 1, 1))]),  # exactly 80% of the approved limit
+            (20000, [(900000, 12, 0, today)]),  # over the approved limit
+            (80000, [(100000, 6, 6, date(2019, 1, 1))] * 3 + [(50000, 12, 1, today)] * 4),
+        ]
+        for i, (salary, loans) in enumerate(profiles):
+            customer = Customer.objects.create(
+                first_name=f"Rescore{i}", last_name="Customer", age=30, phone_number=9876543400 + i,
+                monthly_salary=salary
+            )
+            for loan_amount, tenure, paid, start_date in loans:
+                Loan.objects.create(
+                    customer=customer, loan_amount=loan_amount, tenure=tenure, interest_rate=12,
+                    emis_paid_on_time=paid, start_date=start_date, end_date=start_date + timedelta(days=30 * tenure)
+                )
+            self.customers.append(customer)
+        LoanHistory.objects.create(customer=self.customers[1], total_loans=3, loans_sum=400000, paid_on_time=2)
+
+    def test_array_scores_match_scalar_scores(self):
+        """Test the vectorised scorer gives exactly the scores of credit_score_from_stats"""
+        cases = list(itertools.product(
+            [Decimal('1000000'), Decimal('1800000')],
+            [0, 1, 3, 4, 6, 7],
+            [Decimal('0'), Decimal('500000'), Decimal('900000'), Decimal('900000.01'),
+             Decimal('1440000'), Decimal('1440000.01'), Decimal('1800000'), Decimal('1800000.01')],
+            [0, 1, 2],
+            [0, 2, 3, 4, 5],
+        ))
+        scores = credit_scores_from_arrays(
+            [int(case[0] * 100) for case in cases], [case[1] for case in cases],
+            [int(case[2] * 100) for case in cases], [min(case[3], case[1]) for case in cases],
+            [case[4] for case in cases],
+        )
+        for (limit, total, loans_sum, paid, current_year), score in zip(cases, scores):
+            self.assertEqual(score, credit_score_from_stats(limit, total, loans_sum, min(paid, total), current_year))
+
+    def test_rescore_snapshot_matches_credit_score(self):
+        """Test every customer is scored into the snapshot as calculate_credit_score would, and re-runs replace it"""
+        self.assertEqual(rescore_portfolio(workers=1, range_size=2), len(self.customers))
+        snapshot = dict(
+            CreditScoreSnapshot.objects.filter(snapshot_date=date.today()).values_list('customer_id', 'credit_score')
+        )
+        expected = {customer.customer_id: calculate_credit_score(customer) for customer in self.customers}
+        self.assertEqual(snapshot, expected)
+        self.assertEqual(len(set(expected.values())), len(expected))
+
+        self.assertEqual(rescore_portfolio(workers=1, range_size=3), len(self.customers))
+        self.assertEqual(CreditScoreSnapshot.objects.count(), len(self.customers))
+
+    def test_rescore_command(self):
+        """Test the management command writes a snapshot for the requested date"""
+        out = StringIO()
+        call_command('rescore_portfolio', '--workers', '1', '--date', '2024-06-30', stdout=out)
+        self.assertIn(f'Scored {len(self.customers)} customers', out.getvalue())
+        self.assertEqual(
+            CreditScoreSnapshot.objects.filter(snapshot_date=date(2024, 6, 30)).count(), len(self.customers)
+        )
+
+
+class RequestCoalescingTest(SimpleTestCase):
+    def run_concurrently(self, count, target):
+        results = [None] * count
+
+        def run(index):
+            try:
+                results[index] = target()
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def wait_for_waiters(self, flight, key, count):
+        for _ in range(500):
+            call = flight._calls.get(key)
+            if call is not None and call.waiters == count:
+                return
+            time.sleep(0.01)
+        self.fail(f"{count} callers never joined the flight")
+
+    def test_concurrent_callers_share_one_run(self):
+        """Test callers arriving while a key is running get the leader's result instead of running again"""
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'approval': True}
+
+        threads, results = self.run_concurrently(5, lambda: flight.do('key', compute))
+        self.wait_for_waiters(flight, 'key', 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'approval': True}] * 5)
+        self.assertEqual(flight._calls, {})
+
+        # Nothing is cached once the flight lands
+        self.assertEqual(flight.do('key', compute), {'approval': True})
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_reach_every_waiter(self):
+        """Test an exception in the leader is raised to the callers that waited for it"""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def compute():
+            release.wait(5)
+            raise RuntimeError("scoring failed")
+
+        threads, results = self.run_concurrently(3, lambda: flight.do('key', compute))
+        self.wait_for_waiters(flight, 'key', 2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(flight._calls, {})
+
+    def test_different_keys_run_separately(self):
+        """Test only callers with the same key are coalesced"""
+        flight = SingleFlight()
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+        self.assertEqual(flight.do('b', lambda: 2), 2)
+
+    def test_cache_follower_gets_leaders_result(self):
+        """Test a caller that finds the cache lock taken waits for the leader's shared result"""
+        cache.add('single-flight:lock:shared', True, timeout=5)
+        calls = []
+
+        def leader_finishes():
+            time.sleep(0.05)
+            cache.set('single-flight:result:shared', ('from leader',), timeout=5)
+            cache.delete('single-flight:lock:shared')
+
+        threading.Thread(target=leader_finishes).start()
+        result = cache_single_flight('shared', lambda: calls.append(1) or 'computed', timeout=2)
+        self.assertEqual(result, 'from leader')
+        self.assertEqual(calls, [])
+
+        # The next leader clears the old result before computing its own
+        self.assertEqual(cache_single_flight('shared', lambda: 'computed', timeout=2), 'computed')
+
+    def test_cache_follower_computes_when_leader_fails(self):
+        """Test a follower runs the function itself once the lock goes away without a result"""
+        cache.add('single-flight:lock:failed', True, timeout=5)
+        threading.Timer(0.05, cache.delete, args=['single-flight:lock:failed']).start()
+        self.assertEqual(cache_single_flight('failed', lambda: 'computed', timeout=2), 'computed')
+
+    @override_settings(REQUEST_COALESCING='local')
+    def test_concurrent_eligibility_checks_share_one_computation(self):
+        """Test identical check_eligibility requests in flight together compute the decision once"""
+        release = threading.Event()
+        decision = {
+            'customer_id': 1, 'approval': True, 'interest_rate': 12.0, 'corrected_interest_rate': 12.0,
+            'tenure': 12, 'monthly_installment': 8884.88,
+        }
+
+        def compute(*args):
+            release.wait(5)
+            return decision
+
+        payload = {'customer_id': 1, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+        with mock.patch('loans.views.eligibility_decision', side_effect=compute) as eligibility_decision:
+            threads, results = self.run_concurrently(
+                4, lambda: self.client.post(reverse('check_eligibility'), payload, content_type='application/json')
+            )
+            self.wait_for_waiters(coalescing._flights, 'eligibility:1:100000.00:12.00:12', 3)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(eligibility_decision.call_count, 1)
+        for response in results:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.json()['approval'])
+
+
+class OutboxTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name="Outbox", last_name="Customer", age=36, phone_number=9876543290, monthly_salary=90000
+        )
+
+    def create_loan(self, loan_amount=100000):
+        response = self.client.post(reverse('create_loan'), {
+            'customer_id': self.customer.customer_id, 'loan_amount': loan_amount, 'interest_rate': 14, 'tenure': 12
+        }, format='json')
+        self.assertTrue(response.data['loan_approved'])
+        return response.data['loan_id']
+
+    def test_create_loan_publishes_event_applied_once(self):
+        """Test create_loan records an outbox event that the drainer applies exactly once"""
+        loan_id = self.create_loan()
+        event = OutboxEvent.objects.get()
+        self.assertEqual((event.event_type, event.aggregate_id), (OutboxEvent.LOAN_CREATED, loan_id))
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(self.client.get(reverse('portfolio_summary')).data['active_loan_count'], 0)
+
+        # A rebuild while the event is pending leaves the loan to the drainer
+        rebuild_portfolio_rollups()
+        self.assertEqual(drain_outbox(), 1)
+        self.assertEqual(drain_outbox(), 0)
+        self.assertEqual(self.client.get(reverse('portfolio_summary')).data['active_loan_count'], 1)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+
+    def test_failing_handler_is_retried_without_blocking_others(self):
+        """Test a failing event stays pending while later events are processed"""
+        first_id = self.create_loan()
+        second_id = self.create_loan(200000)
+
+        def flaky(event, using='default'):
+            if event.aggregate_id == first_id:
+                raise RuntimeError("notification service down")
+
+        with mock.patch.dict(HANDLERS, {OutboxEvent.LOAN_CREATED: HANDLERS[OutboxEvent.LOAN_CREATED] + [flaky]}):
+            self.assertEqual(drain_outbox(batch_size=1), 1)
+        failed = OutboxEvent.objects.get(aggregate_id=first_id)
+        self.assertIsNone(failed.processed_at)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('notification service down', failed.last_error)
+        # The failed event's rollup update was rolled back with it
+        self.assertEqual(self.client.get(reverse('portfolio_summary')).data['active_loan_count'], 1)
+        self.assertIsNotNone(OutboxEvent.objects.get(aggregate_id=second_id).processed_at)
+
+        self.assertEqual(drain_outbox(), 1)
+        self.assertEqual(self.client.get(reverse('portfolio_summary')).data['active_loan_count'], 2)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs table locks')
+class ConcurrentRollupTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_rebuild_waits_for_an_outbox_handler_in_flight(self):
+        """Test a rebuild overlapping a drained LOAN_CREATED event keeps that loan in the rollups"""
+        customer = Customer.objects.create(
+            first_name="Rollup", last_name="Customer", age=40, phone_number=9876543360, monthly_salary=90000
+        )
+        loan, _ = [
+            Loan.objects.create(
+                customer=customer, loan_amount=100000, tenure=12, interest_rate=14, monthly_repayment=8979,
+                start_date=date.today(), end_date=date.today() + timedelta(days=365)
+            )
+            for _ in range(2)
+        ]
+        rebuild_portfolio_rollups()
+        event = OutboxEvent.objects.create(event_type=OutboxEvent.LOAN_CREATED, aggregate_id=loan.loan_id)
+        recorded, release = threading.Event(), threading.Event()
+
+        def drainer():
+            # The handler has run but its batch has not committed yet
+            try:
+                with transaction.atomic():
+                    for handler in HANDLERS[OutboxEvent.LOAN_CREATED]:
+                        handler(event)
+                    OutboxEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
+                    recorded.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def rebuild():
+            try:
+                rebuild_portfolio_rollups()
+            finally:
+                connection.close()
+
+        draining = threading.Thread(target=drainer)
+        draining.start()
+        self.assertTrue(recorded.wait(5))
+        rebuilding = threading.Thread(target=rebuild)
+        rebuilding.start()
+        rebuilding.join(0.3)
+        self.assertTrue(rebuilding.is_alive())
+        release.set()
+        draining.join()
+        rebuilding.join(5)
+
+        self.assertEqual(sum(PortfolioRollup.objects.values_list('loan_count', flat=True)), 2)
+
+
+class AsyncLoanRequestTest(DRFTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        # Twin customers: one served synchronously, one through the queue
+        self.sync_customer, self.async_customer = [
+            Customer.objects.create(
+                first_name=f"Async{i}", last_name="Customer", age=29, phone_number=9876543300 + i,
+                monthly_salary=60000
+            )
+            for i in range(2)
+        ]
+        self.requests = [
+            {'loan_amount': 130000, 'interest_rate': 14, 'tenure': 12},
+            {'loan_amount': 130000, 'interest_rate': 14, 'tenure': 12},
+            {'loan_amount': 130000, 'interest_rate': 14, 'tenure': 12},
+            {'loan_amount': 20000, 'interest_rate': 14, 'tenure': 12},
+        ]
+
+    def enqueue(self, customer_id, body):
+        with mock.patch('loans.views.process_loan_requests.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('create_loan') + '?mode=async', {'customer_id': customer_id, **body}, format='json'
+                )
+        return response, delay
+
+    def test_queued_requests_match_synchronous_decisions(self):
+        """Test batched decisions equal sending the same requests one by one synchronously"""
+        tickets = []
+        for body in self.requests:
+            response, delay = self.enqueue(self.async_customer.customer_id, body)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['status'], LoanRequest.QUEUED)
+            self.assertIsNone(response.data['loan_approved'])
+            delay.assert_called_once_with()
+            tickets.append(response.data['ticket_id'])
+        self.assertEqual(Loan.objects.filter(customer=self.async_customer).count(), 0)
+
+        # Savepoint, queued requests, customer lock, customer stats, loans, outbox events, request updates, release
+        with self.assertNumQueries(8):
+            self.assertEqual(process_queued_loan_requests(), 4)
+
+        for ticket, body in zip(tickets, self.requests):
+            queued = self.client.get(reverse('loan_request_status', args=[ticket])).data
+            sync = self.client.post(
+                reverse('create_loan'), {'customer_id': self.sync_customer.customer_id, **body}, format='json'
+            ).data
+            self.assertEqual(queued['loan_approved'], sync['loan_approved'])
+            self.assertEqual(queued['message'], sync['message'])
+            self.assertEqual(queued['monthly_installment'], sync['monthly_installment'])
+            self.assertEqual(queued['loan_id'] is None, sync['loan_id'] is None)
+        # Third 130k request breaks the EMI cap; the small one still fits
+        approvals = [
+            self.client.get(reverse('loan_request_status', args=[ticket])).data['loan_approved'] for ticket in tickets
+        ]
+        self.assertEqual(approvals, [True, True, False, True])
+        self.assertEqual(
+            OutboxEvent.objects.filter(payload__customer_id=self.async_customer.customer_id).count(), 3
+        )
+        self.assertEqual(process_queued_loan_requests(), 0)
+
+    def test_later_batch_sees_earlier_batches_loans(self):
+        """Test a customer's requests split over two batches are decided as if in one"""
+        tickets = [self.enqueue(self.async_customer.customer_id, body)[0].data['ticket_id'] for body in self.requests]
+        self.assertEqual(process_queued_loan_requests(batch_size=2), 4)
+        approvals = [
+            self.client.get(reverse('loan_request_status', args=[ticket])).data['loan_approved'] for ticket in tickets
+        ]
+        self.assertEqual(approvals, [True, True, False, True])
+
+    def test_ticket_keeps_loan_id_after_archiving(self):
+        """Test an approved request still reports its loan once the loan is archived"""
+        ticket = self.enqueue(self.async_customer.customer_id, self.requests[0])[0].data['ticket_id']
+        process_queued_loan_requests()
+        loan_id = self.client.get(reverse('loan_request_status', args=[ticket])).data['loan_id']
+        Loan.objects.filter(loan_id=loan_id).update(start_date=date(2019, 1, 1), end_date=date(2020, 1, 1))
+        self.assertEqual(archive_matured_loans(), 1)
+
+        response = self.client.get(reverse('loan_request_status', args=[ticket]))
+        self.assertEqual(response.data['loan_id'], loan_id)
+        self.assertTrue(response.data['loan_approved'])
+
+    def test_async_validation_and_unknown_ticket(self):
+        """Test async mode still validates input and the status endpoint 404s on unknown tickets"""
+        response, delay = self.enqueue(99999, self.requests[0])
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response, delay = self.enqueue(self.async_customer.customer_id, {'loan_amount': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        delay.assert_not_called()
+
+        response = self.client.get(reverse('loan_request_status', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs advisory locks')
+class ConcurrentRegistrationTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_double_submit_returns_the_first_registration(self):
+        """Test a registration waits for one in flight with the same phone number and returns its customer"""
+        phone_number = 9876543370
+        locked, release = threading.Event(), threading.Event()
+        first = {}
+        second = {}
+
+        def first_registration():
+            # Stands in for a registration that has looked the number up and is inserting it
+            try:
+                with transaction.atomic():
+                    lock_phone_numbers([phone_number])
+                    locked.set()
+                    release.wait(5)
+                    first['customer'] = Customer.objects.create(
+                        first_name="First", last_name="Submit", age=30, phone_number=phone_number,
+                        monthly_salary=50000
+                    )
+            finally:
+                connection.close()
+
+        def second_registration():
+            try:
+                second['response'] = self.client.post(reverse('register_customer'), {
+                    'first_name': 'First', 'last_name': 'Submit', 'age': 30, 'monthly_income': 50000,
+                    'phone_number': phone_number
+                }, content_type='application/json')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first_registration), threading.Thread(target=second_registration)]
+        threads[0].start()
+        self.assertTrue(locked.wait(5))
+        threads[1].start()
+        threads[1].join(0.3)
+        self.assertTrue(threads[1].is_alive())
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(second['response'].status_code, status.HTTP_200_OK)
+        self.assertEqual(second['response'].json()['customer_id'], first['customer'].customer_id)
+        self.assertEqual(Customer.objects.filter(phone_number=phone_number).count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks')
+class ConcurrentLoanRequestTest(TransactionTestCase):
+    databases = '__all__'
+
+    def test_batch_waits_for_another_batch_of_the_same_customer(self):
+        """Test a batch waits for a concurrent batch holding its customer and counts that batch's loans"""
+        customer = Customer.objects.create(
+            first_name="Locked", last_name="Customer", age=29, phone_number=9876543350, monthly_salary=60000
+        )
+        LoanRequest.objects.create(customer=customer, loan_amount=130000, interest_rate=14, tenure=12)
+        locked, release = threading.Event(), threading.Event()
+
+        def first_batch():
+            # Stands in for a worker that locked the customer and approved a loan it has not committed yet
+            try:
+                with transaction.atomic():
+                    Customer.objects.select_for_update().get(pk=customer.pk)
+                    Loan.objects.create(
+                        customer_id=customer.pk, loan_amount=100000, tenure=12, interest_rate=14,
+                        monthly_repayment=25000, start_date=date.today(), end_date=date.today() + timedelta(days=365)
+                    )
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        def second_batch():
+            try:
+                process_queued_loan_requests()
+            finally:
+                connection.close()
+
+        first = threading.Thread(target=first_batch)
+        first.start()
+        self.assertTrue(locked.wait(5))
+        second = threading.Thread(target=second_batch)
+        second.start()
+        second.join(0.3)
+        self.assertTrue(second.is_alive())
+        release.set()
+        first.join()
+        second.join(5)
+
+        loan_request = LoanRequest.objects.get()
+        self.assertEqual(loan_request.status, LoanRequest.REJECTED)
+        self.assertIn('EMI', loan_request.message)
+
+
+@skipUnless(apps.is_installed('django.contrib.admin'), 'admin is not part of the api profile')
+class LoanAdminTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin_user)
+        self.customer = Customer.objects.create(
+            first_name="Admin", last_name="Customer", age=45, phone_number=9876543310, monthly_salary=70000
+        )
+
+    def add_loans(self, count, interest_rate=10):
+        other = Customer.objects.create(
+            first_name="Other", last_name="Customer", age=45, phone_number=9876543311, monthly_salary=70000
+        )
+        Loan.objects.bulk_create([
+            Loan(customer=self.customer if i % 2 else other, loan_amount=100000, tenure=12,
+                 interest_rate=interest_rate, monthly_repayment=8792,
+                 start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+            for i in range(count)
+        ])
+
+    def changelist_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:loans_loan_changelist'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Test customers are joined instead of fetched per row"""
+        self.add_loans(2)
+        baseline = self.changelist_queries()
+        self.add_loans(20)
+        self.assertEqual(self.changelist_queries(), baseline)
+
+    def test_rate_band_filter_and_id_search(self):
+        """Test the rate band filter and exact id search"""
+        self.add_loans(2, interest_rate=10)
+        self.add_loans(3, interest_rate=17)
+        url = reverse('admin:loans_loan_changelist')
+        response = self.client.get(url, {'rate_band': '16_and_above'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(url, {'rate_band': '8_to_12'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+        loan = Loan.objects.first()
+        response = self.client.get(url, {'q': str(loan.loan_id)})
+        self.assertIn(loan, response.context['cl'].result_list)
+        response = self.client.get(url, {'q': 'Admin'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_paginator_uses_estimate_for_unfiltered_tables(self):
+        """Test large unfiltered counts come from the planner estimate"""
+        from .admin import EstimatedCountPaginator
+
+        self.add_loans(3)
+        with mock.patch('loans.admin.estimated_row_count', return_value=5_000_000):
+            self.assertEqual(EstimatedCountPaginator(Loan.objects.all(), 100).count, 5_000_000)
+            self.assertEqual(EstimatedCountPaginator(Loan.objects.filter(interest_rate__gte=5), 100).count, 3)
+        with mock.patch('loans.admin.estimated_row_count', return_value=None):
+            self.assertEqual(EstimatedCountPaginator(Loan.objects.all(), 100).count, 3)
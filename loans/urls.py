@@ -4,8 +4,20 @@ from . import views
 urlpatterns = [
     path('', views.api_home, name='api_home'),
     path('register/', views.register_customer, name='register_customer'),
+    path('register/bulk/', views.register_customers_bulk, name='register_customers_bulk'),
+    path('customers/', views.customer_lookup, name='customer_lookup'),
     path('check-eligibility/', views.check_eligibility, name='check_eligibility'),
+    path('quote/', views.loan_quote, name='loan_quote'),
+    path('customers/<int:customer_id>/max-loan/', views.max_loan, name='max_loan'),
     path('create-loan/', views.create_loan, name='create_loan'),
+    path('loan-requests/<uuid:ticket_id>/', views.loan_request_status, name='loan_request_status'),
+    path('view-loan/', views.view_loan_many, name='view_loan_many'),
     path('view-loan/<int:loan_id>/', views.view_loan, name='view_loan'),
+    path('view-loans/', views.view_loans_many, name='view_loans_many'),
     path('view-loans/<int:customer_id>/', views.view_loans, name='view_loans'),
+    path('portfolio/summary/', views.portfolio_summary, name='portfolio_summary'),
+    path('ingest/', views.ingest_upload, name='ingest_upload'),
+    path('ingest/<uuid:job_id>/', views.ingestion_job, name='ingestion_job'),
+    path('export/customers/', views.export_table, {'kind': 'customers'}, name='export_customers'),
+    path('export/loans/', views.export_table, {'kind': 'loans'}, name='export_loans'),
 ]
\ No newline at end of file
@@ -1,20 +1,49 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
 from django.db.models import Sum, Q
-from django.http import JsonResponse
-from datetime import datetime, date
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from django.utils import timezone
+from datetime import date
 from decimal import Decimal
+import heapq
 import math
+import os
 
-from .models import Customer, Loan
+from .bulk import filter_in_chunks
+from .coalescing import coalesce
+from .export import EXPORT_CONTENT_TYPES, EXPORTS, csv_lines, export_rows, ndjson_lines, xlsx_file
+from .finance import add_months, outstanding_principal_expression, total_interest_remaining_expression
+from .models import ArchivedLoan, Customer, IngestionJob, Loan, LoanRequest, OutboxEvent
+from .outbox import publish
+from .portfolio import portfolio_summary as build_portfolio_summary
+from .scoring import (
+    calculate_credit_score, calculate_monthly_installment, customer_with_loan_stats,
+    get_required_interest_rate, loan_decision, max_loan_amount, quote_grid
+)
 from .serializers import (
-    CustomerRegistrationSerializer, CustomerRegistrationResponseSerializer,
+    CustomerRegistrationSerializer, CustomerRegistrationResponseSerializer, CustomerPhoneLookupSerializer,
     LoanEligibilitySerializer, LoanEligibilityResponseSerializer,
+    LoanQuoteSerializer, LoanQuoteResponseSerializer,
+    MaxLoanQuerySerializer, MaxLoanResponseSerializer,
     LoanCreateSerializer, LoanCreateResponseSerializer,
-    LoanDetailSerializer, CustomerLoanSerializer
+    LoanDetailSerializer, CustomerLoanSerializer, PortfolioSummarySerializer,
+    CustomerLoansLookupSerializer, LoanLookupSerializer, ExportQuerySerializer,
+    IngestionUploadSerializer, IngestionJobSerializer, LoanRequestSerializer
+)
+from .sharding import (
+    allocate_ids, customers_by_phone, fan_out, find_on_shards, group_by_shard, lock_phone_numbers, shard_databases,
+    shard_for_customer,
 )
+from .tasks import process_ingestion_job, process_loan_requests
 
 
 def api_home(request):
@@ -36,113 +65,77 @@ def api_home(request):
         "database": db_status,
         "endpoints": {
             "register": "POST /api/register/ - Register a new customer",
+            "register_bulk": "POST /api/register/bulk/ - Register a batch of customers",
+            "customer_lookup": "GET /api/customers/?phone= - Find customers by phone number",
             "check_eligibility": "POST /api/check-eligibility/ - Check loan eligibility",
-            "create_loan": "POST /api/create-loan/ - Create a new loan",
+            "quote": "POST /api/quote/ - Eligibility grid over tenures and interest rates",
+            "max_loan": "GET /api/customers/<customer_id>/max-loan/?tenure=&interest_rate= - Largest approvable amount",
+            "create_loan": "POST /api/create-loan/ - Create a new loan (?mode=async to queue it)",
+            "loan_request": "GET /api/loan-requests/<ticket_id>/ - Status of a queued loan request",
             "view_loan": "GET /api/view-loan/<loan_id>/ - View loan details",
-            "view_loans": "GET /api/view-loans/<customer_id>/ - View customer loans"
+            "view_loan_many": "GET /api/view-loan/?loan_ids=1,2,3 - View several loans",
+            "view_loans": "GET /api/view-loans/<customer_id>/ - View customer loans",
+            "view_loans_many": "GET /api/view-loans/?customer_ids=1,2,3 - View loans of several customers",
+            "portfolio_summary": "GET /api/portfolio/summary/ - Portfolio exposure summary",
+            "ingest": "POST /api/ingest/ - Upload a customer or loan file for background ingestion",
+            "ingest_job": "GET|DELETE /api/ingest/<job_id>/ - Ingestion progress or cancellation",
+            "export": "GET /api/export/<customers|loans>/?format=csv|ndjson|xlsx&since= - Stream a full export, or only rows created after since"
         },
         "documentation": "See README.md for detailed API documentation"
     })
 
 
-def calculate_credit_score(customer):
-    """Calculate credit score based on historical loan data"""
-    loans = Loan.objects.filter(customer=customer)
-    
-    if not loans.exists():
-        return 50  # Default score for new customers
-    
-    # Check if current loans exceed approved limit
-    current_loans_sum = loans.aggregate(
-        total=Sum('loan_amount')
-    )['total'] or 0
-    
-    if current_loans_sum > customer.approved_limit:
-        return 0
-    
-    # Calculate score components
-    total_loans = loans.count()
-    loans_paid_on_time = sum(1 for loan in loans if loan.emis_paid_on_time >= loan.tenure * 0.9)
-    
-    # Current year activity
-    current_year = datetime.now().year
-    current_year_loans = loans.filter(start_date__year=current_year).count()
-    
-    # Calculate score (simplified algorithm)
-    score = 0
-    
-    # Past loans paid on time (40% weight)
-    if total_loans > 0:
-        on_time_ratio = loans_paid_on_time / total_loans
-        score += on_time_ratio * 40
-    
-    # Number of loans (20% weight) - fewer loans is better
-    if total_loans <= 3:
-        score += 20
-    elif total_loans <= 6:
-        score += 15
-    else:
-        score += 10
-    
-    # Current year activity (20% weight) - moderate activity is good
-    if current_year_loans <= 2:
-        score += 20
-    elif current_year_loans <= 4:
-        score += 15
-    else:
-        score += 10
-    
-    # Loan approved volume (20% weight)
-    if current_loans_sum <= customer.approved_limit * Decimal('0.5'):
-        score += 20
-    elif current_loans_sum <= customer.approved_limit * Decimal('0.8'):
-        score += 15
-    else:
-        score += 10
-    
-    return min(100, max(0, score))
+@api_view(['POST'])
+def register_customer(request):
+    """Register a new customer, or return the existing one registered with the same phone number"""
+    serializer = CustomerRegistrationSerializer(data=request.data)
+    if serializer.is_valid():
+        with transaction.atomic():
+            lock_phone_numbers([serializer.validated_data['phone_number']])
+            existing = customers_by_phone([serializer.validated_data['phone_number']])
+            if existing:
+                response_serializer = CustomerRegistrationResponseSerializer(existing[0])
+                return Response(response_serializer.data, status=status.HTTP_200_OK)
+            customer = serializer.save()
+        response_serializer = CustomerRegistrationResponseSerializer(customer)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-def get_required_interest_rate(credit_score):
-    """Get minimum required interest rate based on credit score"""
-    if credit_score > 50:
-        return 0  # Any rate is acceptable
-    elif credit_score > 30:
-        return 12
-    elif credit_score > 10:
-        return 16
-    else:
-        return None  # No loan approval
+@api_view(['GET'])
+def customer_lookup(request):
+    """Find customers by phone number using the phone_number index"""
+    serializer = CustomerPhoneLookupSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    customers = customers_by_phone([serializer.validated_data['phone']])
+    response_serializer = CustomerRegistrationResponseSerializer(customers, many=True)
+    return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
-def calculate_monthly_installment(loan_amount, interest_rate, tenure):
-    """Calculate monthly installment using compound interest"""
-    principal = float(loan_amount)
-    rate = float(interest_rate) / 100 / 12  # monthly rate
-    n = tenure
-    
-    if rate == 0:
-        return Decimal(str(principal / n))
-    
-    # EMI = P * r * (1 + r)^n / ((1 + r)^n - 1)
-    emi = principal * rate * (1 + rate) ** n / ((1 + rate) ** n - 1)
-    return Decimal(str(round(emi, 2)))
+BULK_REGISTRATION_LIMIT = 1000
 
 
 @api_view(['POST'])
-def register_customer(request):
-    """Register a new customer"""
-    serializer = CustomerRegistrationSerializer(data=request.data)
+def register_customers_bulk(request):
+    """Register a batch of customers with a single bulk insert; known phone numbers are not re-registered"""
+    serializer = CustomerRegistrationSerializer(
+        data=request.data, many=True, allow_empty=False, max_length=BULK_REGISTRATION_LIMIT
+    )
     if serializer.is_valid():
-        customer = serializer.save()
-        response_serializer = CustomerRegistrationResponseSerializer(customer)
+        customers = serializer.save()
+        response_serializer = CustomerRegistrationResponseSerializer(customers, many=True)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
 def check_eligibility(request):
-    """Check loan eligibility for a customer"""
+    """Check loan eligibility for a customer
+
+    Identical checks arriving together share one computation (see
+    loans.coalescing).
+    """
     serializer = LoanEligibilitySerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -153,16 +146,29 @@ def check_eligibility(request):
     interest_rate = data['interest_rate']
     tenure = data['tenure']
     
+    response_data = coalesce(
+        f'eligibility:{customer_id}:{loan_amount}:{interest_rate}:{tenure}',
+        lambda: eligibility_decision(customer_id, loan_amount, interest_rate, tenure)
+    )
+    if response_data is None:
+        return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    response_serializer = LoanEligibilityResponseSerializer(response_data)
+    return Response(response_serializer.data, status=status.HTTP_200_OK)
+
+
+def eligibility_decision(customer_id, loan_amount, interest_rate, tenure):
+    """Eligibility response data for check_eligibility, or None for an unknown customer"""
     try:
-        customer = Customer.objects.get(customer_id=customer_id)
+        customer = Customer.objects.using(shard_for_customer(customer_id)).get(customer_id=customer_id)
     except Customer.DoesNotExist:
-        return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+        return None
     
     # Calculate credit score
     credit_score = calculate_credit_score(customer)
     
     # Check EMI constraint (sum of all current EMIs should not exceed 50% of monthly salary)
-    current_emis = Loan.objects.filter(
+    current_emis = Loan.objects.using(customer._state.db).filter(
         customer=customer,
         end_date__gte=date.today()
     ).aggregate(total_emi=Sum('monthly_repayment'))['total_emi'] or Decimal('0')
@@ -200,7 +206,72 @@ def check_eligibility(request):
         'monthly_installment': monthly_installment
     }
     
-    response_serializer = LoanEligibilityResponseSerializer(response_data)
+    return response_data
+
+
+DEFAULT_QUOTE_TENURES = [6, 12, 18, 24, 36, 48, 60]
+DEFAULT_QUOTE_INTEREST_RATES = [Decimal(rate) for rate in ('8', '10', '12', '14', '16', '18')]
+
+
+@api_view(['POST'])
+def loan_quote(request):
+    """Check eligibility for a loan amount across a grid of tenures and interest rates"""
+    serializer = LoanQuoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    customer_id = data['customer_id']
+    loan_amount = data['loan_amount']
+    
+    try:
+        customer = customer_with_loan_stats(customer_id, using=shard_for_customer(customer_id))
+    except Customer.DoesNotExist:
+        return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    quotes = quote_grid(
+        customer, loan_amount,
+        data.get('tenures', DEFAULT_QUOTE_TENURES),
+        data.get('interest_rates', DEFAULT_QUOTE_INTEREST_RATES)
+    )
+    
+    response_serializer = LoanQuoteResponseSerializer({
+        'customer_id': customer_id,
+        'loan_amount': loan_amount,
+        'quotes': quotes
+    })
+    return Response(response_serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def max_loan(request, customer_id):
+    """Largest loan amount that passes the eligibility rules for a tenure and rate"""
+    serializer = MaxLoanQuerySerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    tenure = serializer.validated_data['tenure']
+    interest_rate = serializer.validated_data['interest_rate']
+    
+    try:
+        customer = customer_with_loan_stats(customer_id, using=shard_for_customer(customer_id))
+    except Customer.DoesNotExist:
+        return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    amount, corrected_interest_rate, limiting_factor = max_loan_amount(customer, interest_rate, tenure)
+    monthly_installment = (
+        calculate_monthly_installment(amount, corrected_interest_rate, tenure) if amount else Decimal('0')
+    )
+    
+    response_serializer = MaxLoanResponseSerializer({
+        'customer_id': customer_id,
+        'tenure': tenure,
+        'interest_rate': interest_rate,
+        'corrected_interest_rate': corrected_interest_rate,
+        'max_loan_amount': amount,
+        'monthly_installment': monthly_installment,
+        'limiting_factor': limiting_factor
+    })
     return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
@@ -217,60 +288,38 @@ def create_loan(request):
     interest_rate = data['interest_rate']
     tenure = data['tenure']
     
+    if request.query_params.get('mode') == 'async':
+        return enqueue_loan_request(customer_id, loan_amount, interest_rate, tenure)
+    
     try:
-        customer = Customer.objects.get(customer_id=customer_id)
+        customer = customer_with_loan_stats(customer_id, using=shard_for_customer(customer_id))
     except Customer.DoesNotExist:
         return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
     
     # Check eligibility first
-    credit_score = calculate_credit_score(customer)
-    current_emis = Loan.objects.filter(
-        customer=customer,
-        end_date__gte=date.today()
-    ).aggregate(total_emi=Sum('monthly_repayment'))['total_emi'] or Decimal('0')
-    
-    monthly_installment = calculate_monthly_installment(loan_amount, interest_rate, tenure)
-    total_emi = current_emis + monthly_installment
-    max_allowed_emi = customer.monthly_salary * Decimal('0.5')
-    
-    required_rate = get_required_interest_rate(credit_score)
-    
-    # Check approval conditions
-    loan_approved = False
-    message = ""
+    loan_approved, message, final_interest_rate, monthly_installment = loan_decision(
+        calculate_credit_score(customer), customer.current_emis, customer.monthly_salary,
+        loan_amount, interest_rate, tenure
+    )
     loan_id = None
     
-    if credit_score <= 10:
-        message = "Loan not approved due to low credit score"
-    elif total_emi > max_allowed_emi:
-        message = "Loan not approved due to high EMI burden"
-    elif required_rate is None:
-        message = "Loan not approved due to credit score"
-    elif required_rate > 0 and interest_rate < required_rate:
-        message = f"Loan not approved. Minimum interest rate required: {required_rate}%"
-    else:
+    if loan_approved:
         # Create the loan
-        loan_approved = True
-        message = "Loan approved successfully"
-        
-        # Use corrected interest rate if needed
-        final_interest_rate = max(interest_rate, required_rate) if required_rate > 0 else interest_rate
-        monthly_installment = calculate_monthly_installment(loan_amount, final_interest_rate, tenure)
-        
         start_date = date.today()
-        end_date = date(start_date.year + (start_date.month + tenure - 1) // 12,
-                       (start_date.month + tenure - 1) % 12 + 1,
-                       start_date.day)
-        
-        loan = Loan.objects.create(
-            customer=customer,
-            loan_amount=loan_amount,
-            tenure=tenure,
-            interest_rate=final_interest_rate,
-            monthly_repayment=monthly_installment,
-            start_date=start_date,
-            end_date=end_date
-        )
+        loan_id, = allocate_ids(Loan)
+        with transaction.atomic(using=customer._state.db):
+            loan = Loan.objects.using(customer._state.db).create(
+                loan_id=loan_id,
+                customer=customer,
+                loan_amount=loan_amount,
+                tenure=tenure,
+                interest_rate=final_interest_rate,
+                monthly_repayment=monthly_installment,
+                start_date=start_date,
+                end_date=add_months(start_date, tenure)
+            )
+            # Rollups and any other side effects are applied by the outbox drainer
+            publish(OutboxEvent.LOAN_CREATED, loan.loan_id, {'customer_id': customer.customer_id}, using=loan._state.db)
         loan_id = loan.loan_id
     
     response_data = {
@@ -285,18 +334,198 @@ def create_loan(request):
     return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
+def enqueue_loan_request(customer_id, loan_amount, interest_rate, tenure):
+    """Queue a validated create_loan request for the batch worker and answer 202"""
+    shard = shard_for_customer(customer_id)
+    if not Customer.objects.using(shard).filter(customer_id=customer_id).exists():
+        return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    with transaction.atomic(using=shard):
+        loan_request = LoanRequest.objects.using(shard).create(
+            customer_id=customer_id, loan_amount=loan_amount, interest_rate=interest_rate, tenure=tenure
+        )
+        transaction.on_commit(process_loan_requests.delay, using=shard)
+    
+    return Response(LoanRequestSerializer(loan_request).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def loan_request_status(request, ticket_id):
+    """Status and outcome of a create_loan request queued in async mode"""
+    loan_request = find_on_shards(LoanRequest, ticket_id=ticket_id)
+    if loan_request is None:
+        raise Http404('No LoanRequest matches the given query.')
+    return Response(LoanRequestSerializer(loan_request).data, status=status.HTTP_200_OK)
+
+
 @api_view(['GET'])
 def view_loan(request, loan_id):
-    """View details of a specific loan"""
-    loan = get_object_or_404(Loan, loan_id=loan_id)
+    """View details of a specific loan, including archived ones"""
+    loan = find_on_shards(Loan, loan_id=loan_id) or find_on_shards(ArchivedLoan, loan_id=loan_id)
+    if loan is None:
+        raise Http404('No Loan matches the given query.')
     serializer = LoanDetailSerializer(loan)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+def view_loan_many(request):
+    """View several loans by id, including archived ones, fetched with chunked IN queries"""
+    serializer = LoanLookupSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    loan_ids = serializer.validated_data['loan_ids']
+    loans = {}
+    # A loan id does not name its shard, so look on each one for the ids still
+    # missing, then in the archive for those still not found
+    for model in (Loan, ArchivedLoan):
+        for alias in shard_databases():
+            missing = [loan_id for loan_id in loan_ids if loan_id not in loans]
+            if not missing:
+                break
+            for loan in filter_in_chunks(model.objects.using(alias).select_related('customer'), 'loan_id', missing):
+                loans[loan.loan_id] = loan
+    return Response({
+        'loans': {
+            str(loan_id): LoanDetailSerializer(loans[loan_id]).data for loan_id in loan_ids if loan_id in loans
+        },
+        'not_found': [loan_id for loan_id in loan_ids if loan_id not in loans]
+    }, status=status.HTTP_200_OK)
+
+
+def current_loans(queryset, request):
+    """Narrow a loan queryset to current loans, with database balances for ?compute=db"""
+    loans = queryset.filter(end_date__gte=date.today())
+    if request.query_params.get('compute') == 'db':
+        # Let the database compute balances for large lists
+        loans = loans.annotate(
+            db_outstanding_principal=outstanding_principal_expression(),
+            db_total_interest_remaining=total_interest_remaining_expression()
+        )
+    return loans
+
+
 @api_view(['GET'])
 def view_loans(request, customer_id):
     """View all current loans for a customer"""
-    customer = get_object_or_404(Customer, customer_id=customer_id)
-    loans = Loan.objects.filter(customer=customer, end_date__gte=date.today())
+    customer = get_object_or_404(Customer.objects.using(shard_for_customer(customer_id)), customer_id=customer_id)
+    loans = current_loans(Loan.objects.using(customer._state.db).filter(customer=customer), request)
     serializer = CustomerLoanSerializer(loans, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def view_loans_many(request):
+    """View current loans for several customers, grouped by customer id
+
+    Customers without current loans, including unknown ids, map to an empty
+    list.
+    """
+    serializer = CustomerLoansLookupSerializer(data=request.query_params)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    customer_ids = serializer.validated_data['customer_ids']
+    grouped = {customer_id: [] for customer_id in customer_ids}
+    for alias, shard_customer_ids in group_by_shard(customer_ids).items():
+        loans = current_loans(Loan.objects.using(alias).order_by('loan_id'), request)
+        for loan in filter_in_chunks(loans, 'customer_id', shard_customer_ids):
+            grouped[loan.customer_id].append(loan)
+    return Response({
+        'loans': {
+            str(customer_id): CustomerLoanSerializer(customer_loans, many=True).data
+            for customer_id, customer_loans in grouped.items()
+        }
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def portfolio_summary(request):
+    """Portfolio exposure for the current month, served from the rollup tables"""
+    serializer = PortfolioSummarySerializer(build_portfolio_summary())
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+# A plain Django view: DRF reserves ?format= for choosing its own renderers
+@require_GET
+def export_table(request, kind):
+    """Stream every customer or loan as CSV, NDJSON or xlsx
+
+    ``since`` only returns rows created with a primary key above it. Rows
+    updated in place, and rows ingested later with a lower explicit id, are
+    only in a full export.
+    """
+    serializer = ExportQuerySerializer(data=request.GET)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    export_format = serializer.validated_data['format']
+    fields = EXPORTS[kind][1]
+    # Interleave the shards' streams so the whole export stays in primary key order
+    shard_rows = fan_out(export_rows, kind, since=serializer.validated_data.get('since'))
+    rows = heapq.merge(*shard_rows, key=lambda row: row[0])
+    filename = f'{kind}.{export_format}'
+    
+    if export_format == 'xlsx':
+        return FileResponse(
+            xlsx_file(kind, fields, rows), as_attachment=True, filename=filename,
+            content_type=EXPORT_CONTENT_TYPES['xlsx']
+        )
+    
+    lines = csv_lines(fields, rows) if export_format == 'csv' else ndjson_lines(fields, rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@csrf_exempt
+def ingest_upload(request):
+    """Stream an uploaded customer or loan file to disk and queue it for ingestion"""
+    # Spool the upload to a temporary file instead of holding it in memory.
+    # Handlers must be set before anything reads request.POST, including the
+    # CSRF middleware, so this wrapper is exempt and the API view below runs
+    # DRF's own CSRF check for session-authenticated clients.
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+    return queue_upload(request)
+
+
+@api_view(['POST'])
+@parser_classes([MultiPartParser])
+def queue_upload(request):
+    """Queue an upload spooled to disk by ingest_upload"""
+    serializer = IngestionUploadSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    upload = serializer.validated_data['file']
+    job = IngestionJob(kind=serializer.validated_data['kind'])
+    extension = os.path.splitext(upload.name)[1].lower()
+    os.makedirs(settings.INGESTION_UPLOAD_DIR, exist_ok=True)
+    job.file_path = os.path.join(settings.INGESTION_UPLOAD_DIR, f'{job.job_id}{extension}')
+    file_move_safe(upload.temporary_file_path(), job.file_path)
+    
+    with transaction.atomic():
+        job.save()
+        transaction.on_commit(lambda: process_ingestion_job.delay(str(job.job_id)))
+    
+    return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET', 'DELETE'])
+def ingestion_job(request, job_id):
+    """Ingestion job progress; DELETE requests cancellation"""
+    job = get_object_or_404(IngestionJob, job_id=job_id)
+    
+    if request.method == 'DELETE':
+        if job.status in IngestionJob.FINISHED_STATUSES:
+            return Response({'error': f'Job already {job.status}'}, status=status.HTTP_409_CONFLICT)
+        # A pending job is cancelled outright; a running one stops after its current chunk
+        IngestionJob.objects.filter(job_id=job_id).update(cancel_requested=True)
+        if IngestionJob.objects.filter(job_id=job_id, status=IngestionJob.PENDING).update(
+            status=IngestionJob.CANCELLED, finished_at=timezone.now()
+        ) and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        job.refresh_from_db()
+    
+    return Response(IngestionJobSerializer(job).data, status=status.HTTP_200_OK)
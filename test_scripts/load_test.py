@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+Load test the Credit Approval API against a local server.
+
+Runs a pool of concurrent virtual users for a fixed duration, discards the
+warmup window and reports throughput and p50/p95/p99 latency per endpoint.
+
+Examples:
+    python test_scripts/load_test.py --users 20 --duration 60 --mix eligibility
+    python test_scripts/load_test.py --traffic traffic.jsonl --users 10
+
+A traffic file is JSON lines of the form
+    {"method": "POST", "path": "/check-eligibility/", "body": {...}}
+and is replayed round-robin across the virtual users. Lines without a
+method and path are skipped.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+BASE_URL = "http://localhost:8000/api"
+
+# Relative weights of each operation per mix
+MIXES = {
+    'eligibility': {'check_eligibility': 80, 'create_loan': 5, 'view_loans': 10, 'view_loan': 5},
+    'create': {'check_eligibility': 20, 'create_loan': 60, 'view_loans': 10, 'view_loan': 10},
+    'read': {'check_eligibility': 10, 'create_loan': 5, 'view_loans': 45, 'view_loan': 40},
+    'balanced': {'check_eligibility': 25, 'create_loan': 25, 'view_loans': 25, 'view_loan': 25},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the Credit Approval API')
+    parser.add_argument('--base-url', default=BASE_URL, help='API root (default: %(default)s)')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds after warmup')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of traffic discarded before measuring')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='balanced', help='Endpoint mix')
+    parser.add_argument('--traffic', help='JSON lines file to replay instead of a generated mix')
+    parser.add_argument('--customers', default='1-300', help='Customer id range used by generated traffic')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for generated traffic')
+    parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+    return parser.parse_args()
+
+
+def load_traffic(path):
+    """Read replayable requests from a JSON lines file"""
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if 'method' in entry and 'path' in entry:
+                entries.append(entry)
+    return entries
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Recorder:
+    """Thread-safe latency recorder keyed by endpoint name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, name, elapsed, ok):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+
+
+class GeneratedTraffic:
+    """Builds requests for the chosen endpoint mix"""
+
+    def __init__(self, mix, customers, rng):
+        self.names = list(MIXES[mix])
+        self.weights = [MIXES[mix][name] for name in self.names]
+        low, _, high = customers.partition('-')
+        self.customer_ids = range(int(low), int(high or low) + 1)
+        self.rng = rng
+        self.loan_ids = []
+        self.lock = threading.Lock()
+
+    def next_request(self):
+        name = self.rng.choices(self.names, self.weights)[0]
+        customer_id = self.rng.choice(self.customer_ids)
+        body = {
+            'customer_id': customer_id,
+            'loan_amount': self.rng.choice([50000, 100000, 250000, 500000]),
+            'interest_rate': self.rng.choice([8, 10.5, 12, 14, 16]),
+            'tenure': self.rng.choice([6, 12, 24, 36]),
+        }
+        if name == 'check_eligibility':
+            return name, 'POST', '/check-eligibility/', body
+        if name == 'create_loan':
+            return name, 'POST', '/create-loan/', body
+        if name == 'view_loan':
+            with self.lock:
+                if self.loan_ids:
+                    return name, 'GET', f'/view-loan/{self.rng.choice(self.loan_ids)}/', None
+        return 'view_loans', 'GET', f'/view-loans/{customer_id}/', None
+
+    def observe(self, name, response):
+        """Remember loan ids so view_loan hits existing rows"""
+        if name == 'create_loan' and response.status_code == 200:
+            loan_id = response.json().get('loan_id')
+        elif name == 'view_loans' and response.status_code == 200 and response.json():
+            loan_id = response.json()[0].get('loan_id')
+        else:
+            return
+        if loan_id:
+            with self.lock:
+                if len(self.loan_ids) < 10000:
+                    self.loan_ids.append(loan_id)
+
+
+class ReplayedTraffic:
+    """Replays a traffic file round-robin"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def next_request(self):
+        with self.lock:
+            entry = self.entries[self.position % len(self.entries)]
+            self.position += 1
+        name = entry.get('name') or f"{entry['method'].upper()} {entry['path']}"
+        return name, entry['method'].upper(), entry['path'], entry.get('body')
+
+    def observe(self, name, response):
+        pass
+
+
+def virtual_user(args, traffic, recorder, measure_from, stop_at):
+    """Issue requests back to back until the test ends"""
+    session = requests.Session()
+    base_url = args.base_url.rstrip('/')
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        name, method, path, body = traffic.next_request()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=args.timeout)
+            ok = response.status_code < 500
+        except requests.RequestException:
+            response = None
+            ok = False
+        elapsed = time.perf_counter() - started
+        if started >= measure_from:
+            recorder.record(name, elapsed, ok)
+        if response is not None and ok:
+            traffic.observe(name, response)
+
+
+def print_report(recorder, duration):
+    """Print throughput and latency percentiles per endpoint"""
+    header = f"{'endpoint':<28}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print('-' * len(header))
+    everything = []
+    for name in sorted(recorder.latencies):
+        values = sorted(recorder.latencies[name])
+        everything.extend(values)
+        print(f"{name:<28}{len(values):>10}{recorder.errors[name]:>8}{len(values) / duration:>10.1f}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}")
+    everything.sort()
+    total_errors = sum(recorder.errors.values())
+    print('-' * len(header))
+    print(f"{'total':<28}{len(everything):>10}{total_errors:>8}{len(everything) / duration:>10.1f}"
+          f"{percentile(everything, 50) * 1000:>10.1f}{percentile(everything, 95) * 1000:>10.1f}"
+          f"{percentile(everything, 99) * 1000:>10.1f}")
+
+
+def main():
+    args = parse_args()
+
+    if args.traffic:
+        entries = load_traffic(args.traffic)
+        if not entries:
+            print(f"❌ No replayable requests in {args.traffic}")
+            return 1
+        traffic = ReplayedTraffic(entries)
+    else:
+        traffic = GeneratedTraffic(args.mix, args.customers, random.Random(args.seed))
+
+    try:
+        requests.get(f"{args.base_url.rstrip('/')}/", timeout=args.timeout)
+    except requests.RequestException as e:
+        print(f"❌ API not reachable at {args.base_url}: {e}")
+        return 1
+
+    source = args.traffic or f"{args.mix} mix"
+    print(f"🚀 {args.users} users, {args.warmup:g}s warmup + {args.duration:g}s measured, {source}")
+
+    recorder = Recorder()
+    measure_from = time.perf_counter() + args.warmup
+    stop_at = measure_from + args.duration
+    threads = [
+        threading.Thread(target=virtual_user, args=(args, traffic, recorder, measure_from, stop_at), daemon=True)
+        for _ in range(args.users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print_report(recorder, args.duration)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Compare per-request overhead and memory of the "full" and "api" profiles.
+
+Each profile runs in its own process, so app loading and memory use are
+isolated. Requests are sent straight to Django's WSGI handler without a
+server or network, so the difference between profiles is the middleware and
+app stack.
+
+Examples:
+    python test_scripts/profile_benchmark.py
+    python test_scripts/profile_benchmark.py --requests 5000 --path /api/view-loans/1/
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = ['full', 'api']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the full and api Django profiles')
+    parser.add_argument('--requests', type=int, default=2000, help='Measured requests per profile')
+    parser.add_argument('--warmup', type=int, default=200, help='Unmeasured requests sent first')
+    parser.add_argument('--path', default='/api/', help='GET path to request')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def run_child(args):
+    """Time requests through the WSGI handler in the current profile and print JSON"""
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Alemeno_RESt_API.settings')
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': args.path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '8000',
+        'HTTP_HOST': 'localhost',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    statuses = []
+
+    def start_response(status, headers):
+        statuses.append(status)
+
+    def request():
+        body = application(dict(environ), start_response)
+        b''.join(body)
+        body.close()
+
+    for _ in range(args.warmup):
+        request()
+    started = time.perf_counter()
+    for _ in range(args.requests):
+        request()
+    elapsed = time.perf_counter() - started
+
+    from django.conf import settings
+    print(json.dumps({
+        'status': statuses[-1],
+        'middleware': len(settings.MIDDLEWARE),
+        'apps': len(settings.INSTALLED_APPS),
+        'us_per_request': elapsed / args.requests * 1e6,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    results = {}
+    for profile in PROFILES:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--requests', str(args.requests),
+             '--warmup', str(args.warmup), '--path', args.path],
+            env={**os.environ, 'DJANGO_PROFILE': profile}, capture_output=True, text=True, check=True,
+        ).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"GET {args.path}, {args.requests} requests per profile")
+    print(f"{'profile':<8} {'status':<16} {'middleware':>10} {'apps':>5} {'us/request':>11} {'max RSS MB':>11}")
+    for profile, r in results.items():
+        print(f"{profile:<8} {r['status']:<16} {r['middleware']:>10} {r['apps']:>5} "
+              f"{r['us_per_request']:>11.1f} {r['max_rss_mb']:>11.1f}")
+    saved = results['full']['us_per_request'] - results['api']['us_per_request']
+    print(f"api profile saves {saved:.1f} us per request "
+          f"({saved / results['full']['us_per_request']:.0%})")
+
+
+if __name__ == '__main__':
+    main()